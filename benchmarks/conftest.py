@@ -0,0 +1,49 @@
+# Benchmarks of the graph algorithms on synthetic graphs. They need pytest-benchmark (pip install pytest-benchmark) and
+# are skipped without it.
+#
+# Save a baseline on the machine on which the benchmarks will be compared:
+#     python -m pytest benchmarks --benchmark-save=baseline
+# Later runs on that machine are compared with the latest baseline and fail if a benchmark's mean time regresses by more
+# than 25% (pass --benchmark-compare-fail to change the threshold). The baselines are stored in benchmarks/.benchmarks.
+#
+# The Python engines' full relaxation of 5000 currencies takes minutes. Pass --run-slow to include it.
+import glob
+import os
+import pytest
+
+STORAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.benchmarks')
+BASELINE = 'baseline'
+COMPARE_FAIL = 'mean:25%'
+
+
+def pytest_addoption(parser):
+    parser.addoption('--run-slow', action='store_true', help='Also run the benchmarks which take minutes.')
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: a benchmark which is only run with --run-slow')
+    # pytest-benchmark reads these options after this hook, in its own pytest_configure
+    if not config.pluginmanager.hasplugin('benchmark'):
+        return
+    from pytest_benchmark.utils import get_machine_id, parse_compare_fail
+
+    option = config.option
+    # unless another storage is given
+    if option.benchmark_storage == 'file://./.benchmarks':
+        option.benchmark_storage = 'file://' + STORAGE
+    saving = option.benchmark_save or option.benchmark_autosave
+    baselines = glob.glob(os.path.join(STORAGE, get_machine_id(), '*_{}.json'.format(BASELINE)))
+    if baselines and not saving and not option.benchmark_compare:
+        option.benchmark_compare = os.path.basename(sorted(baselines)[-1])[:-len('.json')]
+        if not option.benchmark_compare_fail:
+            option.benchmark_compare_fail = [parse_compare_fail(COMPARE_FAIL)]
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--run-slow'):
+        return
+    skip_slow = pytest.mark.skip(reason='Pass --run-slow to run it.')
+    for item in items:
+        if 'slow' in item.keywords:
+            item.add_marker(skip_slow)
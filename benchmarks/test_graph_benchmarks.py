@@ -0,0 +1,106 @@
+import asyncio
+import functools
+import pytest
+from peregrinearb import bellman_ford, bellman_ford_multi, calculate_profit_ratio_for_path, load_exchange_graph, \
+    NegativeWeightDepthFinder, SimulatedExchange, synthetic_graph, synthetic_multi_graph, synthetic_tickers
+from peregrinearb.utils import CompiledGraph
+
+pytest.importorskip('pytest_benchmark')
+
+SIZES = [50, 500, 5000]
+# the Python engines' full relaxation of the largest graphs takes minutes
+SLOW_SIZES = [50, 500, pytest.param(5000, marks=pytest.mark.slow)]
+NEGATIVE_CYCLES = [0, 5]
+DENSITY = 0.5
+EXCHANGE_COUNT = 3
+
+
+@functools.lru_cache(maxsize=None)
+def _graph(currency_count, negative_cycles, depth=False):
+    return synthetic_graph(currency_count, DENSITY, negative_cycles, depth=depth, seed=currency_count)
+
+
+@functools.lru_cache(maxsize=None)
+def _multi_graph(currency_count, negative_cycles):
+    return synthetic_multi_graph(currency_count, EXCHANGE_COUNT, DENSITY, negative_cycles, seed=currency_count)
+
+
+def _run(benchmark, function, *args, **kwargs):
+    # the graphs of 5000 currencies take seconds per round
+    return benchmark.pedantic(function, args, kwargs, rounds=3, warmup_rounds=0)
+
+
+@pytest.mark.parametrize('density', [0.1, 1.0])
+@pytest.mark.parametrize('currency_count', SIZES)
+def test_load_exchange_graph(benchmark, currency_count, density):
+    tickers, _ = synthetic_tickers(currency_count, density, seed=currency_count)
+    exchange = SimulatedExchange(universe={market_name: ticker['bid'] for market_name, ticker in tickers.items()})
+
+    def load():
+        return asyncio.get_event_loop().run_until_complete(
+            load_exchange_graph(exchange, name=False, fees=False, tickers=tickers))
+
+    graph = benchmark(load)
+    assert graph.number_of_edges() == 2 * len(tickers)
+
+
+@pytest.mark.parametrize('currency_count', SIZES)
+def test_compile_graph(benchmark, currency_count):
+    graph = _graph(currency_count, 0)
+    compiled = benchmark(CompiledGraph, graph)
+    assert compiled.number_of_edges() == graph.number_of_edges()
+
+
+@pytest.mark.parametrize('negative_cycles', NEGATIVE_CYCLES)
+@pytest.mark.parametrize('currency_count', SIZES)
+def test_bellman_ford(benchmark, currency_count, negative_cycles):
+    graph = _graph(currency_count, negative_cycles)
+    paths = _run(benchmark, lambda: list(bellman_ford(graph, 'CUR0', relaxation='spfa')))
+    assert bool(paths) == bool(negative_cycles)
+
+
+@pytest.mark.parametrize('negative_cycles', NEGATIVE_CYCLES)
+@pytest.mark.parametrize('currency_count', SLOW_SIZES)
+@pytest.mark.parametrize('relaxation', ['full', 'early_exit'])
+def test_bellman_ford_full(benchmark, relaxation, currency_count, negative_cycles):
+    graph = _graph(currency_count, negative_cycles)
+    paths = _run(benchmark, lambda: list(bellman_ford(graph, 'CUR0', relaxation=relaxation)))
+    assert bool(paths) == bool(negative_cycles)
+
+
+@pytest.mark.parametrize('negative_cycles', NEGATIVE_CYCLES)
+@pytest.mark.parametrize('currency_count', SIZES)
+def test_bellman_ford_compiled(benchmark, currency_count, negative_cycles):
+    graph = _graph(currency_count, negative_cycles)
+    paths = _run(benchmark, lambda: list(bellman_ford(graph, 'CUR0', compiled=True, relaxation='early_exit')))
+    assert bool(paths) == bool(negative_cycles)
+
+
+@pytest.mark.parametrize('negative_cycles', NEGATIVE_CYCLES)
+@pytest.mark.parametrize('currency_count', SIZES)
+def test_negative_weight_depth_finder(benchmark, currency_count, negative_cycles):
+    graph = _graph(currency_count, negative_cycles, depth=True)
+    paths = _run(benchmark, lambda: list(NegativeWeightDepthFinder(graph).bellman_ford('CUR0', relaxation='spfa')))
+    assert bool(paths) == bool(negative_cycles)
+
+
+@pytest.mark.parametrize('negative_cycles', NEGATIVE_CYCLES)
+@pytest.mark.parametrize('currency_count', SLOW_SIZES)
+def test_bellman_ford_multi(benchmark, currency_count, negative_cycles):
+    graph = _multi_graph(currency_count, negative_cycles)
+
+    def find():
+        new_graph, paths = bellman_ford_multi(graph, 'CUR0')
+        return [path for path in paths if path is not None]
+
+    paths = _run(benchmark, find)
+    assert bool(paths) == bool(negative_cycles)
+
+
+@pytest.mark.parametrize('depth', [False, True])
+@pytest.mark.parametrize('currency_count', SIZES)
+def test_calculate_profit_ratio_for_path(benchmark, currency_count, depth):
+    graph = _graph(currency_count, 1, depth=depth)
+    path = graph.graph['planted_cycles'][0]
+    ratio = benchmark(calculate_profit_ratio_for_path, graph, path, depth=depth)
+    assert ratio > 1 or depth
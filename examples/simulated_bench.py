@@ -0,0 +1,31 @@
+# This file measures the throughput and tail latency of inter-exchange scanning against simulated exchanges, so that
+# the results do not depend on the network or on the exchanges' servers.
+import asyncio
+import time
+
+from peregrinearb import ExchangePool, simulated_exchanges, lognormal_latency
+from peregrinearb.async_find_opportunities import SuperOpportunityFinder
+
+
+async def scan(batched):
+    exchanges = simulated_exchanges(10, currency_count=40, seed=0, latency=lognormal_latency(0.05),
+                                    error_rates={'RequestTimeout': 0.01}, fetch_order_books=True)
+    exchange_ids = [exchange.id for exchange in exchanges]
+    collections = {market_name: exchange_ids for market_name in exchanges[0].prices}
+    finder = SuperOpportunityFinder(exchange_ids, collections, pool=ExchangePool(exchanges), batched=batched)
+
+    start_time = time.monotonic()
+    count = 0
+    async for opportunity in finder.get_opportunities():
+        count += 1
+    elapsed = time.monotonic() - start_time
+
+    latencies = sorted(latency for exchange in exchanges for latency in exchange.latencies)
+    requests = sum(sum(exchange.request_counts.values()) for exchange in exchanges)
+    print('batched={}: {} markets in {:.3f}s ({:.0f}/s), {} requests, p50 latency {:.3f}s, p99 latency {:.3f}s'.format(
+        batched, count, elapsed, count / elapsed, requests, latencies[len(latencies) // 2],
+        latencies[int(len(latencies) * 0.99)]))
+
+
+asyncio.get_event_loop().run_until_complete(scan(batched=False))
+asyncio.get_event_loop().run_until_complete(scan(batched=True))
@@ -1,9 +1,17 @@
 from .async_find_opportunities import *
 from .async_build_markets import *
-from .bellman_multi_graph import bellman_ford_multi, NegativeWeightFinderMulti
+from .bellman_multi_graph import bellman_ford_multi, NegativeWeightFinderMulti, BestEdgeIndex, MultiExchangeGraph
+from .bellman_incremental import IncrementalNegativeWeightFinder
+from .triangular import find_triangular_opportunities
 from .bellmannx import bellman_ford, calculate_profit_ratio_for_path, NegativeWeightFinder, NegativeWeightDepthFinder, \
-    find_opportunities_on_exchange, get_starting_volume
+    NegativeWeightCurveFinder, CompiledNegativeWeightFinder, CompiledNegativeWeightDepthFinder, \
+    find_opportunities_on_exchange, get_starting_volume, find_cycles_through_edge, enumerate_profitable_cycles
 from .utils import *
 from .fetch_exchange_tickers import *
 from .settings import *
 from .multi_graph_builder import *
+from .price_matrix import *
+from .depth import *
+from .snapshot import *
+from .simulator import *
+from .parallel import *
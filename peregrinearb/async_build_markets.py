@@ -16,10 +16,17 @@ __all__ = [
 
 class CollectionBuilder:
 
-    def __init__(self, exchanges=None):
+    def __init__(self, exchanges=None, pool=None, metadata_cache=None):
+        """
+        :param pool: Optional. An ExchangePool from which to take the exchanges, so that markets already loaded by the
+        pool are not downloaded again. The pool's exchanges are not closed.
+        :param metadata_cache: Optional. A MetadataCache from which to read the exchanges' markets and currencies.
+        """
         if exchanges is None:
             exchanges = ccxt.exchanges
         self.exchanges = exchanges
+        self.pool = pool
+        self.metadata_cache = metadata_cache
         # keys are market names and values are an array of names of exchanges which support that market
         self.collections = {}
         # stores markets which are only available on one exchange: keys are markets names and values are exchange names
@@ -47,14 +54,8 @@ class CollectionBuilder:
         return self.collections
 
     async def _add_exchange_to_collections(self, exchange_name: str, ccxt_errors=False, ):
-        exchange = getattr(ccxt, exchange_name)()
-        try:
-            await exchange.load_markets()
-            await exchange.close()
-        except ccxt.BaseError as e:
-            if ccxt_errors:
-                await exchange.close()
-                raise e
+        exchange = await self._load_exchange(exchange_name, ccxt_errors)
+        if exchange is None:
             return
 
         for symbol in exchange.symbols:
@@ -66,12 +67,42 @@ class CollectionBuilder:
             else:
                 self.singularly_available_markets[symbol] = exchange_name
 
+    async def _load_exchange(self, exchange, ccxt_errors=False, close=True):
+        """
+        Returns exchange (an Exchange object or, if it is a string, the one with that id) with its markets loaded, from
+        self.metadata_cache if there is one, or None if ccxt raised an error and not ccxt_errors. Exchanges which do not
+        belong to self.pool are closed if ccxt raised an error or if close.
+        """
+        pooled = self.pool is not None and isinstance(exchange, str)
+        if pooled:
+            exchange = self.pool.get(exchange)
+        elif isinstance(exchange, str):
+            exchange = getattr(ccxt, exchange)()
+        try:
+            if self.metadata_cache is not None:
+                await self.metadata_cache.load_markets(exchange)
+            elif pooled:
+                await self.pool.load(exchange.id)
+            else:
+                await exchange.load_markets()
+        except ccxt.BaseError as e:
+            if not pooled:
+                await exchange.close()
+            if ccxt_errors:
+                raise e
+            return None
+
+        if close and not pooled:
+            await exchange.close()
+        return exchange
+
 
 class SymbolCollectionBuilder(CollectionBuilder):
 
     def __init__(self, exchanges: list = None, symbols: list = None, exclusive_currencies: list = None,
-                 inclusive_currencies: list = None):
+                 inclusive_currencies: list = None, pool=None, metadata_cache=None):
         """
+        :param exchanges: Exchange objects or, if pool is given, exchange ids
         :param symbols: symbols which should be added to the collections
         :param exclusive_currencies: currencies for which markets should be fetched if the paired currency is also
         in exclusive_currencies
@@ -85,18 +116,14 @@ class SymbolCollectionBuilder(CollectionBuilder):
             exclusive_currencies = []
         if inclusive_currencies is None:
             inclusive_currencies = []
-        super(SymbolCollectionBuilder, self).__init__(exchanges)
+        super(SymbolCollectionBuilder, self).__init__(exchanges, pool=pool, metadata_cache=metadata_cache)
         self.symbols = symbols
         self.exclusive_currencies = exclusive_currencies
         self.inclusive_currencies = inclusive_currencies
 
     async def _add_exchange_to_collections(self, exchange: ccxt.Exchange, ccxt_errors=True, ):
-        try:
-            await exchange.load_markets()
-        except ccxt.BaseError as e:
-            if ccxt_errors:
-                await exchange.close()
-                raise e
+        exchange = await self._load_exchange(exchange, ccxt_errors, close=False)
+        if exchange is None:
             return
 
         exch_currencies = exchange.currencies
@@ -136,7 +163,7 @@ class SymbolCollectionBuilder(CollectionBuilder):
 
 class SpecificCollectionBuilder(CollectionBuilder):
 
-    def __init__(self, blacklist=False, **kwargs):
+    def __init__(self, blacklist=False, pool=None, metadata_cache=None, **kwargs):
         """
         **kwargs should restrict acceptable exchanges. Only acceptable keys and values are strings. Look at this part of
         the ccxt manual: https://github.com/ccxt/ccxt/wiki/Manual#user-content-exchange-structure for insight into what
@@ -152,24 +179,18 @@ class SpecificCollectionBuilder(CollectionBuilder):
         Islands, Canada, China, Czech Republic, EU, Germany, Hong Kong, Iceland, India, Indonesia, Israel, Japan,
         Mexico, New Zealand, Panama, Philippines, Poland, Russia, Seychelles, Singapore, South Korea,
         St. Vincent & Grenadines, Sweden, Tanzania, Thailand, Turkey, US, UK, Ukraine, or Vietnam as a value.
+
+        :param pool: Optional. Look at the docstring of CollectionBuilder.__init__.
+        :param metadata_cache: Optional. Look at the docstring of CollectionBuilder.__init__.
         """
-        super().__init__()
+        super().__init__(pool=pool, metadata_cache=metadata_cache)
         self.rules = kwargs
         self.blacklist = blacklist
 
     async def _add_exchange_to_collections(self, exchange_name: str, ccxt_errors=True, name=True):
-        if name:
-            exchange = getattr(ccxt, exchange_name)()
-        if ccxt_errors:
-            await exchange.load_markets()
-            await exchange.close()
-        else:
-            try:
-                await exchange.load_markets()
-                await exchange.close()
-            except ccxt.BaseError:
-                await exchange.close()
-                return
+        exchange = await self._load_exchange(exchange_name, ccxt_errors)
+        if exchange is None:
+            return
 
         # Implicitly (and intentionally) does not except ValueErrors raised by _check_exchange_meets_criteria
         if self._check_exchange_meets_criteria(exchange):
@@ -238,13 +259,15 @@ class SpecificCollectionBuilder(CollectionBuilder):
         return self.blacklist == (element not in actual_value)
 
 
-async def build_specific_collections(blacklist=False, write=False, ccxt_errors=False, **kwargs):
-    builder = SpecificCollectionBuilder(blacklist, **kwargs)
+async def build_specific_collections(blacklist=False, write=False, ccxt_errors=False, pool=None, metadata_cache=None,
+                                     **kwargs):
+    builder = SpecificCollectionBuilder(blacklist, pool=pool, metadata_cache=metadata_cache, **kwargs)
     return await builder.build_collections(write, ccxt_errors)
 
 
-async def build_collections(exchanges=None, write=True, ccxt_errors=False):
-    return await CollectionBuilder(exchanges).build_collections(write, ccxt_errors)
+async def build_collections(exchanges=None, write=True, ccxt_errors=False, pool=None, metadata_cache=None):
+    builder = CollectionBuilder(exchanges, pool=pool, metadata_cache=metadata_cache)
+    return await builder.build_collections(write, ccxt_errors)
 
 
 async def get_exchanges_for_market(symbol, collections_dir='./'):
@@ -1,10 +1,16 @@
 import ccxt.async_support as ccxt
 from .async_build_markets import get_exchanges_for_market
 import asyncio
+import itertools
 import logging
+import random
+import time
 from .settings import INTER_LOGGING_PATH
 import datetime
-from .utils import Collections
+import numpy as np
+from .depth import rank_opportunities, size_opportunity
+from .price_matrix import PriceMatrix, compute_spreads
+from .utils import Collections, RateLimiter
 from .utils.logging_utils import FormatForLogAdapter
 
 __all__ = [
@@ -17,13 +23,11 @@ __all__ = [
 file_logger = logging.getLogger(INTER_LOGGING_PATH + __name__)
 
 
-class InterExchangeAdapter(logging.LoggerAdapter):
+class InterExchangeAdapter(FormatForLogAdapter):
 
     def __init__(self, logger, extra):
-        super(InterExchangeAdapter, self).__init__(logger, extra)
-
-    def process(self, msg, kwargs):
-        return 'Invocation#{} - Market#{} - {}'.format(self.extra['invocation_id'], self.extra['market'], msg), kwargs
+        super(InterExchangeAdapter, self).__init__(logger, extra, context={'invocation': extra['invocation_id'],
+                                                                           'market': extra['market']})
 
 
 __all__ = [
@@ -34,28 +38,34 @@ __all__ = [
 
 class OpportunityFinder:
 
-    def __init__(self, market_name, exchanges=None, name=True, invocation_id=0):
+    def __init__(self, market_name, exchanges=None, name=True, invocation_id=0, pool=None):
         """
         An object of type OpportunityFinder finds the largest price disparity between exchanges for a given
         cryptocurrency market by finding the exchange with the lowest market ask price and the exchange with the
         highest market bid price.
+
+        :param pool: Optional. An ExchangePool from which to take the exchanges (given as ids), whose connections are
+        then not closed.
         """
         logger = logging.getLogger(INTER_LOGGING_PATH + __name__)
         self.adapter = InterExchangeAdapter(logger, {'invocation_id': invocation_id, 'market': market_name})
-        self.adapter.debug('Initializing OpportunityFinder for {}'.format(market_name))
+        self.adapter.debug('Initializing OpportunityFinder')
 
         if exchanges is None:
             self.adapter.warning('Parameter name\'s being false has no effect.')
             exchanges = get_exchanges_for_market(market_name)
 
-        if name:
+        if pool is not None:
+            exchanges = [pool.get(exchange_id) for exchange_id in exchanges]
+        elif name:
             exchanges = [getattr(ccxt, exchange_id)() for exchange_id in exchanges]
 
+        self.pool = pool
         self.exchange_list = exchanges
         self.market_name = market_name
         self.highest_bid = {'exchange': None, 'price': -1}
         self.lowest_ask = {'exchange': None, 'price': float('Inf')}
-        self.adapter.debug('Initialized OpportunityFinder for {}'.format(market_name))
+        self.adapter.debug('Initialized OpportunityFinder')
 
     async def _test_bid_and_ask(self, exchange):
         """
@@ -63,24 +73,24 @@ class OpportunityFinder:
         sets self.highest_bid to the retrieved bid. If retrieved ask < self.lowest ask, sets self.lowest_ask to the
         retrieved ask.
         """
-        self.adapter.info('Checking if {} qualifies for the highest bid or lowest ask for {}'.format(exchange.id,
-                                                                                                     self.market_name))
         if not isinstance(exchange, ccxt.Exchange):
             raise ValueError("exchange is not a ccxt Exchange instance.")
+        self.adapter.info('Checking if exchange qualifies for the highest bid or lowest ask', exchange=exchange.id)
 
         # try:
-        self.adapter.info('Fetching ticker from {} for {}'.format(exchange.id, self.market_name))
+        self.adapter.info('Fetching ticker', exchange=exchange.id)
         ticker = await exchange.fetch_ticker(self.market_name)
-        self.adapter.info('Fetched ticker from {} for {}'.format(exchange.id, self.market_name))
+        self.adapter.info('Fetched ticker', exchange=exchange.id)
         # A KeyError or ExchangeError occurs when the exchange does not have a market named self.market_name.
         # Any ccxt BaseError is because of ccxt, not this code.
         # except (KeyError, ccxt.ExchangeError, ccxt.BaseError):
         #     await exchange.close()
         #     return
 
-        self.adapter.debug('Closing connection to {}'.format(exchange.id))
-        await exchange.close()
-        self.adapter.debug('Closed connection to {}'.format(exchange.id))
+        if self.pool is None:
+            self.adapter.debug('Closing connection', exchange=exchange.id)
+            await exchange.close()
+            self.adapter.debug('Closed connection', exchange=exchange.id)
 
         ask = ticker['ask']
         bid = ticker['bid']
@@ -91,8 +101,7 @@ class OpportunityFinder:
         if ask < self.lowest_ask['price']:
             self.lowest_ask['price'] = ask
             self.lowest_ask['exchange'] = exchange
-        self.adapter.info('Checked if exchange qualifies for the highest bid or lowest ask for market',
-                          exchange=exchange.id, symbol=self.market_name)
+        self.adapter.info('Checked if exchange qualifies for the highest bid or lowest ask', exchange=exchange.id)
 
     async def find_min_max(self):
         tasks = [self._test_bid_and_ask(exchange_name) for exchange_name in self.exchange_list]
@@ -115,7 +124,8 @@ class SuperInterExchangeAdapter(logging.LoggerAdapter):
 class SuperOpportunityFinder:
 
     def __init__(self, exchanges, collections, name=True, opportunity_id=0, get_usd_rates=False,
-                 opportunity_interval=0.05):
+                 opportunity_interval=None, pool=None, rate_limiter=None, retries=5, max_concurrency=64,
+                 exchange_concurrency=8, retry_backoff=0.1, batched=False, depth=False):
         """
         SuperOpportunityFinder, given a dict of collections, yields opportunities in the order they come. There is not
         enough overlap between SuperOpportunityFinder and OpportunityFinder to warrant inheritance.
@@ -128,131 +138,208 @@ class SuperOpportunityFinder:
         :param collections: A dict of collections, as returned by CollectionBuilder in async_build_markets.py. The
         self.collections field will be a Collections object.
         :param name: True if exchanges is a list of strings, False if it is a list of ccxt.Exchange objects
+        :param pool: Optional. An ExchangePool from which to take the exchanges (given as ids). The pool's exchanges are
+        not closed by get_opportunities.
+        :param opportunity_interval: Deprecated and ignored. Requests are paced by rate_limiter.
+        :param rate_limiter: Optional. A RateLimiter through which requests to the exchanges are made. Pass the same one
+        to finders which share exchanges. If None, a new one is created.
+        :param retries: How many times a request which was rate limited or timed out is retried.
+        :param max_concurrency: The maximum number of markets for which opportunities are found at once.
+        :param exchange_concurrency: The maximum number of requests in flight to each exchange.
+        :param retry_backoff: Before the nth retry of a request, waits a random time between 0 and
+        retry_backoff * 2 ** n seconds so that retries to the same exchange are spread out.
+        :param batched: If True, get_opportunities fetches each exchange's data for all of its markets with as few bulk
+        requests as possible (look at fetch_snapshot) instead of fetching an order book per market and exchange.
+        :param depth: If True, each opportunity is sized by walking the order books of its lowest ask's exchange and its
+        highest bid's exchange, net of their taker fees, and given a 'depth' key valued by the dict returned by
+        size_opportunity. Opportunities found by opportunities_from_snapshot are then ordered by realizable profit.
         """
         self.adapter = FormatForLogAdapter(
             logging.getLogger('peregrinearb.async_find_opportunities.SuperOpportunityFinder'))
         self.adapter.debug('Initializing SuperOpportunityFinder')
-        if name:
+        if pool is not None:
+            self.exchanges = {e: pool.get(e) for e in exchanges}
+        elif name:
             self.exchanges = {e: getattr(ccxt, e)() for e in exchanges}
         else:
             self.exchanges = {e.id: e for e in exchanges}
+        self.pool = pool
         self.collections = Collections(collections)
         self.adapter.debug('Initialized SuperOpportunityFinder')
-        self.rate_limited_exchanges = set()
-        self._find_opportunity_calls = -1
+        if rate_limiter is None:
+            rate_limiter = RateLimiter()
+        self.rate_limiter = rate_limiter
+        self.retries = retries
+        self.max_concurrency = max_concurrency
+        self.exchange_concurrency = exchange_concurrency
+        self.retry_backoff = retry_backoff
+        self._exchange_semaphores = {}
         # starting opportunity id for logging
         self.opportunity_id = opportunity_id
         self.usd_rates = {}
         self.get_usd_rates = get_usd_rates
-        self.opportunity_interval = opportunity_interval
+        self.batched = batched
+        self.depth = depth
 
-    async def get_opportunities(self, price_markets=None, close=True, ):
+    async def get_opportunities(self, price_markets=None, close=True, priorities=None):
         """
+        Opportunities are found for at most self.max_concurrency markets at once. Markets wait in a priority queue and
+        are yielded in the order in which they finish. If self.batched, every exchange's data is fetched first and the
+        opportunities are then yielded in the order of self.collections.
+
         :param price_markets: Optional. If you would like to first return the prices for the markets in price_markets
         and the corresponding opportunities before finding other opportunities.
         Example value is ['BTC/USD, BTC/USDT, ETH/USD, ETH/USDT]
         For markets in price_markets, return a 2-tuple of (opportunity, prices). Read docstring of _find_opportunity for
         more information.
+        :param priorities: Optional. A dict keyed by market name and valued by a number such as the market's volume.
+        Markets with greater values are started first. Markets not in priorities (or all markets, if priorities is
+        None) are prioritized by the number of exchanges which list them.
         """
         self.adapter.info('Finding inter-exchange opportunities.')
-
-        # If you would like to first return the prices for the markets in price_markets and the corresponding
-        # opportunities before finding other opportunities
-        if price_markets is not None:
-            collections = self.collections
-            # First collects the prices for the markets in price_markets
-            tasks = []
-            for market in price_markets:
-                tasks.append(self._find_opportunity(market, self.collections[market], True))
-                # todo: add if market in price_markets to _find_opportunity. deleting from collections is bad.
-                del collections[market]
-            for result in asyncio.as_completed(tasks):
-                yield await result
+        if price_markets is None:
+            price_markets = []
+        if priorities is None:
+            priorities = {}
+
+        if self.batched:
+            snapshot = await self.fetch_snapshot()
+            for result in self.opportunities_from_snapshot(snapshot, price_markets):
+                yield result
         else:
-            collections = self.collections
-
-        tasks = [self._find_opportunity(market_name, exchange_list)
-                 for market_name, exchange_list in collections.items()]
+            # If you would like to first return the prices for the markets in price_markets and the corresponding
+            # opportunities before finding other opportunities
+            async for result in self._schedule([(0, market, True) for market in price_markets]):
+                yield result
 
-        for result in asyncio.as_completed(tasks):
-            yield await result
+            excluded = set(price_markets)
+            jobs = [(-priorities.get(market_name, len(exchange_list)), market_name, False)
+                    for market_name, exchange_list in self.collections.items() if market_name not in excluded]
+            async for result in self._schedule(jobs):
+                yield result
 
         if close:
-            tasks = [e.close() for e in self.exchanges.values()]
-            await asyncio.wait(tasks)
+            await self.close()
         self.adapter.info('Yielded all inter-exchange opportunities.')
 
+    async def stream_opportunities(self, interval=1.0, threshold=0.0, rounds=None, priorities=None, close=True):
+        """
+        Finds the opportunities of every market in self.collections again and again, keeping the connections to the
+        exchanges open between rounds, and yields an opportunity only if its market's spread has changed by more than
+        threshold since the market's opportunity was last yielded (or if it has not been yielded yet).
+
+        Each opportunity yielded has an additional key, 'spread', whose value is highest_bid's price / lowest_ask's
+        price - 1. Markets for which no exchange returned prices are not yielded.
+
+        :param interval: The minimum number of seconds between the starts of two rounds.
+        :param threshold: The change in spread (e.g. 0.001 for 0.1 percentage points) which a market's spread must
+        exceed for its opportunity to be yielded again.
+        :param rounds: Optional. The number of rounds after which to stop. If None, streams until the generator is
+        closed.
+        :param priorities: Passed to get_opportunities.
+        :param close: If True, the exchanges are closed (unless they belong to self.pool) when the stream ends.
+        """
+        last_spreads = {}
+        round_count = 0
+        try:
+            while rounds is None or round_count < rounds:
+                started = time.monotonic()
+                yielded_count = 0
+                async for opportunity in self.get_opportunities(close=False, priorities=priorities):
+                    if opportunity['highest_bid']['exchange'] is None or opportunity['lowest_ask']['exchange'] is None:
+                        continue
+                    spread = opportunity['highest_bid']['price'] / opportunity['lowest_ask']['price'] - 1
+                    market_name = opportunity['ticker']
+                    if market_name in last_spreads and abs(spread - last_spreads[market_name]) <= threshold:
+                        continue
+
+                    last_spreads[market_name] = spread
+                    opportunity['spread'] = spread
+                    yielded_count += 1
+                    yield opportunity
+
+                round_count += 1
+                self.adapter.info('Finished streaming round', round=round_count, opportunityCount=yielded_count)
+                if rounds is None or round_count < rounds:
+                    await asyncio.sleep(max(0, interval - (time.monotonic() - started)))
+        finally:
+            if close:
+                await self.close()
+
+    async def close(self):
+        """
+        Closes the connections to the exchanges, unless they belong to self.pool.
+        """
+        if self.pool is None:
+            await asyncio.gather(*[e.close() for e in self.exchanges.values()])
+
+    async def _schedule(self, jobs):
+        """
+        Runs _find_opportunity for each (priority, market name, return_prices) tuple in jobs, lowest priority first, in
+        at most self.max_concurrency worker tasks, and yields the results in the order in which they finish.
+        """
+        queue = asyncio.PriorityQueue()
+        # the counter breaks ties between equal priorities without comparing market names
+        counter = itertools.count()
+        for priority, market_name, return_prices in jobs:
+            queue.put_nowait((priority, next(counter), market_name, return_prices))
+        job_count = queue.qsize()
+        results = asyncio.Queue()
+
+        async def work():
+            while not queue.empty():
+                priority, i, market_name, return_prices = queue.get_nowait()
+                try:
+                    # the exchanges are looked up when the market is started because exchanges which no longer list
+                    # it are removed from self.collections
+                    exchange_list = self.collections[market_name] if market_name in self.collections else []
+                    result = await self._find_opportunity(market_name, exchange_list, return_prices)
+                except Exception as e:
+                    result = e
+                results.put_nowait(result)
+
+        workers = [asyncio.ensure_future(work()) for i in range(min(self.max_concurrency, job_count))]
+        try:
+            for i in range(job_count):
+                result = await results.get()
+                if isinstance(result, Exception):
+                    raise result
+                yield result
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
     async def _find_opportunity(self, market_name, exchange_list, return_prices=False):
         """
         :param return_prices: If True, returns a two-tuple where the first element is the opportunity dict and the
         second element is a dict keyed by exchange name in exchange_list and valued with the corresponding price of
         market_name. If False, returns the opportunity dict
         """
-        self._find_opportunity_calls += 1
-        self.opportunity_id += 1
-        current_opp_id = self.opportunity_id
-        await asyncio.sleep(self.opportunity_interval * self._find_opportunity_calls)
-        # Try again in 100 milliseconds if any of the exchanges in exchange_list are currently rate limited.
-        for e in exchange_list:
-            if e in self.rate_limited_exchanges:
-                self.adapter.info('Sleeping asynchronously because exchange was rate limited',
-                                  exchange=e, sleeptime=0.1, )
-                await asyncio.sleep(0.1)
-                return await self._find_opportunity(market_name, exchange_list)
+        opportunity = self._new_opportunity(market_name)
+        current_opp_id = opportunity['id']
 
         if return_prices:
             prices = {}
+        order_books = {}
 
         self.adapter.info('Finding opportunity', opportunity=current_opp_id, market=market_name, )
-        opportunity = {
-            'highest_bid': {'price': -1, 'exchange': None, 'volume': 0},
-            'lowest_ask': {'price': float('Inf'), 'exchange': None, 'volume': 0},
-            'ticker': market_name,
-            'datetime': datetime.datetime.now(tz=datetime.timezone.utc),
-            'id': current_opp_id
-        }
 
         tasks = [self._exchange_fetch_order_book(exchange_name, market_name, current_opp_id)
                  for exchange_name in exchange_list]
         for res in asyncio.as_completed(tasks):
             order_book, exchange_name = await res
-            # If the order book's volume was too low or fetch_ticker raised ExchangeError or ExchangeNotAvailable
+            # If the order book's volume was too low or fetching it raised an error
             if exchange_name is None:
                 continue
-            # If ticker is None, that means that there was either a RequestTimeout or DDosProtection error.
-            if order_book is None:
-                self.rate_limited_exchanges.add(exchange_name)
-                await asyncio.sleep(0.2)
-                # Because of asynchronicity, error.exchange_name may no longer be in self.rate_limited_exchanges
-                if exchange_name in self.rate_limited_exchanges:
-                    self.rate_limited_exchanges.remove(exchange_name)
-
-                if market_name in self.collections:
-                    # self.collections[market_name] instead of exchange_list because an exchange is removed if it
-                    # raised ExchangeError, which signals that the exchange no longer supports the specified market
-                    return await self._find_opportunity(market_name, self.collections[market_name])
-                # edge case: if it was removed because there were only two exchanges for this market and one of them
-                # was removed because it no longer supports this market. likely will happen only with very low-volume
-                # and exotic markets
-                else:
-                    return opportunity
-
-            bid = order_book['bids'][0][0]
-            ask = order_book['asks'][0][0]
 
+            self._update_opportunity(opportunity, exchange_name, order_book)
+            order_books[exchange_name] = order_book
             if return_prices:
-                prices[exchange_name] = ask
-
-            if bid > opportunity['highest_bid']['price']:
-                opportunity['highest_bid']['price'] = bid
-                opportunity['highest_bid']['exchange'] = exchange_name
-                opportunity['highest_bid']['volume'] = order_book['bids'][0][1]
-
-            if ask < opportunity['lowest_ask']['price']:
-                opportunity['lowest_ask']['price'] = ask
-                opportunity['lowest_ask']['exchange'] = exchange_name
-                opportunity['lowest_ask']['volume'] = order_book['asks'][0][1]
+                prices[exchange_name] = order_book['asks'][0][0]
 
+        if self.depth:
+            self._size_opportunity(opportunity, order_books)
         self.adapter.info('Found opportunity', opportunity=current_opp_id, market=market_name)
         if return_prices:
             return opportunity, prices
@@ -260,26 +347,17 @@ class SuperOpportunityFinder:
 
     async def _exchange_fetch_order_book(self, exchange_name, market_name, current_opp_id):
         """
-        Returns a two-tuple structured as (ticker, exchange_name)
-        ticker is None if an order book with bids and asks was not returned by fetch_order_book
-        exchange_name is None if an unavoidable error was raised or the order book has no bids or no asks
+        Returns a two-tuple structured as (order_book, exchange_name). Both are None if an unavoidable error was raised,
+        if the request was still rate limited or timing out after self.retries retries, or if the order book has no
+        bids or no asks.
         """
         self.adapter.debug('Fetching ticker', opportunity=current_opp_id,
                            exchange=exchange_name, market=market_name)
         try:
-            order_book = await self.exchanges[exchange_name].fetch_order_book(market_name)
-        except ccxt.DDoSProtection:
-            self.adapter.warning('Rate limited for inter-exchange opportunity',
-                                 opportunity=current_opp_id,
-                                 exchange=exchange_name,
-                                 market=market_name)
-            return None, exchange_name
-        except ccxt.RequestTimeout:
-            self.adapter.warning('Request timeout for inter-exchange opportunity.',
-                                 opportunity=current_opp_id,
-                                 exchange=exchange_name,
-                                 market=market_name)
-            return None, exchange_name
+            order_book = await self._fetch_with_retries(exchange_name, 'fetch_order_book', market_name,
+                                                        opportunity=current_opp_id)
+        except (ccxt.DDoSProtection, ccxt.RequestTimeout):
+            return None, None
         # If the exchange no longer has the specified market
         except ccxt.ExchangeError:
             self.adapter.warning('Fetching ticker raised an ExchangeError.', opportunity=current_opp_id,
@@ -297,16 +375,197 @@ class SuperOpportunityFinder:
             self.adapter.debug('No asks or no bids', exchange=exchange_name, market=market_name)
             return None, None
 
+        self._record_usd_rate(exchange_name, market_name, order_book)
+        self.adapter.debug('Fetched ticker', opportunity=current_opp_id, exchange=exchange_name,
+                           market=market_name)
+        return order_book, exchange_name
+
+    async def _fetch_with_retries(self, exchange_name, method, *args, **log_kwargs):
+        """
+        Calls the method of the exchange named exchange_name through self.rate_limiter, with at most
+        self.exchange_concurrency calls to the exchange in flight. Retries up to self.retries times, after a random
+        exponential backoff, if it raises DDoSProtection or RequestTimeout.
+        """
+        exchange = self.exchanges[exchange_name]
+        if exchange_name not in self._exchange_semaphores:
+            self._exchange_semaphores[exchange_name] = asyncio.Semaphore(self.exchange_concurrency)
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._exchange_semaphores[exchange_name]:
+                    return await self.rate_limiter.call(exchange, method, *args)
+            except (ccxt.DDoSProtection, ccxt.RequestTimeout) as e:
+                self.adapter.warning('Request was rate limited or timed out', exchange=exchange_name,
+                                     error=type(e).__name__, attempt=attempt, **log_kwargs)
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(random.uniform(0, self.retry_backoff * 2 ** attempt))
+
+    async def fetch_snapshot(self):
+        """
+        Fetches the order books of every market in self.collections, grouped by exchange so that each exchange is sent
+        as few requests as possible: one fetch_order_books request if the exchange supports it, otherwise one
+        fetch_tickers request (whose best bid and ask are used as one-level order books) if it supports that, otherwise
+        one fetch_order_book request per market.
+
+        :return: A dict keyed by exchange id and valued by a dict keyed by market name and valued by order book. Markets
+        whose order books have no bids or no asks, and exchanges whose requests failed, are left out.
+        """
+        symbols = {exchange_name: [] for exchange_name in self.exchanges}
+        for market_name, exchange_list in self.collections.items():
+            for exchange_name in exchange_list:
+                if exchange_name in symbols:
+                    symbols[exchange_name].append(market_name)
+
+        exchange_names = [exchange_name for exchange_name, markets in symbols.items() if markets]
+        self.adapter.info('Fetching snapshot', exchangeCount=len(exchange_names))
+        order_books = await asyncio.gather(*[self._fetch_exchange_order_books(exchange_name, symbols[exchange_name])
+                                             for exchange_name in exchange_names])
+        self.adapter.info('Fetched snapshot', exchangeCount=len(exchange_names))
+        return dict(zip(exchange_names, order_books))
+
+    def opportunities_from_snapshot(self, snapshot, price_markets=None):
+        """
+        Returns the opportunity for each market in self.collections, found from snapshot (as returned by fetch_snapshot)
+        without making any requests. The opportunities of the markets in price_markets come first, each as a 2-tuple of
+        (opportunity, prices), as with get_opportunities.
+        """
+        if price_markets is None:
+            price_markets = []
+        price_market_set = set(price_markets)
+        market_names = itertools.chain(price_markets, (market_name for market_name in self.collections
+                                                       if market_name not in price_market_set))
+
+        market_names = list(market_names)
+
+        matrix = PriceMatrix(market_names, snapshot.keys())
+        for market_name in market_names:
+            exchange_list = self.collections[market_name] if market_name in self.collections else []
+            for exchange_name in exchange_list:
+                order_book = snapshot.get(exchange_name, {}).get(market_name)
+                if order_book is None:
+                    continue
+                matrix.set_order_book(market_name, exchange_name, order_book)
+                self._record_usd_rate(exchange_name, market_name, order_book)
+        spreads = compute_spreads(matrix)
+
+        results = []
+        for i, market_name in enumerate(market_names):
+            opportunity = self._new_opportunity(market_name)
+            if spreads.best_bid_exchange[i] >= 0:
+                opportunity['highest_bid'] = {'price': float(spreads.best_bid[i]),
+                                              'exchange': matrix.exchanges[spreads.best_bid_exchange[i]],
+                                              'volume': _nan_to_none(spreads.best_bid_volume[i])}
+            if spreads.best_ask_exchange[i] >= 0:
+                opportunity['lowest_ask'] = {'price': float(spreads.best_ask[i]),
+                                             'exchange': matrix.exchanges[spreads.best_ask_exchange[i]],
+                                             'volume': _nan_to_none(spreads.best_ask_volume[i])}
+            if self.depth:
+                self._size_opportunity(opportunity, {exchange_name: books[market_name]
+                                                     for exchange_name, books in snapshot.items()
+                                                     if market_name in books})
+
+            if market_name in price_market_set:
+                row = matrix.market_index[market_name]
+                prices = {matrix.exchanges[j]: float(matrix.ask[row, j])
+                          for j in np.flatnonzero(~np.isnan(matrix.ask[row]))}
+                results.append((opportunity, prices))
+            else:
+                results.append(opportunity)
+
+        if self.depth:
+            price_results = results[:len(price_markets)]
+            return price_results + rank_opportunities(results[len(price_markets):])
+        return results
+
+    def opportunities_from_tickers(self, ticker_dicts, price_markets=None):
+        """
+        Returns the opportunities found from ticker_dicts, a dict keyed by exchange id and valued by a dict of tickers
+        as returned by BulkTickerFetcher.fetch_exchange_tickers, so that tickers fetched for intra-exchange graphs can
+        be reused. Look at opportunities_from_snapshot.
+        """
+        snapshot = {exchange_name: _order_books_from_tickers(tickers)
+                    for exchange_name, tickers in ticker_dicts.items()}
+        return self.opportunities_from_snapshot(snapshot, price_markets)
+
+    async def _fetch_exchange_order_books(self, exchange_name, symbols):
+        exchange = self.exchanges[exchange_name]
+        has = getattr(exchange, 'has', {})
+        try:
+            if has.get('fetchOrderBooks') is True:
+                order_books = await self._fetch_with_retries(exchange_name, 'fetch_order_books', symbols)
+            elif has.get('fetchTickers') is True:
+                tickers = await self._fetch_with_retries(exchange_name, 'fetch_tickers', symbols)
+                order_books = _order_books_from_tickers(tickers)
+            else:
+                results = await asyncio.gather(*[self._exchange_fetch_order_book(exchange_name, market_name, None)
+                                                 for market_name in symbols])
+                return {market_name: order_book for market_name, (order_book, name) in zip(symbols, results)
+                        if name is not None}
+        except ccxt.BaseError as e:
+            self.adapter.warning('Could not fetch order books, exchange will be skipped', exchange=exchange_name,
+                                 error=type(e).__name__)
+            return {}
+
+        symbols = set(symbols)
+        return {market_name: order_book for market_name, order_book in order_books.items()
+                if market_name in symbols and order_book['bids'] and order_book['asks']}
+
+    def _new_opportunity(self, market_name):
+        self.opportunity_id += 1
+        return {
+            'highest_bid': {'price': -1, 'exchange': None, 'volume': 0},
+            'lowest_ask': {'price': float('Inf'), 'exchange': None, 'volume': 0},
+            'ticker': market_name,
+            'datetime': datetime.datetime.now(tz=datetime.timezone.utc),
+            'id': self.opportunity_id
+        }
+
+    @staticmethod
+    def _update_opportunity(opportunity, exchange_name, order_book):
+        bid = order_book['bids'][0][0]
+        ask = order_book['asks'][0][0]
+
+        if bid > opportunity['highest_bid']['price']:
+            opportunity['highest_bid']['price'] = bid
+            opportunity['highest_bid']['exchange'] = exchange_name
+            opportunity['highest_bid']['volume'] = order_book['bids'][0][1]
+
+        if ask < opportunity['lowest_ask']['price']:
+            opportunity['lowest_ask']['price'] = ask
+            opportunity['lowest_ask']['exchange'] = exchange_name
+            opportunity['lowest_ask']['volume'] = order_book['asks'][0][1]
+
+    def _size_opportunity(self, opportunity, order_books):
+        """
+        Sets opportunity['depth'] to the result of size_opportunity for buying on the exchange of opportunity's lowest
+        ask and selling on the exchange of its highest bid. order_books is a dict keyed by exchange name and valued by
+        the order book of opportunity's market.
+        """
+        buy_exchange = opportunity['lowest_ask']['exchange']
+        sell_exchange = opportunity['highest_bid']['exchange']
+        if buy_exchange is None or sell_exchange is None:
+            return
+        market_name = opportunity['ticker']
+        opportunity['depth'] = size_opportunity(order_books[sell_exchange]['bids'], order_books[buy_exchange]['asks'],
+                                                buy_fee=self._taker_fee(buy_exchange, market_name),
+                                                sell_fee=self._taker_fee(sell_exchange, market_name))
+
+    def _taker_fee(self, exchange_name, market_name):
+        exchange = self.exchanges[exchange_name]
+        market = (exchange.markets or {}).get(market_name, {})
+        if market.get('taker') is not None:
+            return market['taker']
+        # the exchange's default fee if its markets are not loaded
+        return (getattr(exchange, 'fees', None) or {}).get('trading', {}).get('taker') or 0
+
+    def _record_usd_rate(self, exchange_name, market_name, order_book):
         if self.get_usd_rates:
             cap_currency_index = market_name.find('USD')
             # if self.cap_currency is the quote currency
             if cap_currency_index > 0:
                 self._add_to_rates_dict(exchange_name, market_name, order_book['bids'][0][0])
 
-        self.adapter.debug('Fetched ticker', opportunity=current_opp_id, exchange=exchange_name,
-                           market=market_name)
-        return order_book, exchange_name
-
     def _add_to_rates_dict(self, exchange_name, market_name, price):
         if exchange_name in self.usd_rates:
             self.usd_rates[exchange_name][market_name] = price
@@ -314,14 +573,32 @@ class SuperOpportunityFinder:
             self.usd_rates[exchange_name] = {market_name: price}
 
 
-def get_opportunities_for_collection(exchanges, collections, name=True):
-    finder = SuperOpportunityFinder(exchanges, collections, name=name)
+def _nan_to_none(value):
+    return None if np.isnan(value) else float(value)
+
+
+def _order_books_from_tickers(tickers):
+    """
+    Returns a dict keyed by market name and valued by a one-level order book made from the best bid and ask (and their
+    volumes) of each ticker in tickers. Markets without a bid or an ask are left out.
+    """
+    order_books = {}
+    for market_name, ticker in tickers.items():
+        if ticker.get('bid') is None or ticker.get('ask') is None:
+            continue
+        order_books[market_name] = {'bids': [[ticker['bid'], ticker.get('bidVolume')]],
+                                    'asks': [[ticker['ask'], ticker.get('askVolume')]]}
+    return order_books
+
+
+def get_opportunities_for_collection(exchanges, collections, name=True, pool=None):
+    finder = SuperOpportunityFinder(exchanges, collections, name=name, pool=pool)
     return finder.get_opportunities()
 
 
-async def get_opportunity_for_market(ticker, exchanges=None, name=True, invocation_id=0):
+async def get_opportunity_for_market(ticker, exchanges=None, name=True, invocation_id=0, pool=None):
     file_logger.info('Invocation#{} - Finding lowest ask and highest bid for {}'.format(invocation_id, ticker))
-    finder = OpportunityFinder(ticker, exchanges=exchanges, name=name)
+    finder = OpportunityFinder(ticker, exchanges=exchanges, name=name, pool=pool)
     result = await finder.find_min_max()
     file_logger.info('Invocation#{} - Found lowest ask and highest bid for {}'.format(invocation_id, ticker))
     return result
@@ -0,0 +1,178 @@
+import collections
+import logging
+import networkx as nx
+from .bellmannx import NegativeWeightFinder
+from .utils import wss_update_graph
+from .utils.logging_utils import FormatForLogAdapter
+__all__ = [
+    'IncrementalNegativeWeightFinder',
+]
+
+
+adapter = FormatForLogAdapter(logging.getLogger('peregrinearb.bellman_incremental'))
+
+
+class IncrementalNegativeWeightFinder(NegativeWeightFinder):
+    __slots__ = ['source']
+
+    def __init__(self, graph: nx.DiGraph, source='BTC'):
+        """
+        A NegativeWeightFinder which keeps its distance_to and predecessor_to state between scans so that, after the
+        weight of a single edge changes (e.g. after wss_update_graph), only the part of the graph whose distances depend
+        on that edge is relaxed again.
+
+        Call bellman_ford (or let the first call to update_edge do so) to build the initial state. Only edge weight
+        changes are handled incrementally: after adding or removing nodes or edges, call bellman_ford again.
+        """
+        super(IncrementalNegativeWeightFinder, self).__init__(graph)
+        self.source = source
+
+    def bellman_ford(self, source=None, unique_paths=True, relaxation='spfa'):
+        """
+        Runs a full scan from source (self.source if None) and keeps its state for update_edge. Look at the docstring
+        of NegativeWeightFinder.bellman_ford.
+        """
+        if source is None:
+            source = self.source
+        self.source = source
+        self.seen_nodes = set()
+        return super(IncrementalNegativeWeightFinder, self).bellman_ford(source, unique_paths, relaxation)
+
+    def update(self, symbol, side, price, volume):
+        """
+        Updates self.graph with wss_update_graph and returns the negative cycle through the updated edge, if one now
+        exists. Look at the docstring of update_edge.
+        """
+        self._ensure_state()
+        opp_could_exist = wss_update_graph(self.graph, symbol, side, price, volume)
+        base, quote = symbol.split('/')
+        # the ask was updated
+        if side == 'sell':
+            path = self.update_edge(quote, base)
+        else:
+            path = self.update_edge(base, quote)
+
+        # a price which got worse can only remove opportunities
+        if not opp_could_exist:
+            return None
+        return path
+
+    def update_edge(self, u, v):
+        """
+        Call after the weight of the edge from u to v has changed. bellman_ford must have been run before the change.
+
+        If the edge's weight decreased such that it shortens the distance to v, the distances of v and its descendants
+        in the shortest-path tree are relaxed until they settle or until the distance to u improves, which means that
+        the edge is part of a negative cycle. If the weight of a shortest-path tree edge increased, the distances of v's
+        subtree are recomputed from their incoming edges.
+
+        Returns
+        -------
+        list
+            A negative cycle which starts and ends with u and whose second node is v, or None if there is none.
+        """
+        self._ensure_state()
+        weight = self.graph[u][v]['weight']
+        if self.distance_to[u] + weight < self.distance_to[v]:
+            self.distance_to[v] = self.distance_to[u] + weight
+            self.predecessor_to[v] = u
+            return self._propagate([v], u)
+
+        if self.predecessor_to[v] == u and self.distance_to[u] + weight > self.distance_to[v]:
+            self._repair_subtree(v)
+
+        return None
+
+    def _ensure_state(self):
+        if not self.distance_to:
+            adapter.debug('Building initial state', source=self.source)
+            # exhaust the generator so that distance_to and predecessor_to are populated
+            for path in self.bellman_ford(self.source):
+                pass
+
+    def _propagate(self, nodes, cycle_node=None):
+        """
+        Relaxes the outgoing edges of nodes and of every node whose distance is improved as a result. Stops early if the
+        distance to cycle_node improves, in which case the negative cycle through cycle_node is retraced and returned.
+        """
+        queue = collections.deque(nodes)
+        queued = set(nodes)
+        check_interval = len(self.graph)
+        relaxations = 0
+        while queue:
+            node = queue.popleft()
+            queued.remove(node)
+            for neighbor, data in self.graph[node].items():
+                if self.distance_to[node] + data['weight'] < self.distance_to[neighbor]:
+                    self.distance_to[neighbor] = self.distance_to[node] + data['weight']
+                    self.predecessor_to[neighbor] = node
+                    if neighbor == cycle_node:
+                        return self._retrace_cycle_through(cycle_node)
+
+                    relaxations += 1
+                    # a negative cycle keeps the queue from emptying. the predecessor graph can close it before the
+                    # distance to cycle_node improves, as cycle_node keeps its old predecessor until then.
+                    if relaxations % check_interval == 0 and self._predecessor_cycle_exists():
+                        if cycle_node is not None:
+                            cycle = self._retrace_cycle_through(cycle_node)
+                            if cycle is not None:
+                                return cycle
+                        adapter.debug('Stopped propagating at a cycle which does not contain the updated edge',
+                                      relaxations=relaxations)
+                        return None
+
+                    if neighbor not in queued:
+                        queue.append(neighbor)
+                        queued.add(neighbor)
+        return None
+
+    def _retrace_cycle_through(self, node):
+        cycle = [node]
+        prior_node = self.predecessor_to[node]
+        while prior_node != node:
+            # the predecessors of node do not lead back to node
+            if prior_node is None or prior_node in cycle:
+                return None
+            cycle.insert(0, prior_node)
+            prior_node = self.predecessor_to[prior_node]
+        cycle.insert(0, node)
+
+        # guard against cycles which were only found because of floating point error
+        if sum(self.graph[cycle[i]][cycle[i + 1]]['weight'] for i in range(len(cycle) - 1)) >= 0:
+            return None
+        return cycle
+
+    def _repair_subtree(self, root):
+        """
+        Resets the distances of root and its descendants in the shortest-path tree and recomputes them from edges
+        entering the subtree.
+        """
+        children = collections.defaultdict(list)
+        for node, predecessor in self.predecessor_to.items():
+            if predecessor is not None:
+                children[predecessor].append(node)
+
+        subtree = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node in subtree:
+                continue
+            subtree.add(node)
+            stack.extend(children[node])
+
+        for node in subtree:
+            self.distance_to[node] = float('Inf')
+            self.predecessor_to[node] = None
+        if self.source in subtree:
+            self.distance_to[self.source] = 0
+
+        for node in subtree:
+            for predecessor, data in self.graph.pred[node].items():
+                if predecessor in subtree:
+                    continue
+                if self.distance_to[predecessor] + data['weight'] < self.distance_to[node]:
+                    self.distance_to[node] = self.distance_to[predecessor] + data['weight']
+                    self.predecessor_to[node] = predecessor
+
+        self._propagate(list(subtree))
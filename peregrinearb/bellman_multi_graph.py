@@ -1,7 +1,10 @@
+import math
 import networkx as nx
-from .bellmannx import NegativeWeightFinder
-from .utils import get_least_edge_in_bunch
+from .bellmannx import NegativeWeightFinder, bellman_ford
+from .utils import get_least_edge_in_bunch, default_metrics
 __all__ = [
+    'BestEdgeIndex',
+    'MultiExchangeGraph',
     'NegativeWeightFinderMulti',
     'bellman_ford_multi',
 ]
@@ -16,13 +19,14 @@ class NegativeWeightFinderMulti(NegativeWeightFinder):
     def bellman_ford(self, source='BTC', unique_paths=True):
         self.initialize(source)
 
-        # on first iteration, load market prices.
-        self._first_iteration()
+        with default_metrics.time('relaxation'):
+            # on first iteration, load market prices.
+            self._first_iteration()
 
-        # After len(graph) - 1 passes, algorithm is complete.
-        for i in range(1, len(self.graph) - 1):
-            for edge in self.new_graph.edges(data=True):
-                self.relax(edge)
+            # After len(graph) - 1 passes, algorithm is complete.
+            for i in range(1, len(self.graph) - 1):
+                for edge in self.new_graph.edges(data=True):
+                    self.relax(edge)
 
         for edge in self.new_graph.edges(data=True):
             # todo: does this indicate that there is a negative cycle beginning and ending with edge[1]? or just that
@@ -40,7 +44,7 @@ class NegativeWeightFinderMulti(NegativeWeightFinder):
         is why in bellman_ford, there are only len(self.graph) - 1 iterations of relaxing the edges. (The first
         iteration is completed in the method.)
         """
-        [self._process_edge_bunch(edge_bunch) for edge_bunch in self.graph.edge_bunches(data=True)]
+        [self._process_edge_bunch(edge_bunch) for edge_bunch in _edge_bunches(self.graph)]
 
     def _process_edge_bunch(self, edge_bunch):
         ideal_edge = get_least_edge_in_bunch(edge_bunch)
@@ -56,6 +60,193 @@ class NegativeWeightFinderMulti(NegativeWeightFinder):
             self.predecessor_to[edge_bunch[1]] = edge_bunch[0]
 
 
+def _edge_bunches(graph: nx.MultiDiGraph):
+    """
+    Yields each edge bunch of graph as a 3-tuple (u, v, d) where d is a list of the data dicts of the edges from u to v.
+    """
+    for u, neighbors in graph.adjacency():
+        for v, edges in neighbors.items():
+            yield u, v, list(edges.values())
+
+
+class BestEdgeIndex:
+
+    def __init__(self, weight='weight'):
+        """
+        Keeps every quote (parallel edge) from u to v, keyed by a name such as the exchange which gives the quote, and a
+        DiGraph, self.graph, with only the least-weighted quote of each (u, v). Updating or removing a quote only
+        compares the quotes of its own (u, v), so that self.graph does not have to be rebuilt from every edge bunch
+        when one exchange's prices change.
+        """
+        self.weight = weight
+        self.quotes = {}
+        self.best_keys = {}
+        self.graph = nx.DiGraph()
+
+    @classmethod
+    def from_multi_graph(cls, graph: nx.MultiDiGraph, key='exchange_name', weight='weight'):
+        """
+        Returns a BestEdgeIndex of the edges of graph, each of which is keyed by its attribute key.
+        """
+        index = cls(weight)
+        for u, v, data in graph.edges(data=True):
+            index.update(u, v, data[key], **data)
+        return index
+
+    def update(self, u, v, key, **data):
+        """
+        Sets the quote named key from u to v to data, which must include self.weight. Returns True if the best edge from
+        u to v changed.
+        """
+        self.quotes.setdefault((u, v), {})[key] = data
+        return self._refresh(u, v)
+
+    def remove(self, u, v, key):
+        """
+        Removes the quote named key from u to v, if it exists. Returns True if the best edge from u to v changed.
+        """
+        quotes = self.quotes.get((u, v))
+        if not quotes or key not in quotes:
+            return False
+        del quotes[key]
+        return self._refresh(u, v)
+
+    def best(self, u, v):
+        """
+        Returns a 2-tuple of (key, data) of the best quote from u to v, or (None, None) if there is none.
+        """
+        key = self.best_keys.get((u, v))
+        if key is None:
+            return None, None
+        return key, self.quotes[(u, v)][key]
+
+    def _refresh(self, u, v):
+        quotes = self.quotes.get((u, v))
+        previous_key = self.best_keys.get((u, v))
+        previous_weight = self.graph[u][v][self.weight] if previous_key is not None else None
+        if not quotes:
+            self.quotes.pop((u, v), None)
+            self.best_keys.pop((u, v), None)
+            if previous_key is None:
+                return False
+            self.graph.remove_edge(u, v)
+            return True
+
+        key, data = min(quotes.items(), key=lambda item: item[1][self.weight])
+        self.best_keys[(u, v)] = key
+        self.graph.add_edge(u, v)
+        edge = self.graph[u][v]
+        edge.clear()
+        edge.update(data)
+        return key != previous_key or data[self.weight] != previous_weight
+
+
+class MultiExchangeGraph:
+
+    def __init__(self, transfers=False):
+        """
+        A graph of the markets of several exchanges on which multi-exchange arbitrage opportunities are found with the
+        Bellman-Ford algorithm on a DiGraph, kept up to date in a BestEdgeIndex as quotes change.
+
+        If not transfers, the nodes are currencies and each edge is the best quote among all exchanges (as with
+        bellman_ford_multi), which assumes that funds are held on every exchange. If transfers, the nodes are
+        (exchange name, currency) 2-tuples, so every exchange's markets are kept apart, and cycles which span exchanges
+        must pass through transfer edges added with add_transfer.
+
+        Each market edge has the attributes weight (-log of the fee-adjusted rate), depth, market_name, exchange_name,
+        trade_type, fee and no_fee_rate, like the edges of load_exchange_graph with depth. Edges whose volume is not
+        known (including transfer edges) have an unbounded depth of -inf.
+        """
+        self.transfers = transfers
+        self.index = BestEdgeIndex()
+
+    @property
+    def graph(self) -> nx.DiGraph:
+        return self.index.graph
+
+    def node(self, exchange_name, currency):
+        """
+        Returns the node of currency on the exchange named exchange_name.
+        """
+        if self.transfers:
+            return exchange_name, currency
+        return currency
+
+    def update_market(self, exchange_name, market_name, bid, ask, fee=0.0, bid_volume=None, ask_volume=None):
+        """
+        Sets the quotes of market_name on the exchange named exchange_name. If either price is missing (None or 0),
+        the market's quotes are removed. Returns the set of (u, v) whose best edge changed.
+
+        :param bid_volume: Optional. The volume (in base currency) at the bid. If None, the depth is unbounded.
+        :param ask_volume: Optional. The volume (in base currency) at the ask. If None, the depth is unbounded.
+        """
+        if not bid or not ask:
+            return self.remove_market(exchange_name, market_name)
+        base_currency, quote_currency = market_name.split('/')
+        base = self.node(exchange_name, base_currency)
+        quote = self.node(exchange_name, quote_currency)
+        fee_scalar = 1 - fee
+        # as with load_exchange_graph, depth is in terms of each edge's tail currency
+        sell_depth = -math.log(bid_volume) if bid_volume else -math.inf
+        buy_depth = -math.log(ask_volume * ask) if ask_volume else -math.inf
+
+        changed = set()
+        if self.index.update(base, quote, exchange_name, weight=-math.log(fee_scalar * bid), depth=sell_depth,
+                             market_name=market_name, exchange_name=exchange_name, trade_type='SELL', fee=fee,
+                             no_fee_rate=bid):
+            changed.add((base, quote))
+        if self.index.update(quote, base, exchange_name, weight=-math.log(fee_scalar / ask), depth=buy_depth,
+                             market_name=market_name, exchange_name=exchange_name, trade_type='BUY', fee=fee,
+                             no_fee_rate=ask):
+            changed.add((quote, base))
+        return changed
+
+    def update_tickers(self, exchange_name, tickers, fee=0.0):
+        """
+        Calls update_market for each ticker in tickers, a dict of tickers as returned by fetch_tickers. Markets which
+        are not formatted as base/quote are skipped. Returns the set of (u, v) whose best edge changed.
+        """
+        changed = set()
+        for market_name, ticker in tickers.items():
+            if market_name.count('/') != 1:
+                continue
+            changed |= self.update_market(exchange_name, market_name, ticker.get('bid'), ticker.get('ask'), fee,
+                                          ticker.get('bidVolume'), ticker.get('askVolume'))
+        return changed
+
+    def remove_market(self, exchange_name, market_name):
+        base_currency, quote_currency = market_name.split('/')
+        base = self.node(exchange_name, base_currency)
+        quote = self.node(exchange_name, quote_currency)
+        changed = set()
+        if self.index.remove(base, quote, exchange_name):
+            changed.add((base, quote))
+        if self.index.remove(quote, base, exchange_name):
+            changed.add((quote, base))
+        return changed
+
+    def add_transfer(self, currency, from_exchange, to_exchange, cost=0.0):
+        """
+        Adds an edge for transferring currency from the exchange named from_exchange to the exchange named to_exchange,
+        where cost is the fraction of the amount transferred which is lost (e.g. to withdrawal fees). Any amount can be
+        transferred, so the edge's depth is unbounded.
+        """
+        if not self.transfers:
+            raise ValueError('Transfer edges require a MultiExchangeGraph created with transfers=True.')
+        u = self.node(from_exchange, currency)
+        v = self.node(to_exchange, currency)
+        self.index.update(u, v, 'transfer', weight=-math.log(1 - cost), depth=-math.inf, market_name=None,
+                          exchange_name=from_exchange, to_exchange=to_exchange, trade_type='TRANSFER', fee=cost,
+                          no_fee_rate=1)
+        return {(u, v)}
+
+    def bellman_ford(self, source, unique_paths=True, relaxation='full'):
+        """
+        Yields the negative cycles reachable from source (a node of self.graph). Look at bellman_ford in bellmannx.
+        """
+        return bellman_ford(self.graph, source, unique_paths, relaxation=relaxation)
+
+
 def bellman_ford_multi(graph: nx.MultiGraph, source, unique_paths=True):
     """
     Returns a 2-tuple containing the graph with most negative weights in every edge bunch and a generator which iterates
@@ -1,12 +1,23 @@
+import collections
+import heapq
+import itertools
 import math
+import time
 import networkx as nx
-from .utils import last_index_in_list, load_exchange_graph
+import numpy as np
+from .depth import size_cycle
+from .utils import last_index_in_list, load_exchange_graph, CompiledGraph, default_metrics
 from .utils.logging_utils import FormatForLogAdapter
 import logging
 __all__ = [
     'NegativeWeightFinder',
     'NegativeWeightDepthFinder',
+    'NegativeWeightCurveFinder',
+    'CompiledNegativeWeightFinder',
+    'CompiledNegativeWeightDepthFinder',
     'bellman_ford',
+    'find_cycles_through_edge',
+    'enumerate_profitable_cycles',
     'find_opportunities_on_exchange',
     'calculate_profit_ratio_for_path',
     'get_starting_volume',
@@ -15,6 +26,8 @@ __all__ = [
 
 adapter = FormatForLogAdapter(logging.getLogger('peregrinearb.bellmannx'))
 
+RELAXATION_STRATEGIES = ('full', 'early_exit', 'spfa')
+
 
 class NegativeWeightFinder:
     __slots__ = ['graph', 'predecessor_to', 'distance_to', 'seen_nodes']
@@ -45,7 +58,7 @@ class NegativeWeightFinder:
         # The distance from any node to (itself) == 0
         self.distance_to[source] = 0
 
-    def bellman_ford(self, source='BTC', unique_paths=True):
+    def bellman_ford(self, source='BTC', unique_paths=True, relaxation='full'):
         """
         Finds arbitrage opportunities in self.graph and yields them
 
@@ -58,37 +71,110 @@ class NegativeWeightFinder:
             reached from any other via only a few trades.
         unique_paths : bool
             unique_paths: If True, each opportunity is not yielded more than once
+        relaxation : str
+            How edges are relaxed before negative cycles are searched for. One of
+            'full': len(self.graph) - 1 passes over every edge.
+            'early_exit': like 'full', but stops after the first pass which does not update any distance.
+            'spfa': relaxes only the outgoing edges of nodes whose distance changed (the Shortest Path Faster
+            Algorithm), stopping as soon as a cycle appears in self.predecessor_to.
         :return: a generator of profitable (negatively-weighted) arbitrage paths in self.graph
         """
+        if relaxation not in RELAXATION_STRATEGIES:
+            raise ValueError('relaxation must be one of {}, not {}'.format(RELAXATION_STRATEGIES, relaxation))
+
         adapter.info('Running bellman_ford')
         self.initialize(source)
 
-        adapter.debug('Relaxing edges')
+        exchange_name = self.graph.graph.get('exchange_name')
+        adapter.debug('Relaxing edges', relaxation=relaxation)
+        with default_metrics.time('relaxation', exchange=exchange_name):
+            if relaxation == 'spfa':
+                self._relax_edges_spfa(source)
+            else:
+                self._relax_edges(early_exit=relaxation == 'early_exit')
+        adapter.debug('Finished relaxing edges')
+
+        for node in self._negative_cycle_heads():
+            if unique_paths and node in self.seen_nodes:
+                continue
+            with default_metrics.time('retrace', exchange=exchange_name):
+                path = self._retrace_negative_cycle(node, unique_paths)
+            if path is None or path == (None, None):
+                continue
+            yield path
+
+        adapter.info('Ran bellman_ford')
+
+    def _relax_edges(self, early_exit=False):
         # After len(graph) - 1 passes, algorithm is complete.
         for i in range(len(self.graph) - 1):
+            updated = False
             # for each node in the graph, test if the distance to each of its siblings is shorter by going from
             # source->base_currency + base_currency->quote_currency
             for edge in self.graph.edges(data=True):
-                self.relax(edge)
-        adapter.debug('Finished relaxing edges')
-
+                if self.relax(edge):
+                    updated = True
+            # if no distance changed during this pass, no distance will change during any later pass.
+            if early_exit and not updated:
+                adapter.debug('Distances settled', passes=i + 1)
+                return
+
+    def _relax_edges_spfa(self, source):
+        if source not in self.graph:
+            return
+
+        queue = collections.deque([source])
+        queued = {source}
+        # how many relaxations to make between each search for a cycle in self.predecessor_to
+        check_interval = len(self.graph)
+        relaxations = 0
+        while queue:
+            node = queue.popleft()
+            queued.remove(node)
+            for neighbor, data in self.graph[node].items():
+                if self.distance_to[node] + data['weight'] < self.distance_to[neighbor]:
+                    self.distance_to[neighbor] = self.distance_to[node] + data['weight']
+                    self.predecessor_to[neighbor] = node
+
+                    relaxations += 1
+                    # with a negative cycle, the queue never empties. any cycle in the predecessor graph is negative.
+                    if relaxations % check_interval == 0 and self._predecessor_cycle_exists():
+                        adapter.debug('Found cycle in predecessor graph', relaxations=relaxations)
+                        return
+
+                    if neighbor not in queued:
+                        queue.append(neighbor)
+                        queued.add(neighbor)
+
+    def _predecessor_cycle_exists(self):
+        # the node from whose walk each node was first visited
+        visited_from = {}
+        for node in self.predecessor_to:
+            current = node
+            while current is not None and current not in visited_from:
+                visited_from[current] = node
+                current = self.predecessor_to[current]
+            # the walk from node reached a node it had already visited
+            if current is not None and visited_from[current] == node:
+                return True
+        return False
+
+    def _negative_cycle_heads(self):
+        """
+        Yields the head node of each edge which can still be relaxed after _relax_edges. A negative cycle is reachable
+        from each of these nodes through self.predecessor_to.
+        """
         for edge in self.graph.edges(data=True):
             if self.distance_to[edge[0]] + edge[2]['weight'] < self.distance_to[edge[1]]:
-                if unique_paths and edge[1] in self.seen_nodes:
-                    continue
-                path = self._retrace_negative_cycle(edge[1], unique_paths)
-                if path is None or path == (None, None):
-                    continue
-                yield path
-
-        adapter.info('Ran bellman_ford')
+                yield edge[1]
 
     def relax(self, edge):
         if self.distance_to[edge[0]] + edge[2]['weight'] < self.distance_to[edge[1]]:
             self.distance_to[edge[1]] = self.distance_to[edge[0]] + edge[2]['weight']
             self.predecessor_to[edge[1]] = edge[0]
+            return True
 
-        return True
+        return False
 
     def _retrace_negative_cycle(self, start, unique_paths):
         """
@@ -111,6 +197,10 @@ class NegativeWeightFinder:
         prior_node = start
         while True:
             prior_node = self.predecessor_to[prior_node]
+            # if the predecessors of start lead back to source instead of to a cycle
+            if prior_node is None:
+                return None
+
             # if negative cycle is complete
             if prior_node in arbitrage_loop:
                 arbitrage_loop = arbitrage_loop[:last_index_in_list(arbitrage_loop, prior_node) + 1]
@@ -152,6 +242,8 @@ class NegativeWeightDepthFinder(NegativeWeightFinder):
         """
         arbitrage_loop = [start]
         prior_node = self.predecessor_to[arbitrage_loop[0]]
+        if prior_node is None:
+            return None, None
         # the minimum weight which can be transferred without being limited by edge depths
         minimum = self.graph[prior_node][arbitrage_loop[0]]['depth']
         arbitrage_loop.insert(0, prior_node)
@@ -161,6 +253,9 @@ class NegativeWeightDepthFinder(NegativeWeightFinder):
             self.seen_nodes.add(prior_node)
 
             prior_node = self.predecessor_to[arbitrage_loop[0]]
+            # if the predecessors of start lead back to source instead of to a cycle
+            if prior_node is None:
+                return None, None
             edge_weight = self.graph[prior_node][arbitrage_loop[0]]['weight']
             edge_depth = self.graph[prior_node][arbitrage_loop[0]]['depth']
             # if minimum is the limiting volume
@@ -179,18 +274,289 @@ class NegativeWeightDepthFinder(NegativeWeightFinder):
             arbitrage_loop.insert(0, prior_node)
 
 
-def bellman_ford(graph, source='BTC', unique_paths=True, depth=False):
+class NegativeWeightCurveFinder(NegativeWeightFinder):
+
+    def _retrace_negative_cycle(self, start, unique_paths):
+        """
+        Retraces an arbitrage opportunity (negative cycle) which a currency can reach and sizes it along the 'curve'
+        attributes of its edges (look at load_exchange_graph's levels parameter and size_cycle), so that the volume
+        reflects every order book level in the graph rather than only the best.
+
+        Returns a 2-tuple of the opportunity and the amount of its first currency which maximizes its profit, or
+        (None, None) like NegativeWeightDepthFinder. The volume is 0 if the opportunity is not profitable once sized.
+        """
+        arbitrage_loop = super(NegativeWeightCurveFinder, self)._retrace_negative_cycle(start, unique_paths)
+        if arbitrage_loop is None:
+            return None, None
+        return arbitrage_loop, size_cycle(self.graph, arbitrage_loop)['volume']
+
+
+class CompiledNegativeWeightFinder(NegativeWeightFinder):
+    __slots__ = ['compiled', '_distance', '_predecessor']
+
+    def __init__(self, graph, compiled: CompiledGraph = None):
+        """
+        A NegativeWeightFinder which relaxes the edges of a CompiledGraph in vectorized passes. If a negative cycle is
+        reachable from source, the edges are relaxed again in NegativeWeightFinder's order, so that the same paths are
+        yielded as by NegativeWeightFinder.
+
+        :param graph: A DiGraph or a CompiledGraph
+        :param compiled: Optional. A CompiledGraph of graph. Pass one to reuse a snapshot across several searches; if
+        None, graph is compiled when the finder is created (unless it is a CompiledGraph).
+        """
+        super(CompiledNegativeWeightFinder, self).__init__(graph)
+        if compiled is None:
+            compiled = graph if isinstance(graph, CompiledGraph) else CompiledGraph(graph)
+        self.compiled = compiled
+        self._distance = None
+        self._predecessor = None
+
+    def reset_all_but_graph(self):
+        """
+        Call this to look for opportunities after updating the graph. This recompiles the graph unless it is a
+        CompiledGraph.
+        """
+        super(CompiledNegativeWeightFinder, self).reset_all_but_graph()
+        if not isinstance(self.graph, CompiledGraph):
+            self.compiled = CompiledGraph(self.graph)
+
+    def initialize(self, source):
+        self._distance = np.full(len(self.compiled), np.inf)
+        self._predecessor = np.full(len(self.compiled), -1, dtype=np.intp)
+        if source in self.compiled:
+            self._distance[self.compiled.node_index[source]] = 0
+
+    def _relax_edges(self, early_exit=False):
+        initial_distance = self._distance.copy()
+        initial_predecessor = self._predecessor.copy()
+        # Unless a negative cycle is reachable from source, the vectorized passes settle within len(graph) - 1 passes
+        # on the same distances as the in-place passes of NegativeWeightFinder, and no cycle is retraced.
+        for i in range(len(self.compiled) - 1):
+            if self.compiled.relax(self._distance, self._predecessor) == 0:
+                adapter.debug('Distances settled', passes=i + 1)
+                break
+
+        if len(self.compiled.relaxable_edges(self._distance)):
+            # Which cycles are retraced depends on the predecessor graph, which a vectorized pass builds differently
+            # from an in-place pass. Relax again with NegativeWeightFinder's passes so that the same paths are found.
+            adapter.debug('Found negative cycle, relaxing in edge order')
+            self._distance = initial_distance
+            self._predecessor = initial_predecessor
+            self.compiled.relax_in_order(self._distance, self._predecessor, len(self.compiled) - 1, early_exit)
+
+        # _retrace_negative_cycle walks the predecessor dict, which only has to be built once per search
+        nodes = self.compiled.nodes
+        self.distance_to = dict(zip(nodes, self._distance.tolist()))
+        self.predecessor_to = {node: nodes[p] if p >= 0 else None
+                               for node, p in zip(nodes, self._predecessor.tolist())}
+
+    def _relax_edges_spfa(self, source):
+        raise ValueError("The compiled engine relaxes edges in vectorized passes; use relaxation='early_exit' instead "
+                         "of 'spfa'.")
+
+    def _negative_cycle_heads(self):
+        for i in self.compiled.relaxable_edges(self._distance):
+            yield self.compiled.nodes[self.compiled.dst[i]]
+
+
+class CompiledNegativeWeightDepthFinder(CompiledNegativeWeightFinder, NegativeWeightDepthFinder):
+    pass
+
+
+class CompiledNegativeWeightCurveFinder(CompiledNegativeWeightFinder, NegativeWeightCurveFinder):
+    pass
+
+
+def bellman_ford(graph, source='BTC', unique_paths=True, depth=False, compiled=False, relaxation='full'):
     """
     Look at the docstring of the bellman_ford method in the NegativeWeightFinder class. (This is a static wrapper
     function.)
 
     If depth is true, yields all negatively weighted paths (accounting for depth) when starting with a weight of
-    starting_amount.
+    starting_amount. If depth is 'curve', graph's edges must have 'curve' attributes (look at load_exchange_graph's
+    levels parameter) and each path is yielded with the starting amount which maximizes its profit across every order
+    book level in graph; with compiled, graph must then be a DiGraph.
+
+    If compiled is true, graph is frozen into a CompiledGraph and its edges are relaxed in vectorized passes. This is
+    considerably faster for large graphs in which no negative cycle is reachable from source; otherwise the edges are
+    relaxed again in edge order, so the same paths are yielded as without compiled. compiled may also be a
+    CompiledGraph of graph to reuse. If graph is itself a CompiledGraph, the compiled engine is always used.
+
+    relaxation selects how edges are relaxed: 'full', 'early_exit' or 'spfa'. Look at the docstring of
+    NegativeWeightFinder.bellman_ford. The compiled engine supports 'full' and 'early_exit'.
     """
+    if compiled is True or isinstance(compiled, CompiledGraph) or isinstance(graph, CompiledGraph):
+        compiled_graph = compiled if isinstance(compiled, CompiledGraph) else None
+        if depth == 'curve':
+            return CompiledNegativeWeightCurveFinder(graph, compiled_graph).bellman_ford(source, unique_paths,
+                                                                                         relaxation)
+        if depth:
+            return CompiledNegativeWeightDepthFinder(graph, compiled_graph).bellman_ford(source, unique_paths,
+                                                                                         relaxation)
+        return CompiledNegativeWeightFinder(graph, compiled_graph).bellman_ford(source, unique_paths, relaxation)
+
+    if depth == 'curve':
+        return NegativeWeightCurveFinder(graph).bellman_ford(source, unique_paths, relaxation)
     if depth:
-        return NegativeWeightDepthFinder(graph).bellman_ford(source, unique_paths)
+        return NegativeWeightDepthFinder(graph).bellman_ford(source, unique_paths, relaxation)
     else:
-        return NegativeWeightFinder(graph).bellman_ford(source, unique_paths)
+        return NegativeWeightFinder(graph).bellman_ford(source, unique_paths, relaxation)
+
+
+def find_cycles_through_edge(graph, u, v, max_len=4):
+    """
+    Finds the most negative cycle of at most max_len edges which contains the edge from u to v. Only cycles through
+    this edge can become profitable when its weight decreases, so this is much cheaper than running bellman_ford over
+    all of graph after a single market changes (e.g. when wss_update_graph returns True).
+
+    The search is bidirectional: the best walks of each length out of v are extended forwards and the best walks of
+    each length into u are extended backwards until they meet. Walks which visit a currency twice are discarded, so
+    a simple cycle which is not the best walk of its length on either side may be missed.
+
+    Returns
+    -------
+    2-tuple
+        [0] : list
+            The cycle, starting and ending with u, with v as its second node. None if there is no negative cycle of at
+            most max_len edges through the edge.
+        [1] : float
+            The cycle's profit ratio as calculated by calculate_profit_ratio_for_path. None if [0] is None.
+    """
+    if max_len < 2:
+        raise ValueError('max_len must be at least 2, not {}'.format(max_len))
+
+    edge_weight = graph[u][v]['weight']
+    # the path from v back to u has max_len - 1 edges. split them between the two searches.
+    forward_hops = max_len // 2
+    backward_hops = max_len - 1 - forward_hops
+    forward_layers = _walk_layers(graph.succ, v, forward_hops, {u, v})
+    backward_layers = _walk_layers(graph.pred, u, backward_hops, {u, v})
+
+    candidates = []
+    for forward_hop, forward_layer in enumerate(forward_layers):
+        for backward_hop, backward_layer in enumerate(backward_layers):
+            if forward_hop + backward_hop == 0:
+                continue
+            for node, (forward_distance, prior) in forward_layer.items():
+                if node in backward_layer:
+                    total = edge_weight + forward_distance + backward_layer[node][0]
+                    if total < 0:
+                        candidates.append((total, forward_hop, backward_hop, node))
+
+    candidates.sort(key=lambda candidate: candidate[0])
+    for total, forward_hop, backward_hop, node in candidates:
+        forward_walk = _retrace_walk(forward_layers, forward_hop, node)
+        backward_walk = _retrace_walk(backward_layers, backward_hop, node)
+        # forward_walk goes from v to node and backward_walk from u back to node
+        path = [u] + forward_walk + backward_walk[-2::-1]
+        if len(set(path[:-1])) == len(path) - 1:
+            adapter.debug('Found cycle through edge', u=u, v=v, length=len(path) - 1)
+            return path, calculate_profit_ratio_for_path(graph, path)
+
+    return None, None
+
+
+def enumerate_profitable_cycles(graph, min_len=3, max_len=4, max_results=None, time_budget=None):
+    """
+    Finds every simple negative cycle with between min_len and max_len edges in graph. Unlike bellman_ford, which only
+    retraces the cycles left in its predecessor map, this also finds cycles which overlap one another.
+
+    Each cycle is found once, starting from its first node in the order of graph's nodes. A branch of the depth-first
+    search is pruned when its weight plus the least weight of any walk back to the starting currency in the remaining
+    number of edges is not negative.
+
+    :param max_results: Optional. If given, only the max_results most profitable cycles are kept.
+    :param time_budget: Optional. A number of seconds after which the search stops and the cycles found so far are
+    returned.
+    :return: A list of 2-tuples of each cycle and its profit ratio (as calculated by calculate_profit_ratio_for_path),
+    ordered from most to least profitable.
+    """
+    if min_len < 2 or max_len < min_len:
+        raise ValueError('min_len must be at least 2 and at most max_len. min_len: {}, max_len: {}'
+                         .format(min_len, max_len))
+
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    index = {node: i for i, node in enumerate(graph)}
+    # a heap of (-weight, count, path) so that the least profitable cycle kept is popped first
+    found = []
+    # breaks ties in found so that paths are never compared
+    counter = itertools.count()
+    expansions = 0
+
+    for start in graph:
+        start_index = index[start]
+        layers = _walk_layers(graph.pred, start, max_len - 1, {start})
+        # bounds[r][node] is the least weight of a walk of between 1 and r edges from node to start
+        bounds = [{}]
+        for layer in layers[1:]:
+            bound = dict(bounds[-1])
+            for node, (weight, prior) in layer.items():
+                if weight < bound.get(node, float('Inf')):
+                    bound[node] = weight
+            bounds.append(bound)
+
+        stack = [(start, 0, (start,))]
+        while stack:
+            node, weight, path = stack.pop()
+
+            expansions += 1
+            if deadline is not None and expansions % 1000 == 0 and time.monotonic() > deadline:
+                adapter.info('Time budget exhausted', cycleCount=len(found), expansions=expansions)
+                return _rank_cycles(graph, found)
+
+            for neighbor, data in graph[node].items():
+                total = weight + data['weight']
+                if neighbor == start:
+                    if len(path) >= min_len and total < 0:
+                        heapq.heappush(found, (-total, next(counter), path + (start,)))
+                        if max_results is not None and len(found) > max_results:
+                            heapq.heappop(found)
+                    continue
+
+                # the edges which would remain for returning to start after moving to neighbor
+                remaining = max_len - len(path)
+                if remaining < 1 or index[neighbor] < start_index or neighbor in path:
+                    continue
+                if total + bounds[remaining].get(neighbor, float('Inf')) >= 0:
+                    continue
+                stack.append((neighbor, total, path + (neighbor,)))
+
+    return _rank_cycles(graph, found)
+
+
+def _rank_cycles(graph, found):
+    cycles = [list(path) for negative_weight, count, path in sorted(found, reverse=True)]
+    return [(path, calculate_profit_ratio_for_path(graph, path)) for path in cycles]
+
+
+def _walk_layers(adjacency, start, hops, excluded):
+    """
+    Returns a list of hops + 1 dicts. The dict at index h maps each node which can be reached by a walk of exactly h
+    edges from start (along adjacency) to a 2-tuple of the least weight of such a walk and the node before it in the
+    walk. Walks do not continue through nodes in excluded.
+    """
+    layers = [{start: (0, None)}]
+    for hop in range(hops):
+        layer = {}
+        for node, (distance, prior) in layers[-1].items():
+            if node in excluded and hop > 0:
+                continue
+            for neighbor, data in adjacency[node].items():
+                if neighbor == start:
+                    continue
+                weight = distance + data['weight']
+                if neighbor not in layer or weight < layer[neighbor][0]:
+                    layer[neighbor] = (weight, node)
+        layers.append(layer)
+    return layers
+
+
+def _retrace_walk(layers, hop, node):
+    walk = [node]
+    for h in range(hop, 0, -1):
+        node = layers[h][node][1]
+        walk.insert(0, node)
+    return walk
 
 
 async def find_opportunities_on_exchange(exchange_name, source='BTC', unique_paths=True, depth=False):
@@ -199,7 +565,7 @@ async def find_opportunities_on_exchange(exchange_name, source='BTC', unique_pat
 
 
 def get_starting_volume(graph, path):
-    adapter.info('Gathering path data', path=str(path))
+    adapter.info('Gathering path data', path=path)
 
     volume_scalar = 1
     start = path[0]
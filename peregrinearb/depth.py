@@ -0,0 +1,141 @@
+import numpy as np
+__all__ = [
+    'book_levels',
+    'size_opportunity',
+    'rank_opportunities',
+    'conversion_curve',
+    'convert',
+    'size_cycle',
+]
+
+
+def book_levels(side, limit=None):
+    """
+    Returns a 2-tuple of float64 arrays (prices, sizes) of the levels of side, one side of a ccxt order book (a list of
+    [price, amount] lists, best first). Unknown amounts are taken as 0.
+
+    :param limit: Optional. The number of levels to keep.
+    """
+    if limit is not None:
+        side = side[:limit]
+    if len(side) == 0:
+        return np.empty(0), np.empty(0)
+    levels = np.asarray([level[:2] for level in side], dtype=float)
+    return levels[:, 0], np.nan_to_num(levels[:, 1])
+
+
+def size_opportunity(bids, asks, buy_fee=0.0, sell_fee=0.0):
+    """
+    Walks bids (the bids of the exchange on which to sell) and asks (the asks of the exchange on which to buy) level by
+    level and finds the largest volume for which each unit bought is sold at a profit after taker fees: the volume up
+    to which bid * (1 - sell_fee) > ask * (1 + buy_fee) for the marginal levels.
+
+    Returns a dict with the keys 'volume' (in the base currency), 'buy_price' and 'sell_price' (the volume-weighted
+    prices of the levels taken, before fees, or None if volume is 0), and 'profit' (in the quote currency, after fees).
+
+    :param bids: A list of [price, amount] levels, highest first, or a 2-tuple of arrays as returned by book_levels.
+    :param asks: A list of [price, amount] levels, lowest first, or a 2-tuple of arrays as returned by book_levels.
+    """
+    bid_prices, bid_sizes = bids if isinstance(bids, tuple) else book_levels(bids)
+    ask_prices, ask_sizes = asks if isinstance(asks, tuple) else book_levels(asks)
+    if len(bid_prices) == 0 or len(ask_prices) == 0:
+        return {'volume': 0.0, 'buy_price': None, 'sell_price': None, 'profit': 0.0}
+
+    cumulative_bids = np.cumsum(bid_sizes)
+    cumulative_asks = np.cumsum(ask_sizes)
+    max_volume = min(cumulative_bids[-1], cumulative_asks[-1])
+    # split [0, max_volume] into segments in each of which one bid level and one ask level are taken
+    ends = np.union1d(cumulative_bids, cumulative_asks)
+    ends = ends[(ends > 0) & (ends <= max_volume)]
+    starts = np.concatenate(([0.0], ends[:-1]))
+    bid_index = np.searchsorted(cumulative_bids, starts, side='right')
+    ask_index = np.searchsorted(cumulative_asks, starts, side='right')
+
+    # the marginal sell price only falls and the marginal buy price only rises, so the profitable segments are a prefix
+    profitable = bid_prices[bid_index] * (1 - sell_fee) > ask_prices[ask_index] * (1 + buy_fee)
+    segment_count = int(np.logical_and.accumulate(profitable).sum())
+    lengths = (ends - starts)[:segment_count]
+    volume = float(lengths.sum())
+    if volume == 0:
+        return {'volume': 0.0, 'buy_price': None, 'sell_price': None, 'profit': 0.0}
+
+    cost = float(np.dot(lengths, ask_prices[ask_index[:segment_count]]))
+    revenue = float(np.dot(lengths, bid_prices[bid_index[:segment_count]]))
+    return {
+        'volume': volume,
+        'buy_price': cost / volume,
+        'sell_price': revenue / volume,
+        'profit': revenue * (1 - sell_fee) - cost * (1 + buy_fee),
+    }
+
+
+def rank_opportunities(opportunities):
+    """
+    Returns opportunities (as yielded by SuperOpportunityFinder with depth=True) sorted by realizable profit, greatest
+    first. Opportunities which were not sized come last.
+    """
+    return sorted(opportunities, key=lambda opportunity: opportunity.get('depth', {}).get('profit', float('-Inf')),
+                  reverse=True)
+
+
+def conversion_curve(side, trade_type, fee=0.0, levels=None):
+    """
+    Returns the piecewise-linear curve of the amount of one currency received for an amount of another currency traded
+    through the levels of side, one side of a ccxt order book, after a taker fee of fee.
+
+    The curve is a 2-tuple of float64 arrays (inputs, outputs), both starting at 0, of the cumulative amounts traded and
+    received at the end of each level. For 'SELL' (side is the bids) the input is the base currency and the output the
+    quote currency; for 'BUY' (side is the asks) the input is the quote currency and the output the base currency.
+
+    :param levels: Optional. The number of levels from which to build the curve.
+    """
+    prices, sizes = book_levels(side, levels)
+    if trade_type == 'SELL':
+        inputs = sizes
+        outputs = sizes * prices * (1 - fee)
+    else:
+        inputs = sizes * prices
+        outputs = sizes * (1 - fee)
+    return np.concatenate(([0.0], np.cumsum(inputs))), np.concatenate(([0.0], np.cumsum(outputs)))
+
+
+def convert(curve, amounts):
+    """
+    Returns the amount received for each amount in amounts (a number or an array) traded along curve. Only the curve's
+    total input can be traded; any amount beyond it is not converted.
+    """
+    inputs, outputs = curve
+    return np.interp(amounts, inputs, outputs)
+
+
+def size_cycle(graph, path, iterations=12, points=17):
+    """
+    Finds the starting amount of path[0] which maximizes the profit of trading along path (a cycle in graph whose edges
+    have a 'curve' attribute, as returned by conversion_curve). Because each curve is concave, so is the profit; the
+    search evaluates points evenly spaced amounts at once and narrows to the neighbours of the best one, iterations
+    times.
+
+    Returns a dict with the keys 'volume' (the starting amount), 'output' (the amount of path[0] at the end of path) and
+    'profit' (output - volume). All are 0 if no starting amount is profitable.
+    """
+    curves = [graph[path[i]][path[i + 1]]['curve'] for i in range(len(path) - 1)]
+
+    def outputs_for(amounts):
+        for curve in curves:
+            amounts = convert(curve, amounts)
+        return amounts
+
+    low, high = 0.0, float(curves[0][0][-1])
+    best = 0.0
+    for i in range(iterations):
+        amounts = np.linspace(low, high, points)
+        profits = outputs_for(amounts) - amounts
+        best_index = int(np.argmax(profits))
+        best = amounts[best_index]
+        low = amounts[max(best_index - 1, 0)]
+        high = amounts[min(best_index + 1, points - 1)]
+
+    output = float(outputs_for(best))
+    if output <= best:
+        return {'volume': 0.0, 'output': 0.0, 'profit': 0.0}
+    return {'volume': float(best), 'output': output, 'profit': output - float(best)}
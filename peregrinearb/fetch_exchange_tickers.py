@@ -11,12 +11,18 @@ logger = logging.getLogger('peregrinearb.fetch_exchange_tickers')
 
 class BulkTickerFetcher:
 
-    def __init__(self, exchange_names, name=True, invocation_count=0):
+    def __init__(self, exchange_names, name=True, invocation_count=0, pool=None):
         """
         This could be used for when data is needed for both inter and intra exchange opportunity-finding to avoid
-        pinging APIs twice for the same data.
+        pinging APIs twice for the same data. SnapshotPipeline does so and derives graphs and spreads from the tickers.
+
+        :param pool: Optional. An ExchangePool from which to take the exchanges (given as names). Their connections are
+        not closed after fetching.
         """
-        if name:
+        self.pool = pool
+        if pool is not None:
+            self.exchanges = [pool.get(exchange_name) for exchange_name in exchange_names]
+        elif name:
             self.exchanges = [getattr(ccxt, exchange_name)() for exchange_name in exchange_names]
         else:
             self.exchanges = exchange_names
@@ -25,18 +31,18 @@ class BulkTickerFetcher:
 
     async def fetch_exchange_tickers(self):
         logger.info('Fetching exchange tickers')
-        tasks = [self._fetch_exchange_tickers(exchange) for exchange in self.exchanges]
-        await asyncio.wait(tasks)
+        await asyncio.gather(*[self._fetch_exchange_tickers(exchange) for exchange in self.exchanges])
         logger.info('Fetched exchange tickers')
         return self.ticker_dicts
 
     async def _fetch_exchange_tickers(self, exchange):
         logger.info('Exchange#{} - Fetching tickers'.format(exchange.id))
         self.ticker_dicts[exchange.id] = await exchange.fetch_tickers()
-        await exchange.close()
+        if self.pool is None:
+            await exchange.close()
         logger.info('Exchange#{} - Fetched tickers'.format(exchange.id))
 
 
-async def fetch_exchange_tickers(exchange_names, name=True, count=0):
-    fetcher = BulkTickerFetcher(exchange_names, name=name, invocation_count=count)
+async def fetch_exchange_tickers(exchange_names, name=True, count=0, pool=None):
+    fetcher = BulkTickerFetcher(exchange_names, name=name, invocation_count=count, pool=pool)
     return await fetcher.fetch_exchange_tickers()
@@ -13,8 +13,13 @@ __all__ = [
 
 class ExchangeMultiGraphBuilder:
 
-    def __init__(self, exchanges: list):
+    def __init__(self, exchanges: list, pool=None):
+        """
+        :param pool: Optional. An ExchangePool from which to take the exchanges, so that markets already loaded by the
+        pool are not downloaded again.
+        """
         self.exchanges = exchanges
+        self.pool = pool
         self.graph = nx.MultiGraph()
 
     async def build_multi_graph(self, write=False, ccxt_errors=True):
@@ -32,11 +37,19 @@ class ExchangeMultiGraphBuilder:
         :param ccxt_errors: if true, raises errors ccxt raises when calling load_markets. The common ones are
         RequestTimeout and ExchangeNotAvailable, which are caused by problems with exchanges' APIs.
         """
-        exchange = getattr(ccxt, exchange_name)()
-        if ccxt_errors:
+        if self.pool is not None:
+            try:
+                exchange = await self.pool.load(exchange_name)
+            except ccxt.BaseError:
+                if ccxt_errors:
+                    raise
+                return
+        elif ccxt_errors:
+            exchange = getattr(ccxt, exchange_name)()
             await exchange.load_markets()
             await exchange.close()
         else:
+            exchange = getattr(ccxt, exchange_name)()
             try:
                 await exchange.load_markets()
                 await exchange.close()
@@ -54,13 +67,13 @@ class ExchangeMultiGraphBuilder:
                 pass
 
 
-async def build_multi_graph_for_exchanges(exchanges: list, **kwargs):
+async def build_multi_graph_for_exchanges(exchanges: list, pool=None, **kwargs):
     """
     A wrapper function for the usage of the ExchangeMultiGraphBuilder class which returns a dict as specified in the
     docstring of __init__ in ExchangeMultiGraphBuilder.
     :param exchanges: A list of exchanges (e.g. ['bittrex', 'poloniex', 'bitstamp', 'anxpro']
     """
-    return await ExchangeMultiGraphBuilder(exchanges).build_multi_graph(**kwargs)
+    return await ExchangeMultiGraphBuilder(exchanges, pool=pool).build_multi_graph(**kwargs)
 
 
 async def build_arbitrage_graph_for_exchanges(exchanges: list):
@@ -0,0 +1,111 @@
+import asyncio
+import concurrent.futures
+import logging
+import ccxt.async_support as ccxt
+from .bellmannx import bellman_ford
+from .utils import CompiledGraph, load_exchange_graph
+from .utils.logging_utils import FormatForLogAdapter
+__all__ = [
+    'ParallelScanner',
+]
+
+adapter = FormatForLogAdapter(logging.getLogger('peregrinearb.parallel'))
+
+
+def _scan(compiled, source, unique_paths, depth, relaxation):
+    """
+    Runs in a worker process. Returns the list of opportunities which bellman_ford yields for compiled.
+    """
+    return list(bellman_ford(compiled, source, unique_paths, depth=depth, relaxation=relaxation))
+
+
+class ParallelScanner:
+
+    def __init__(self, max_workers=None, mp_context=None):
+        """
+        Searches exchange graphs for negative cycles in a ProcessPoolExecutor of persistent worker processes, so that
+        several graphs are searched at once on all cores and the event loop stays free to fetch the next tick.
+
+        Each graph is sent to a worker as a compact snapshot (a pickled CompiledGraph) and searched with the compiled
+        engine. Searches are awaitable asyncio futures. Close the scanner (or use it as a context manager) when finished
+        with it to stop the workers.
+
+        :param max_workers: Optional. The number of worker processes. Defaults to the number of processors.
+        :param mp_context: Optional. The multiprocessing context with which the workers are started.
+        """
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers, mp_context)
+
+    def submit(self, graph, source='BTC', unique_paths=True, depth=False, relaxation='full') -> asyncio.Future:
+        """
+        Returns an asyncio future of the list of opportunities in graph, as yielded by bellman_ford(graph, source,
+        unique_paths, depth, relaxation=relaxation). The workers use the compiled engine, which yields the same paths.
+
+        :param graph: A DiGraph or a CompiledGraph, e.g. as returned by load_exchange_graph(..., compact=True). A
+        DiGraph is compiled before it is sent, so later changes to it do not affect the search.
+        """
+        if depth == 'curve':
+            raise ValueError("Graphs with depth='curve' cannot be compiled and so cannot be scanned in parallel.")
+        compiled = graph if isinstance(graph, CompiledGraph) else CompiledGraph(graph)
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self.executor, _scan, compiled, source, unique_paths, depth, relaxation)
+
+    async def scan(self, graphs, source='BTC', unique_paths=True, depth=False, relaxation='full'):
+        """
+        Searches every graph in graphs (a dict keyed by name, e.g. exchange id, and valued by graph) in parallel and
+        returns a dict keyed by the same names and valued by each graph's list of opportunities. Look at submit.
+        """
+        names = list(graphs)
+        results = await asyncio.gather(*[self.submit(graphs[name], source, unique_paths, depth, relaxation)
+                                         for name in names])
+        return dict(zip(names, results))
+
+    async def scan_exchanges(self, exchanges, source='BTC', unique_paths=True, depth=False, relaxation='full',
+                             fees=True, pool=None, metadata_cache=None):
+        """
+        An async generator which loads the compact graph of each exchange in exchanges concurrently on the event loop,
+        submits each to the workers as soon as it is loaded and yields a 3-tuple of (exchange id, graph, list of
+        opportunities) for each exchange as its search finishes. Exchanges whose graph could not be loaded because of
+        a ccxt error are skipped.
+
+        :param pool: Optional. An ExchangePool from which to take the exchanges. Look at load_exchange_graph.
+        :param metadata_cache: Optional. A MetadataCache from which the exchanges' fees are read.
+        """
+        async def load_and_scan(exchange_id):
+            try:
+                graph = await load_exchange_graph(exchange_id, fees=fees, depth=depth, compact=True, pool=pool,
+                                                  metadata_cache=metadata_cache)
+            except ccxt.BaseError as e:
+                adapter.warning('Could not load graph, exchange will be skipped', exchange=exchange_id,
+                                error=type(e).__name__)
+                return None
+            return exchange_id, graph, await self.submit(graph, source, unique_paths, depth, relaxation)
+
+        futures = [asyncio.ensure_future(load_and_scan(exchange_id)) for exchange_id in exchanges]
+        try:
+            for future in asyncio.as_completed(futures):
+                result = await future
+                if result is not None:
+                    yield result
+        finally:
+            # if the generator is closed early, stop loading the remaining exchanges
+            for future in futures:
+                future.cancel()
+            await asyncio.gather(*futures, return_exceptions=True)
+
+    def close(self):
+        """
+        Waits for submitted searches to finish and stops the workers.
+        """
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,135 @@
+import collections
+import numpy as np
+__all__ = [
+    'PriceMatrix',
+    'Spreads',
+    'compute_spreads',
+]
+
+
+# each field except markets is a NumPy array with one element per market. the exchange fields are indices into
+# PriceMatrix.exchanges, or -1 if no exchange has a bid (or ask) for the market.
+Spreads = collections.namedtuple('Spreads', ['markets', 'best_bid', 'best_bid_exchange', 'best_bid_volume',
+                                             'best_ask', 'best_ask_exchange', 'best_ask_volume', 'spread',
+                                             'notional'])
+
+
+class PriceMatrix:
+
+    def __init__(self, markets, exchanges):
+        """
+        A columnar snapshot of the best bid and ask of each market on each exchange. bid, ask, bid_volume and
+        ask_volume are float64 arrays of shape (len(markets), len(exchanges)) in which row i holds markets[i] and column
+        j holds exchanges[j]. A market which is not traded (or has no price) on an exchange is NaN.
+        """
+        self.markets = list(markets)
+        self.exchanges = list(exchanges)
+        self.market_index = {market_name: i for i, market_name in enumerate(self.markets)}
+        self.exchange_index = {exchange_name: j for j, exchange_name in enumerate(self.exchanges)}
+        shape = (len(self.markets), len(self.exchanges))
+        self.bid = np.full(shape, np.nan)
+        self.ask = np.full(shape, np.nan)
+        self.bid_volume = np.full(shape, np.nan)
+        self.ask_volume = np.full(shape, np.nan)
+
+    @classmethod
+    def from_tickers(cls, ticker_dicts, markets=None):
+        """
+        :param ticker_dicts: A dict keyed by exchange id and valued by a dict of tickers as returned by ccxt's
+        fetch_tickers (e.g. the return value of BulkTickerFetcher.fetch_exchange_tickers)
+        :param markets: Optional. The markets (rows) of the matrix. If None, every market in ticker_dicts.
+        """
+        matrix = cls(_markets_of(ticker_dicts, markets), ticker_dicts.keys())
+        for exchange_name, tickers in ticker_dicts.items():
+            for market_name, ticker in tickers.items():
+                if market_name in matrix.market_index:
+                    matrix.set_quote(market_name, exchange_name, ticker.get('bid'), ticker.get('ask'),
+                                     ticker.get('bidVolume'), ticker.get('askVolume'))
+        return matrix
+
+    @classmethod
+    def from_order_books(cls, order_books, markets=None):
+        """
+        :param order_books: A dict keyed by exchange id and valued by a dict keyed by market name and valued by order
+        book, as returned by SuperOpportunityFinder.fetch_snapshot
+        :param markets: Optional. The markets (rows) of the matrix. If None, every market in order_books.
+        """
+        matrix = cls(_markets_of(order_books, markets), order_books.keys())
+        for exchange_name, books in order_books.items():
+            for market_name, order_book in books.items():
+                if market_name in matrix.market_index:
+                    matrix.set_order_book(market_name, exchange_name, order_book)
+        return matrix
+
+    def set_quote(self, market_name, exchange_name, bid, ask, bid_volume=None, ask_volume=None):
+        """
+        Sets the best bid and ask (and their volumes) of market_name on exchange_name. None is stored as NaN.
+        """
+        i = self.market_index[market_name]
+        j = self.exchange_index[exchange_name]
+        self.bid[i, j] = np.nan if bid is None else bid
+        self.ask[i, j] = np.nan if ask is None else ask
+        self.bid_volume[i, j] = np.nan if bid_volume is None else bid_volume
+        self.ask_volume[i, j] = np.nan if ask_volume is None else ask_volume
+
+    def set_order_book(self, market_name, exchange_name, order_book):
+        """
+        Sets the quote of market_name on exchange_name to the top level of each side of order_book. An empty side is
+        stored as NaN.
+        """
+        bids = order_book['bids']
+        asks = order_book['asks']
+        self.set_quote(market_name, exchange_name,
+                       bids[0][0] if bids else None, asks[0][0] if asks else None,
+                       bids[0][1] if bids else None, asks[0][1] if asks else None)
+
+    def spreads(self):
+        return compute_spreads(self)
+
+
+def _markets_of(nested, markets):
+    if markets is not None:
+        return markets
+    # every market in the order in which it first appears
+    return list(dict.fromkeys(market_name for values in nested.values() for market_name in values))
+
+
+def compute_spreads(matrix: PriceMatrix) -> Spreads:
+    """
+    Finds, for every market of matrix at once, the greatest bid and the least ask and the exchanges which hold them.
+    Ties are broken in favor of the exchange which comes first in matrix.exchanges.
+
+    spread is best_bid / best_ask - 1, and notional is the value (in the quote currency) which could be bought at the
+    best ask and sold at the best bid: min(best_bid_volume, best_ask_volume) * best_ask. Both are NaN for markets
+    without a bid or an ask, as is notional if a volume is unknown.
+    """
+    market_count = len(matrix.markets)
+    if market_count == 0 or len(matrix.exchanges) == 0:
+        empty = np.full(market_count, np.nan)
+        no_exchange = np.full(market_count, -1, dtype=np.intp)
+        return Spreads(matrix.markets, empty, no_exchange, empty, empty, no_exchange, empty, empty, empty)
+
+    rows = np.arange(market_count)
+    bids = np.where(np.isnan(matrix.bid), -np.inf, matrix.bid)
+    asks = np.where(np.isnan(matrix.ask), np.inf, matrix.ask)
+
+    best_bid_exchange = np.argmax(bids, axis=1)
+    best_ask_exchange = np.argmin(asks, axis=1)
+    best_bid = bids[rows, best_bid_exchange]
+    best_ask = asks[rows, best_ask_exchange]
+    has_bid = np.isfinite(best_bid)
+    has_ask = np.isfinite(best_ask)
+
+    best_bid_volume = np.where(has_bid, matrix.bid_volume[rows, best_bid_exchange], np.nan)
+    best_ask_volume = np.where(has_ask, matrix.ask_volume[rows, best_ask_exchange], np.nan)
+    best_bid = np.where(has_bid, best_bid, np.nan)
+    best_ask = np.where(has_ask, best_ask, np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spread = best_bid / best_ask - 1
+    notional = np.minimum(best_bid_volume, best_ask_volume) * best_ask
+
+    return Spreads(matrix.markets,
+                   best_bid, np.where(has_bid, best_bid_exchange, -1), best_bid_volume,
+                   best_ask, np.where(has_ask, best_ask_exchange, -1), best_ask_volume,
+                   spread, notional)
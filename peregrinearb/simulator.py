@@ -0,0 +1,320 @@
+import asyncio
+import collections
+import datetime
+import math
+import random
+import time
+import networkx as nx
+import ccxt.async_support as ccxt
+from .utils import multi_digraph_from_tickers
+from .utils.single_exchange import edges_from_ticker
+__all__ = [
+    'SimulatedExchange',
+    'constant_latency',
+    'lognormal_latency',
+    'simulated_exchanges',
+    'synthetic_graph',
+    'synthetic_multi_graph',
+    'synthetic_tickers',
+    'synthetic_universe',
+]
+
+
+def constant_latency(seconds):
+    """
+    Returns a latency distribution (a function of a random.Random) which is always seconds.
+    """
+    return lambda rng: seconds
+
+
+def lognormal_latency(median, sigma=0.5):
+    """
+    Returns a log-normal latency distribution with the given median (in seconds). Larger sigmas give longer tails.
+    """
+    mu = math.log(median)
+    return lambda rng: rng.lognormvariate(mu, sigma)
+
+
+def synthetic_universe(currency_count, market_count=None, quote_count=3, seed=None):
+    """
+    Returns a dict keyed by market name and valued by mid price. The currencies are named CUR0, CUR1, ... and the
+    first quote_count of them are the quote currencies. Each currency is given a random value and each market's price
+    is its base currency's value divided by its quote currency's, so the prices are consistent with each other and the
+    universe has no arbitrage opportunities until the prices are perturbed (look at simulated_exchanges).
+
+    :param market_count: Optional. The number of markets, chosen at random from every pair of a currency and a quote
+    currency. If None, every such pair is a market.
+    """
+    rng = random.Random(seed)
+    currencies = ['CUR{}'.format(i) for i in range(currency_count)]
+    values = {currency: rng.lognormvariate(0, 2) for currency in currencies}
+    quotes = currencies[:quote_count]
+    pairs = [(base, quote) for quote in quotes for base in currencies
+             # each pair of quote currencies is listed once
+             if base != quote and not (base in quotes and quotes.index(base) < quotes.index(quote))]
+    if market_count is not None:
+        pairs = rng.sample(pairs, min(market_count, len(pairs)))
+    return {'{}/{}'.format(base, quote): values[base] / values[quote] for base, quote in pairs}
+
+
+def simulated_exchanges(count, currency_count=20, market_count=None, price_noise=0.002, seed=None, **kwargs):
+    """
+    Returns a list of count SimulatedExchanges, named simulated0, simulated1, ..., which list the markets of the same
+    synthetic universe at prices which differ by a relative standard deviation of price_noise, so that inter-exchange
+    and (within each exchange) triangular opportunities exist. kwargs are passed to each SimulatedExchange.
+    """
+    rng = random.Random(seed)
+    universe = synthetic_universe(currency_count, market_count, seed=rng.random())
+    exchanges = []
+    for i in range(count):
+        prices = {market_name: price * (1 + rng.gauss(0, price_noise)) for market_name, price in universe.items()}
+        exchanges.append(SimulatedExchange('simulated{}'.format(i), prices, seed=rng.random(), **kwargs))
+    return exchanges
+
+
+def synthetic_tickers(currency_count, density=1.0, negative_cycles=0, quote_count=3, spread=0.001, volume=1.0,
+                      margin=0.01, seed=None):
+    """
+    Returns a 2-tuple of a dict of tickers, as returned by fetch_tickers, of the markets of a synthetic_universe and a
+    list of the negative cycles planted in them.
+
+    Without planted cycles the tickers have no arbitrage opportunities. Each planted cycle is a triangle
+    [quote, base, other quote, quote]: the prices of the market base/other quote are raised by margin so that buying
+    base with quote, selling it for other quote and converting other quote back to quote is profitable.
+
+    :param density: The fraction of every pair of a currency and a quote currency which is a market. The markets
+    between quote currencies are always listed.
+    :param negative_cycles: The number of negative cycles to plant. Each uses a different base currency.
+    :param spread: The relative difference between each market's ask and bid.
+    :param volume: The bid and ask volume of every market.
+    :param margin: The relative amount by which the prices of a planted cycle's market are raised. It must be greater
+    than about 1.5 times spread (plus any fees) for the cycle to be negative.
+    """
+    rng = random.Random(seed)
+    universe = synthetic_universe(currency_count, quote_count=quote_count, seed=rng.random())
+    quotes = ['CUR{}'.format(i) for i in range(min(quote_count, currency_count))]
+    quote_markets = [market_name for market_name in universe if market_name.split('/')[0] in quotes]
+    other_markets = [market_name for market_name in universe if market_name.split('/')[0] not in quotes]
+    markets = quote_markets + rng.sample(other_markets, int(round(density * len(other_markets))))
+    prices = {market_name: universe[market_name] for market_name in markets}
+
+    quotes_by_base = collections.defaultdict(list)
+    for market_name in prices:
+        base, quote = market_name.split('/')
+        if base not in quotes:
+            quotes_by_base[base].append(quote)
+    candidates = sorted(base for base, base_quotes in quotes_by_base.items() if len(base_quotes) > 1)
+    if negative_cycles > len(candidates):
+        raise ValueError('Only {} negative cycles can be planted in {} markets of {} currencies, not {}.'.format(
+            len(candidates), len(prices), currency_count, negative_cycles))
+
+    cycles = []
+    for base in rng.sample(candidates, negative_cycles):
+        quote, other_quote = rng.sample(quotes_by_base[base], 2)
+        prices['{}/{}'.format(base, other_quote)] *= 1 + margin
+        cycles.append([quote, base, other_quote, quote])
+
+    tickers = {market_name: {'symbol': market_name, 'bid': price * (1 - spread / 2), 'ask': price * (1 + spread / 2),
+                             'bidVolume': volume, 'askVolume': volume}
+               for market_name, price in prices.items()}
+    return tickers, cycles
+
+
+def synthetic_graph(currency_count, density=1.0, negative_cycles=0, fee=0.0, depth=False, seed=None, **kwargs):
+    """
+    Returns a log-weighted DiGraph of a synthetic exchange, with the same edge attributes as a graph returned by
+    load_exchange_graph, for testing and benchmarking the algorithms at any scale. The graph has a node for each of
+    the (up to currency_count) currencies which are listed in a market and the planted negative cycles are listed in
+    graph.graph['planted_cycles']. Look at synthetic_tickers, to which kwargs are passed, for an explanation of the
+    other parameters.
+
+    :param fee: The taker fee of every market
+    :param depth: If True, each edge also has 'depth' and 'volume' attributes.
+    """
+    tickers, cycles = synthetic_tickers(currency_count, density, negative_cycles, seed=seed, **kwargs)
+    graph = nx.DiGraph(exchange_name='synthetic', planted_cycles=cycles)
+    for market_name, ticker in tickers.items():
+        graph.add_edges_from(edges_from_ticker(market_name, ticker, fee, suppress=[], depth=depth))
+    return graph
+
+
+def synthetic_multi_graph(currency_count, exchange_count, density=1.0, negative_cycles=0, price_noise=0.0, seed=None,
+                          **kwargs):
+    """
+    Returns a log-weighted MultiDiGraph, as returned by create_weighted_multi_exchange_digraph, of exchange_count
+    synthetic exchanges which list the same markets at prices which differ by a relative standard deviation of
+    price_noise. Each planted negative cycle is planted on one exchange; the cycles are listed in
+    graph.graph['planted_cycles']. Look at synthetic_tickers, to which kwargs are passed.
+    """
+    rng = random.Random(seed)
+    tickers_seed = rng.random()
+    # with the same seed, the tickers only differ in the markets raised to plant the cycles
+    tickers, _ = synthetic_tickers(currency_count, density, seed=tickers_seed, **kwargs)
+    planted_tickers, cycles = synthetic_tickers(currency_count, density, negative_cycles, seed=tickers_seed, **kwargs)
+    planted_markets = [market_name for market_name, ticker in planted_tickers.items()
+                       if ticker['bid'] != tickers[market_name]['bid']]
+
+    ticker_dicts = {}
+    for i in range(exchange_count):
+        exchange_tickers = {}
+        for market_name, ticker in tickers.items():
+            noise = 1 + rng.gauss(0, price_noise) if price_noise else 1
+            exchange_tickers[market_name] = dict(ticker, bid=ticker['bid'] * noise, ask=ticker['ask'] * noise)
+        ticker_dicts['synthetic{}'.format(i)] = exchange_tickers
+    for market_name in planted_markets:
+        ticker_dicts['synthetic{}'.format(rng.randrange(exchange_count))][market_name] = planted_tickers[market_name]
+
+    graph = multi_digraph_from_tickers(ticker_dicts)
+    graph.graph['planted_cycles'] = cycles
+    return graph
+
+
+class SimulatedExchange(ccxt.Exchange):
+
+    def __init__(self, exchange_id='simulated', universe=None, latency=None, error_rates=None, rate_limit=10,
+                 enforce_rate_limit=False, spread=0.001, levels=10, level_volume=1.0, volatility=0.0, taker=0.001,
+                 fetch_tickers=True, fetch_order_books=False, seed=None):
+        """
+        An in-process ccxt async Exchange which serves synthetic markets, tickers and order books without a network,
+        so that the async pipeline can be run and timed offline and reproducibly. It implements load_markets,
+        fetch_tickers, fetch_ticker, fetch_order_book, fetch_order_books and close.
+
+        Every request waits for a latency drawn from latency and may then raise an injected error. The number of
+        requests of each method, the errors raised and every latency are recorded in self.request_counts,
+        self.error_counts and self.latencies.
+
+        :param universe: A dict keyed by market name and valued by mid price, such as is returned by synthetic_universe.
+        :param latency: Optional. A function of a random.Random which returns a request's latency in seconds (look at
+        constant_latency and lognormal_latency). If None, requests do not wait.
+        :param error_rates: Optional. A dict keyed by the name of a ccxt error (e.g. 'RequestTimeout',
+        'ExchangeNotAvailable' or 'DDoSProtection') and valued by the probability with which each request raises it.
+        :param rate_limit: The exchange's rateLimit, in milliseconds between requests.
+        :param enforce_rate_limit: If True, a request made less than rate_limit milliseconds after the previous one
+        raises DDoSProtection.
+        :param spread: The relative difference between each market's ask and bid.
+        :param levels: The number of levels on each side of an order book.
+        :param level_volume: The volume of the best level on each side. Each level has level_volume more than the last.
+        :param volatility: The standard deviation of the relative change of a market's price each time it is fetched.
+        :param taker: The taker (and maker) fee of every market.
+        :param fetch_tickers: Whether the exchange supports fetch_tickers.
+        :param fetch_order_books: Whether the exchange supports fetch_order_books.
+        :param seed: Optional. The seed of the random number generator from which latencies, errors and price changes
+        are drawn.
+        """
+        super(SimulatedExchange, self).__init__()
+        if universe is None:
+            universe = synthetic_universe(10, seed=seed)
+        if error_rates is None:
+            error_rates = {}
+        self.id = exchange_id
+        self.name = exchange_id
+        self.rateLimit = rate_limit
+        self.has = dict(self.has, fetchTickers=fetch_tickers, fetchOrderBooks=fetch_order_books, fetchTicker=True,
+                        fetchOrderBook=True)
+        self.prices = dict(universe)
+        self.latency = latency
+        self.error_rates = error_rates
+        self.enforce_rate_limit = enforce_rate_limit
+        self.spread = spread
+        self.levels = levels
+        self.level_volume = level_volume
+        self.volatility = volatility
+        self.taker = taker
+        self.rng = random.Random(seed)
+
+        self.request_counts = collections.Counter()
+        self.error_counts = collections.Counter()
+        self.latencies = []
+        self.close_count = 0
+        self._last_request = None
+
+    async def load_markets(self, reload=False, params={}):
+        await self._request('load_markets')
+        if not self.markets or reload:
+            self.set_markets([self._market_structure(market_name) for market_name in self.prices])
+        return self.markets
+
+    async def fetch_ticker(self, symbol, params={}):
+        await self._request('fetch_ticker')
+        return self._ticker(symbol)
+
+    async def fetch_tickers(self, symbols=None, params={}):
+        if not self.has['fetchTickers']:
+            raise ccxt.NotSupported('{} fetch_tickers() is not supported'.format(self.id))
+        await self._request('fetch_tickers')
+        return {symbol: self._ticker(symbol) for symbol in self._symbols(symbols)}
+
+    async def fetch_order_book(self, symbol, limit=None, params={}):
+        await self._request('fetch_order_book')
+        return self._order_book(symbol, limit)
+
+    async def fetch_order_books(self, symbols=None, limit=None, params={}):
+        if not self.has['fetchOrderBooks']:
+            raise ccxt.NotSupported('{} fetch_order_books() is not supported'.format(self.id))
+        await self._request('fetch_order_books')
+        return {symbol: self._order_book(symbol, limit) for symbol in self._symbols(symbols)}
+
+    async def close(self):
+        self.close_count += 1
+
+    async def _request(self, method):
+        self.request_counts[method] += 1
+        now = time.monotonic()
+        too_soon = self._last_request is not None and now - self._last_request < self.rateLimit / 1000
+        self._last_request = now
+        if self.enforce_rate_limit and too_soon:
+            self.error_counts['DDoSProtection'] += 1
+            raise ccxt.DDoSProtection('{} rate limit exceeded'.format(self.id))
+
+        latency = self.latency(self.rng) if self.latency is not None else 0
+        self.latencies.append(latency)
+        await asyncio.sleep(latency)
+
+        for error_name, rate in self.error_rates.items():
+            if self.rng.random() < rate:
+                self.error_counts[error_name] += 1
+                raise getattr(ccxt, error_name)('{} simulated {}'.format(self.id, error_name))
+
+    def _symbols(self, symbols):
+        if symbols is None:
+            return list(self.prices)
+        return [symbol for symbol in symbols if symbol in self.prices]
+
+    def _price(self, symbol):
+        if symbol not in self.prices:
+            raise ccxt.BadSymbol('{} does not have market symbol {}'.format(self.id, symbol))
+        if self.volatility:
+            self.prices[symbol] *= math.exp(self.rng.gauss(0, self.volatility))
+        return self.prices[symbol]
+
+    def _ticker(self, symbol):
+        price = self._price(symbol)
+        timestamp = int(time.time() * 1000)
+        return {
+            'symbol': symbol,
+            'timestamp': timestamp,
+            'datetime': datetime.datetime.fromtimestamp(timestamp / 1000, tz=datetime.timezone.utc).isoformat(),
+            'bid': price * (1 - self.spread / 2),
+            'ask': price * (1 + self.spread / 2),
+            'bidVolume': self.level_volume,
+            'askVolume': self.level_volume,
+            'last': price,
+        }
+
+    def _order_book(self, symbol, limit=None):
+        price = self._price(symbol)
+        level_count = self.levels if limit is None else min(limit, self.levels)
+        step = price * self.spread / 2
+        return {
+            'symbol': symbol,
+            'bids': [[price - step * (i + 1), self.level_volume * (i + 1)] for i in range(level_count)],
+            'asks': [[price + step * (i + 1), self.level_volume * (i + 1)] for i in range(level_count)],
+            'timestamp': int(time.time() * 1000),
+            'nonce': None,
+        }
+
+    def _market_structure(self, market_name):
+        base, quote = market_name.split('/')
+        return {'id': base + quote, 'symbol': market_name, 'base': base, 'quote': quote, 'baseId': base,
+                'quoteId': quote, 'active': True, 'type': 'spot', 'spot': True, 'taker': self.taker,
+                'maker': self.taker}
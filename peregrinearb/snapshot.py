@@ -0,0 +1,181 @@
+import asyncio
+import datetime
+import logging
+import ccxt.async_support as ccxt
+from .price_matrix import PriceMatrix, compute_spreads
+from .utils import ExchangePool, RateLimiter, load_exchange_graph, multi_digraph_from_tickers
+from .utils.logging_utils import FormatForLogAdapter
+from .utils.single_exchange import get_taker_fee, load_exchange_markets
+__all__ = [
+    'TickerSnapshot',
+    'SnapshotPipeline',
+]
+
+adapter = FormatForLogAdapter(logging.getLogger('peregrinearb.snapshot'))
+
+
+class TickerSnapshot:
+
+    def __init__(self, ticker_dicts, timestamp=None):
+        """
+        The tickers of several exchanges fetched in the same tick.
+
+        :param ticker_dicts: A dict keyed by exchange id and valued by a dict of tickers as returned by fetch_tickers
+        :param timestamp: Optional. The datetime at which the tickers were fetched. Defaults to now.
+        """
+        self.ticker_dicts = ticker_dicts
+        if timestamp is None:
+            timestamp = datetime.datetime.now(tz=datetime.timezone.utc)
+        self.datetime = timestamp
+
+    @property
+    def exchanges(self):
+        return list(self.ticker_dicts)
+
+    def __getitem__(self, exchange_id):
+        return self.ticker_dicts[exchange_id]
+
+    def __contains__(self, exchange_id):
+        return exchange_id in self.ticker_dicts
+
+    def __len__(self):
+        return len(self.ticker_dicts)
+
+
+class SnapshotPipeline:
+
+    def __init__(self, exchanges, pool=None, metadata_cache=None, rate_limiter=None):
+        """
+        Fetches the tickers of every exchange in exchanges with one fetch_tickers request per exchange per tick and
+        derives every exchange's graph, the multi-exchange graph and the cross-exchange spreads from them, so that
+        intra- and inter-exchange scanning do not each request the same data.
+
+        The latest snapshot is kept in self.snapshot. Its tickers can also be passed to
+        SuperOpportunityFinder.opportunities_from_tickers.
+
+        :param exchanges: A list of exchange ids
+        :param pool: Optional. An ExchangePool from which to take the exchanges. If None, a new one is created; close
+        the pipeline when finished with it.
+        :param metadata_cache: Optional. A MetadataCache from which the exchanges' markets (and fees) are read.
+        :param rate_limiter: Optional. A RateLimiter through which the requests are made.
+        """
+        self.exchanges = list(exchanges)
+        self.owns_pool = pool is None
+        if pool is None:
+            pool = ExchangePool()
+        self.pool = pool
+        self.metadata_cache = metadata_cache
+        if rate_limiter is None:
+            rate_limiter = RateLimiter()
+        self.rate_limiter = rate_limiter
+        self.snapshot = None
+
+    async def fetch(self) -> TickerSnapshot:
+        """
+        Fetches the tickers of every exchange concurrently and stores them as self.snapshot. Exchanges whose request
+        raises a ccxt error are left out of the snapshot.
+        """
+        adapter.info('Fetching snapshot', exchangeCount=len(self.exchanges))
+        results = await asyncio.gather(*[self._fetch_tickers(exchange_id) for exchange_id in self.exchanges],
+                                       return_exceptions=True)
+        ticker_dicts = {}
+        for exchange_id, result in zip(self.exchanges, results):
+            if isinstance(result, ccxt.BaseError):
+                adapter.warning('Could not fetch tickers, exchange will be skipped', exchange=exchange_id,
+                                error=type(result).__name__)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                ticker_dicts[exchange_id] = result
+
+        self.snapshot = TickerSnapshot(ticker_dicts)
+        adapter.info('Fetched snapshot', exchangeCount=len(ticker_dicts))
+        return self.snapshot
+
+    async def exchange_graph(self, exchange_id, snapshot=None, **kwargs):
+        """
+        Returns the graph of exchange_id built from snapshot (by default self.snapshot). kwargs are passed to
+        load_exchange_graph.
+        """
+        snapshot = self._snapshot(snapshot)
+        return await load_exchange_graph(exchange_id, tickers=snapshot[exchange_id], pool=self.pool,
+                                         metadata_cache=self.metadata_cache, **kwargs)
+
+    async def exchange_graphs(self, snapshot=None, **kwargs):
+        """
+        Returns a dict keyed by exchange id and valued by the graph of each exchange in snapshot. Look at
+        exchange_graph.
+        """
+        snapshot = self._snapshot(snapshot)
+        graphs = await asyncio.gather(*[self.exchange_graph(exchange_id, snapshot, **kwargs)
+                                        for exchange_id in snapshot.exchanges])
+        return dict(zip(snapshot.exchanges, graphs))
+
+    async def multi_graph(self, snapshot=None, fees=False, log=True, suppress=None):
+        """
+        Returns a MultiDiGraph of every exchange's markets in snapshot, as with create_weighted_multi_exchange_digraph.
+        If fees, each market's taker fee is taken into account, as in exchange_graph.
+        """
+        snapshot = self._snapshot(snapshot)
+        exchange_fees = {}
+        if fees:
+            if suppress is None:
+                suppress = ['markets']
+            exchanges = [self.pool.get(exchange_id) for exchange_id in snapshot.exchanges]
+            await asyncio.gather(*[load_exchange_markets(exchange, self.pool, self.metadata_cache)
+                                   for exchange in exchanges])
+            for exchange in exchanges:
+                exchange_fees[exchange.id] = {market_name: get_taker_fee(exchange, market_name, suppress=suppress)
+                                              for market_name in snapshot[exchange.id]}
+        return multi_digraph_from_tickers(snapshot.ticker_dicts, fees=exchange_fees, log=log)
+
+    def spreads(self, snapshot=None, markets=None):
+        """
+        Returns the cross-exchange spreads of the markets in snapshot (or of markets), as returned by compute_spreads.
+        """
+        snapshot = self._snapshot(snapshot)
+        matrix = PriceMatrix.from_tickers(snapshot.ticker_dicts, markets)
+        return compute_spreads(matrix)
+
+    async def tick(self, graphs=True, multi_graph=True, spreads=True, fees=True, **graph_kwargs):
+        """
+        Fetches a new snapshot and derives from it everything which is requested. Returns a dict with the key
+        'snapshot' and, if requested, 'graphs' (look at exchange_graphs, to which graph_kwargs are passed),
+        'multi_graph' and 'spreads'.
+
+        :param fees: If fees should be taken into account for prices. Passed to both exchange_graphs and multi_graph,
+        which both use each market's taker fee, so that the graphs of a tick are weighted alike.
+        """
+        snapshot = await self.fetch()
+        result = {'snapshot': snapshot}
+        if graphs:
+            result['graphs'] = await self.exchange_graphs(snapshot, fees=fees, **graph_kwargs)
+        if multi_graph:
+            result['multi_graph'] = await self.multi_graph(snapshot, fees=fees, suppress=graph_kwargs.get('suppress'))
+        if spreads:
+            result['spreads'] = self.spreads(snapshot)
+        return result
+
+    async def close(self):
+        """
+        Closes the pool's exchanges if the pool was created by this pipeline.
+        """
+        if self.owns_pool:
+            await self.pool.close()
+
+    async def _fetch_tickers(self, exchange_id):
+        exchange = self.pool.get(exchange_id)
+        return await self.rate_limiter.call(exchange, 'fetch_tickers')
+
+    def _snapshot(self, snapshot):
+        if snapshot is not None:
+            return snapshot
+        if self.snapshot is None:
+            raise ValueError('No snapshot has been fetched. Call fetch first.')
+        return self.snapshot
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
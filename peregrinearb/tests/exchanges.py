@@ -0,0 +1,114 @@
+"""
+Fake exchanges shared by the test modules.
+"""
+import ccxt.async_support as ccxt
+import asyncio
+
+
+class TestExchange(ccxt.Exchange):
+    # not a test case, although test modules import it by this name
+    __test__ = False
+
+    def __init__(self, config={}, balances=None, name=None, tickers=None, symbols=None, markets=None, currencies=None,
+                 wait_time=0, wait_time_limit=0):
+        super(TestExchange, self).__init__()
+        if balances is None:
+            balances = {'free': {}}
+        if tickers is None:
+            tickers = {}
+        if symbols is None:
+            symbols = [key for key in tickers.keys()]
+        if markets is None:
+            markets = {}
+        if currencies is None:
+            currencies = []
+
+        self.currencies = currencies
+        self.markets = markets
+        self.symbols = symbols
+        self.currencies = currencies
+        self.balances = balances
+        self.id = name
+        self.orders = {}
+        self.wait_time = wait_time
+
+        # How many times fetch_order should be called before returning {'status': 'closed'}
+        self.wait_time_limit = wait_time_limit
+        self._wait_time_increment = 0
+
+    async def fetch_tickers(self, symbols=None, params={}):
+        return self.tickers
+
+    async def fetch_ticker(self, symbol, params={}):
+        return self.tickers[symbol]
+
+    async def load_markets(self, reload=False):
+        return self.markets
+
+    async def fetch_balance(self):
+        return self.balances
+
+    async def create_limit_buy_order(self, symbol, *args):
+        base, quote = symbol.split('/')
+        volume = min(self.balances['free'][quote], args[0] * args[1])
+
+        self.balances['free'][quote] -= volume * args[1]
+        if base in self.balances['free']:
+            self.balances['free'][base] += volume
+        else:
+            self.balances['free'][base] = volume
+
+        return {'id': 0}
+
+    async def create_limit_sell_order(self, symbol, *args):
+        base, quote = symbol.split('/')
+        volume = min(args[0], self.balances['free'][base])
+
+        self.balances['free'][base] -= volume
+        if quote in self.balances['free']:
+            self.balances['free'][quote] += volume * args[1]
+        else:
+            self.balances['free'][quote] = volume * args[1]
+
+        return {'id': 0}
+
+    async def fetch_order(self, id, symbol=None, params={}):
+        await asyncio.sleep(self.wait_time)
+        if self._wait_time_increment >= self.wait_time_limit:
+            self._wait_time_increment = 0
+            return {'status': 'closed'}
+
+        self._wait_time_increment += 1
+        return {'status': 'open'}
+
+    async def cancel_order(self, id, symbol=None, params={}):
+        raise ValueError('cancel_order not implemented')
+
+    async def close(self, *args):
+        return
+
+
+class OrderBookExchange(ccxt.Exchange):
+
+    def __init__(self, name, order_books, rate_limited_count=0):
+        """
+        :param order_books: A dict keyed by market name and valued by the order book fetch_order_book returns
+        :param rate_limited_count: The number of calls to fetch_order_book which raise DDoSProtection
+        """
+        super(OrderBookExchange, self).__init__()
+        self.id = name
+        self.rateLimit = 1
+        self.order_books = order_books
+        self.rate_limited_count = rate_limited_count
+        self.request_count = 0
+
+    async def fetch_order_book(self, symbol, limit=None, params={}):
+        self.request_count += 1
+        if self.request_count <= self.rate_limited_count:
+            raise ccxt.DDoSProtection('rate limited')
+        if symbol not in self.order_books:
+            raise ccxt.BadSymbol(symbol)
+        return self.order_books[symbol]
+
+    async def close(self):
+        return
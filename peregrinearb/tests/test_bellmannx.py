@@ -1,8 +1,10 @@
 import os
 from unittest import TestCase
 from peregrinearb import bellman_ford_multi, multi_digraph_from_json, multi_digraph_from_dict, \
-    calculate_profit_ratio_for_path, bellman_ford, NegativeWeightFinder, NegativeWeightDepthFinder
-from peregrinearb.bellmannx import get_starting_volume
+    calculate_profit_ratio_for_path, bellman_ford, NegativeWeightFinder, NegativeWeightDepthFinder, \
+    CompiledNegativeWeightDepthFinder, CompiledGraph, IncrementalNegativeWeightFinder, find_triangular_opportunities, \
+    BestEdgeIndex, MultiExchangeGraph
+from peregrinearb.bellmannx import get_starting_volume, find_cycles_through_edge, enumerate_profitable_cycles
 import json
 import networkx as nx
 import math
@@ -61,6 +63,15 @@ def build_graph_from_edge_list(edges, fee):
     return graph
 
 
+def rotate_cycle(path):
+    """
+    Returns the cycle path so that it starts and ends with its least node. Used to compare cycles which were retraced
+    starting from different nodes.
+    """
+    start = path.index(min(path[:-1]))
+    return path[start:-1] + path[:start + 1]
+
+
 class TestBellmanFordMultiGraph(TestCase):
 
     def test_path_beginning_equals_end(self):
@@ -87,6 +98,73 @@ class TestBellmanFordMultiGraph(TestCase):
                     self.assertGreaterEqual(ratio, 1.0)
 
 
+class TestMultiExchangeGraph(TestCase):
+
+    def test_best_edge_index(self):
+        index = BestEdgeIndex()
+        self.assertTrue(index.update('BTC', 'USD', 'a', weight=-2))
+        self.assertTrue(index.update('BTC', 'USD', 'b', weight=-3))
+        # a worse quote does not change the best edge
+        self.assertFalse(index.update('BTC', 'USD', 'a', weight=-2.5))
+        self.assertEqual(index.best('BTC', 'USD')[0], 'b')
+        self.assertEqual(index.graph['BTC']['USD']['weight'], -3)
+
+        self.assertTrue(index.remove('BTC', 'USD', 'b'))
+        self.assertEqual(index.graph['BTC']['USD']['weight'], -2.5)
+        self.assertTrue(index.remove('BTC', 'USD', 'a'))
+        self.assertFalse(index.graph.has_edge('BTC', 'USD'))
+        self.assertEqual(index.best('BTC', 'USD'), (None, None))
+
+    def test_from_multi_graph(self):
+        graph = nx.MultiDiGraph()
+        graph.add_edge('BTC', 'USD', exchange_name='a', weight=1)
+        graph.add_edge('BTC', 'USD', exchange_name='b', weight=0.5)
+        graph.add_edge('USD', 'BTC', exchange_name='a', weight=-0.1)
+        index = BestEdgeIndex.from_multi_graph(graph)
+        self.assertEqual(index.graph['BTC']['USD']['exchange_name'], 'b')
+        self.assertEqual(index.graph.number_of_edges(), 2)
+
+    def test_transfers(self):
+        graph = MultiExchangeGraph(transfers=True)
+        graph.update_market('a', 'BTC/USD', 6000, 6010)
+        graph.update_market('b', 'BTC/USD', 6200, 6210)
+        self.assertEqual(list(graph.bellman_ford(('a', 'USD'))), [])
+
+        graph.add_transfer('BTC', 'a', 'b', cost=0.001)
+        graph.add_transfer('USD', 'b', 'a', cost=0.001)
+        paths = [path for path in graph.bellman_ford(('a', 'USD')) if path]
+        self.assertEqual(len(paths), 1)
+        self.assertEqual(len(paths[0]), 5)
+        self.assertAlmostEqual(calculate_profit_ratio_for_path(graph.graph, paths[0]), 6200 / 6010 * 0.999 ** 2)
+
+        # only the edges of the changed market are updated
+        self.assertEqual(graph.update_market('b', 'BTC/USD', 5900, 5910), {(('b', 'BTC'), ('b', 'USD')),
+                                                                           (('b', 'USD'), ('b', 'BTC'))})
+        self.assertEqual([path for path in graph.bellman_ford(('a', 'USD')) if path], [])
+
+    def test_transfers_compiled_and_depth(self):
+        graph = MultiExchangeGraph(transfers=True)
+        graph.update_market('a', 'BTC/USD', 6000, 6010, bid_volume=2, ask_volume=0.5)
+        graph.update_market('b', 'BTC/USD', 6200, 6210, bid_volume=1, ask_volume=1)
+        graph.add_transfer('BTC', 'a', 'b', cost=0.001)
+        graph.add_transfer('USD', 'b', 'a', cost=0.001)
+
+        paths = [path for path in bellman_ford(graph.graph, ('a', 'USD'), compiled=True) if path]
+        self.assertEqual(len(paths), 1)
+        self.assertEqual(CompiledGraph(graph.graph)[('a', 'BTC')][('b', 'BTC')]['trade_type'], 'TRANSFER')
+
+        depth_paths = [path for path in bellman_ford(graph.graph, ('a', 'USD'), depth=True) if path]
+        self.assertEqual(len(depth_paths), 1)
+        path, volume = depth_paths[0]
+        self.assertEqual(path[0], ('b', 'BTC'))
+        # limited by the 0.5 BTC at a's ask, not by the (unbounded) transfers
+        self.assertAlmostEqual(volume, 0.5 * 6010 / (0.999 * 6200))
+
+        compiled_paths = [path for path in bellman_ford(graph.graph, ('a', 'USD'), depth=True, compiled=True) if path]
+        self.assertEqual(len(compiled_paths), 1)
+        self.assertEqual(set(compiled_paths[0][0]), set(path))
+
+
 class TestBellmannx(TestCase):
 
     def setUp(self):
@@ -304,6 +382,409 @@ class TestBellmannx(TestCase):
         self.assertEqual(path_count, 1)
 
 
+class TestRelaxationStrategies(TestCase):
+
+    def setUp(self):
+        self.edge_lists = [
+            [['A', 'B', 2, 3, 'SELL'], ['B', 'C', 3, 4, 'SELL'], ['C', 'A', 1 / 5, 14, 'SELL']],
+            [['A', 'B', 2, 3, 'SELL'], ['B', 'C', 3, 4, 'SELL'], ['C', 'D', 7, 10, 'SELL'], ['D', 'E', 5, 40, 'SELL'],
+             ['E', 'F', 1 / 5, 220, 'SELL'], ['F', 'G', 6, 40, 'SELL'], ['G', 'H', 1 / 20, 200, 'SELL'],
+             ['H', 'A', 1 / 2, 20, 'SELL']],
+            # no negative cycle
+            [['A', 'B', 2, 3, 'SELL'], ['B', 'C', 3, 4, 'SELL'], ['C', 'A', 1 / 7, 14, 'SELL']],
+        ]
+
+    def test_early_exit_same_output_as_full(self):
+        for edges in self.edge_lists:
+            graph = build_graph_from_edge_list(edges, 0.001)
+            for source in graph:
+                for depth in (False, True):
+                    expected = list(bellman_ford(graph, source, depth=depth))
+                    actual = list(bellman_ford(graph, source, depth=depth, relaxation='early_exit'))
+                    self.assertEqual(actual, expected)
+
+    def test_spfa_same_cycles_as_full(self):
+        """
+        SPFA stops as soon as it finds a cycle, so it may retrace a cycle starting from a different currency.
+        """
+        for edges in self.edge_lists:
+            graph = build_graph_from_edge_list(edges, 0.001)
+            for source in graph:
+                expected = [rotate_cycle(path) for path in bellman_ford(graph, source)]
+                actual = [rotate_cycle(path) for path in bellman_ford(graph, source, relaxation='spfa')]
+                self.assertEqual(actual, expected)
+
+                for path, volume in bellman_ford(graph, source, depth=True, relaxation='spfa'):
+                    ratio = calculate_profit_ratio_for_path(graph, path, depth=True, starting_amount=volume)
+                    self.assertAlmostEqual(ratio, calculate_profit_ratio_for_path(graph, path))
+
+    def test_compiled_early_exit(self):
+        for edges in self.edge_lists:
+            graph = build_graph_from_edge_list(edges, 0.001)
+            expected = list(bellman_ford(graph, 'A', compiled=True))
+            self.assertEqual(list(bellman_ford(graph, 'A', compiled=True, relaxation='early_exit')), expected)
+
+    def test_spfa_paths_are_negative(self):
+        node_count = 30
+        graph = nx.DiGraph()
+        for edge in nx.complete_graph(node_count).edges():
+            if random.random() < 2 / 3 and not (edge[0] == 0 or edge[1] == 0):
+                continue
+            random_weight = random.uniform(-10, 6)
+            graph.add_edge(edge[0], edge[1], weight=random_weight)
+            # the added cost keeps floating point error from making two-currency cycles appear negative
+            graph.add_edge(edge[1], edge[0], weight=-random_weight + 10 ** -3)
+
+        path_count = 0
+        for path in bellman_ford(graph, 0, relaxation='spfa'):
+            path_count += 1
+            self.assertEqual(path[0], path[-1])
+            self.assertLess(sum(graph[path[i]][path[i + 1]]['weight'] for i in range(len(path) - 1)), 0.0)
+        self.assertGreater(path_count, 0)
+
+    def test_invalid_relaxation(self):
+        with self.assertRaises(ValueError):
+            list(bellman_ford(nx.DiGraph(), 'A', relaxation='dijkstra'))
+
+
+class TestIncrementalNegativeWeightFinder(TestCase):
+
+    def setUp(self):
+        symbols = ['BTC/USD', 'ETH/USD', 'ETH/BTC', 'LTC/BTC', 'LTC/USD', 'ETH/LTC']
+        self.graph = nx.DiGraph()
+        for symbol in symbols:
+            wss_add_market(self.graph, symbol, {'taker_fee': 0.001})
+        prices = {'BTC/USD': 5000, 'ETH/USD': 500, 'ETH/BTC': 0.1, 'LTC/BTC': 0.02, 'LTC/USD': 100, 'ETH/LTC': 5}
+        for symbol, price in prices.items():
+            wss_update_graph(self.graph, symbol, 'buy', price * 0.999, 1)
+            wss_update_graph(self.graph, symbol, 'sell', price * 1.001, 1)
+
+    def assert_distances_match_full_scan(self, finder):
+        expected = NegativeWeightFinder(self.graph)
+        self.assertEqual(list(expected.bellman_ford('BTC')), [])
+        for node in self.graph:
+            self.assertAlmostEqual(finder.distance_to[node], expected.distance_to[node])
+
+    def test_no_cycle_without_opportunity(self):
+        finder = IncrementalNegativeWeightFinder(self.graph, 'BTC')
+        self.assertEqual(list(finder.bellman_ford()), [])
+        self.assertIsNone(finder.update('ETH/USD', 'buy', 500.2, 1))
+        self.assert_distances_match_full_scan(finder)
+
+    def test_cycle_through_updated_edge(self):
+        finder = IncrementalNegativeWeightFinder(self.graph, 'BTC')
+        # ETH can be bought for 0.1001 BTC and sold for 600 USD, which buys about 0.12 BTC
+        path = finder.update('ETH/USD', 'buy', 600, 1)
+        self.assertEqual(path[:2], ['ETH', 'USD'])
+        self.assertEqual(path[-1], 'ETH')
+        self.assertGreater(calculate_profit_ratio_for_path(self.graph, path), 1)
+        self.assertIn(rotate_cycle(path), [rotate_cycle(p) for p in bellman_ford(self.graph, 'BTC')])
+
+    def test_distances_repaired_after_increase(self):
+        finder = IncrementalNegativeWeightFinder(self.graph, 'BTC')
+        finder.update_edge('BTC', 'USD')
+        # make the best route to USD worse, and then better again
+        self.assertIsNone(finder.update('BTC/USD', 'buy', 4000, 1))
+        self.assert_distances_match_full_scan(finder)
+        self.assertIsNone(finder.update('BTC/USD', 'buy', 4999, 1))
+        self.assert_distances_match_full_scan(finder)
+
+    def test_same_cycles_as_full_scan(self):
+        """
+        After the weight of one edge of a graph without negative cycles decreases, every negative cycle uses that edge,
+        so update_edge finds a cycle exactly when a full scan does.
+        """
+        cycle_count = 0
+        for seed in range(300):
+            rng = random.Random(seed)
+            node_count = 12
+            # weights which are differences of potentials plus a positive cost make every cycle positive
+            potential = [rng.uniform(0, 5) for node in range(node_count)]
+            graph = nx.DiGraph()
+            for u in range(node_count):
+                for v in range(node_count):
+                    if u != v and rng.random() < 0.4:
+                        graph.add_edge(u, v, weight=potential[v] - potential[u] + rng.uniform(0, 1))
+
+            finder = IncrementalNegativeWeightFinder(graph, 0)
+            self.assertEqual(list(finder.bellman_ford()), [])
+            u, v = rng.choice(list(graph.edges()))
+            graph[u][v]['weight'] -= rng.uniform(0, 3)
+            path = finder.update_edge(u, v)
+
+            if list(bellman_ford(graph, 0)):
+                cycle_count += 1
+                self.assertIsNotNone(path, 'no cycle found with seed {}'.format(seed))
+                self.assertEqual(path[:2], [u, v])
+                self.assertEqual(path[-1], u)
+                self.assertLess(sum(graph[path[i]][path[i + 1]]['weight'] for i in range(len(path) - 1)), 0.0)
+            else:
+                self.assertIsNone(path)
+        self.assertGreater(cycle_count, 0)
+
+
+class TestFindCyclesThroughEdge(TestCase):
+
+    def setUp(self):
+        self.graph = build_graph_from_edge_list([
+            # tail node, head node, no_fee_rate, depth, trade_type
+            ['A', 'B', 2, 3, 'SELL'],
+            ['B', 'C', 3, 4, 'SELL'],
+            ['C', 'A', 1 / 5, 14, 'SELL'],
+            ['B', 'D', 1, 4, 'SELL'],
+            ['D', 'E', 1, 4, 'SELL'],
+            ['E', 'A', 0.6, 4, 'SELL'],
+            ['C', 'D', 1, 4, 'SELL'],
+            ['A', 'E', 1, 4, 'SELL'],
+        ], 0)
+
+    def test_most_negative_cycle(self):
+        # A -> B -> C -> A has a ratio of 1.2 and A -> B -> D -> E -> A has a ratio of 1.2 and is longer. the best is
+        # A -> B -> C -> D -> E -> A, with a ratio of 3.6.
+        path, ratio = find_cycles_through_edge(self.graph, 'A', 'B', max_len=5)
+        self.assertEqual(path, ['A', 'B', 'C', 'D', 'E', 'A'])
+        self.assertAlmostEqual(ratio, 3.6)
+        self.assertAlmostEqual(ratio, calculate_profit_ratio_for_path(self.graph, path))
+
+    def test_max_len(self):
+        path, ratio = find_cycles_through_edge(self.graph, 'A', 'B', max_len=3)
+        self.assertEqual(path, ['A', 'B', 'C', 'A'])
+        self.assertAlmostEqual(ratio, 1.2)
+
+        path, ratio = find_cycles_through_edge(self.graph, 'C', 'D', max_len=3)
+        self.assertIsNone(path)
+        self.assertIsNone(ratio)
+
+    def test_cycle_starts_with_edge(self):
+        path, ratio = find_cycles_through_edge(self.graph, 'D', 'E', max_len=5)
+        self.assertEqual(path[:2], ['D', 'E'])
+        self.assertEqual(path[-1], 'D')
+        self.assertGreater(ratio, 1)
+
+
+class TestEnumerateProfitableCycles(TestCase):
+
+    def setUp(self):
+        self.graph = nx.DiGraph()
+        for edge in nx.complete_graph(8).edges():
+            random_weight = random.uniform(-1, 1)
+            self.graph.add_edge(edge[0], edge[1], weight=random_weight)
+            self.graph.add_edge(edge[1], edge[0], weight=-random_weight + random.uniform(-0.5, 0.5))
+
+    def test_all_cycles_found(self):
+        expected = set()
+        for cycle in nx.simple_cycles(self.graph):
+            if 3 <= len(cycle) <= 4:
+                weight = sum(self.graph[cycle[i - 1]][cycle[i]]['weight'] for i in range(len(cycle)))
+                if weight < 0:
+                    expected.add(tuple(rotate_cycle(cycle + [cycle[0]])))
+
+        results = enumerate_profitable_cycles(self.graph, 3, 4)
+        self.assertEqual({tuple(rotate_cycle(path)) for path, ratio in results}, expected)
+
+        ratios = [ratio for path, ratio in results]
+        self.assertEqual(ratios, sorted(ratios, reverse=True))
+        for path, ratio in results:
+            self.assertGreater(ratio, 1)
+            self.assertAlmostEqual(ratio, calculate_profit_ratio_for_path(self.graph, path))
+
+    def test_max_results(self):
+        results = enumerate_profitable_cycles(self.graph, 3, 4)
+        self.assertEqual(enumerate_profitable_cycles(self.graph, 3, 4, max_results=3), results[:3])
+
+    def test_overlapping_cycles(self):
+        graph = build_graph_from_edge_list([
+            ['A', 'B', 2, 3, 'SELL'],
+            ['B', 'C', 3, 4, 'SELL'],
+            ['C', 'A', 1 / 5, 14, 'SELL'],
+            ['C', 'D', 1, 4, 'SELL'],
+            ['D', 'A', 1 / 4, 4, 'SELL'],
+        ], 0)
+        # bellman_ford with unique_paths finds only one of these, because they share A, B and C
+        results = enumerate_profitable_cycles(graph, 3, 4)
+        self.assertEqual([path for path, ratio in results], [['A', 'B', 'C', 'D', 'A'], ['A', 'B', 'C', 'A']])
+
+    def test_time_budget(self):
+        self.assertLessEqual(len(enumerate_profitable_cycles(self.graph, 3, 8, time_budget=0)),
+                             len(enumerate_profitable_cycles(self.graph, 3, 8)))
+
+
+class TestFindTriangularOpportunities(TestCase):
+
+    def test_same_triangles_as_enumeration(self):
+        graph = nx.DiGraph()
+        for edge in nx.complete_graph(12).edges():
+            if random.random() < 1 / 3:
+                continue
+            random_weight = random.uniform(-1, 1)
+            graph.add_edge(edge[0], edge[1], weight=random_weight, depth=random.uniform(-2, 0))
+            graph.add_edge(edge[1], edge[0], weight=-random_weight + random.uniform(-0.5, 0.5),
+                           depth=random.uniform(-2, 0))
+
+        expected = enumerate_profitable_cycles(graph, 3, 3)
+        actual = find_triangular_opportunities(graph)
+        self.assertEqual([path for path, ratio in actual], [path for path, ratio in expected])
+        for (path, ratio), (expected_path, expected_ratio) in zip(actual, expected):
+            self.assertAlmostEqual(ratio, expected_ratio)
+
+        for path, ratio, volume in find_triangular_opportunities(graph, depth=True):
+            self.assertAlmostEqual(volume, get_starting_volume(graph, path))
+
+    def test_top_n(self):
+        graph = build_graph_from_edge_list([
+            ['A', 'B', 2, 3, 'SELL'],
+            ['B', 'C', 3, 4, 'SELL'],
+            ['C', 'A', 1 / 5, 14, 'SELL'],
+            ['C', 'D', 1, 4, 'SELL'],
+            ['D', 'B', 1 / 2, 4, 'SELL'],
+        ], 0)
+        self.assertEqual([path for path, ratio in find_triangular_opportunities(graph)],
+                         [['B', 'C', 'D', 'B'], ['A', 'B', 'C', 'A']])
+        # D has the fewest markets
+        self.assertEqual([path for path, ratio in find_triangular_opportunities(graph, top_n=3)],
+                         [['A', 'B', 'C', 'A']])
+
+
+class TestCompiledBellmanFord(TestCase):
+
+    def setUp(self):
+        self.edges = [
+            # tail node, head node, no_fee_rate, depth (in terms of the first currency), trade_type
+            ['A', 'B', 2, 3, 'SELL'],
+            ['B', 'C', 3, 4, 'SELL'],
+            ['C', 'D', 7, 10, 'SELL'],
+            ['D', 'E', 5, 40, 'SELL'],
+            ['E', 'F', 1 / 5, 220, 'SELL'],
+            ['F', 'G', 6, 40, 'SELL'],
+            ['G', 'H', 1 / 20, 200, 'SELL'],
+            ['H', 'A', 1 / 2, 20, 'SELL'],
+            ['B', 'A', 1 / 3, 6, 'SELL'],
+            ['D', 'B', 1 / 30, 50, 'SELL'],
+        ]
+
+    def test_compiled_graph_arrays(self):
+        graph = build_graph_from_edge_list(self.edges, 0)
+        compiled = CompiledGraph(graph)
+        self.assertEqual(len(compiled), len(graph))
+        self.assertEqual(compiled.edge_count, graph.number_of_edges())
+        for i, (u, v, data) in enumerate(graph.edges(data=True)):
+            self.assertEqual(compiled.nodes[compiled.src[i]], u)
+            self.assertEqual(compiled.nodes[compiled.dst[i]], v)
+            self.assertEqual(compiled.weight[i], data['weight'])
+            self.assertEqual(compiled.depth[i], data['depth'])
+
+    def test_same_paths_as_uncompiled(self):
+        """
+        The compiled engine finds the same cycles, although they may be retraced starting from a different currency.
+        """
+        graph = build_graph_from_edge_list(self.edges, 0)
+        for source in graph:
+            expected = [rotate_cycle(path) for path in bellman_ford(graph, source)]
+            actual = [rotate_cycle(path) for path in bellman_ford(graph, source, compiled=True)]
+            self.assertEqual(actual, expected)
+
+            expected = [rotate_cycle(path) for path, volume in bellman_ford(graph, source, depth=True)]
+            actual = [rotate_cycle(path) for path, volume in bellman_ford(graph, source, depth=True, compiled=True)]
+            self.assertEqual(actual, expected)
+
+    def test_random_graphs_same_paths_as_uncompiled(self):
+        path_count = 0
+        for seed in range(100):
+            rng = random.Random(seed)
+            node_count = rng.randint(5, 26)
+            graph = nx.DiGraph()
+            graph.add_nodes_from(range(node_count))
+            for u in range(node_count):
+                for v in range(node_count):
+                    if u != v and rng.random() < 0.3:
+                        graph.add_edge(u, v, weight=rng.uniform(-1, 3), depth=rng.uniform(-2, 2))
+
+            for depth in (False, True):
+                for relaxation in ('full', 'early_exit'):
+                    expected = list(bellman_ford(graph, 0, depth=depth, relaxation=relaxation))
+                    actual = list(bellman_ford(graph, 0, depth=depth, compiled=True, relaxation=relaxation))
+                    self.assertEqual(actual, expected, 'different paths with seed {}'.format(seed))
+                    path_count += len(expected)
+        self.assertGreater(path_count, 0)
+
+    def test_ratio(self):
+        G = nx.DiGraph()
+        G.add_edge('A', 'B', weight=-math.log(2))
+        G.add_edge('B', 'C', weight=-math.log(3))
+        G.add_edge('C', 'A', weight=-math.log(1 / 4))
+        paths = list(bellman_ford(G, 'A', unique_paths=True, compiled=CompiledGraph(G)))
+
+        self.assertEqual(len(paths), 1)
+        self.assertAlmostEqual(calculate_profit_ratio_for_path(G, paths[0]), 1.5)
+
+    def test_random_graph_paths_are_negative(self):
+        node_count = 30
+        graph = nx.DiGraph()
+        for edge in nx.complete_graph(node_count).edges():
+            if random.random() < 2 / 3 and not (edge[0] == 0 or edge[1] == 0):
+                continue
+            random_weight = random.uniform(-10, 6)
+            graph.add_edge(edge[0], edge[1], weight=random_weight, depth=random.uniform(0, 15))
+            graph.add_edge(edge[1], edge[0], weight=-random_weight + 10 ** -3, depth=random.uniform(0, 15))
+
+        for path, starting_amount in CompiledNegativeWeightDepthFinder(graph).bellman_ford(0):
+            self.assertEqual(path[0], path[-1])
+            self.assertLess(sum(graph[path[i]][path[i + 1]]['weight'] for i in range(len(path) - 1)), 0.0)
+
+    def test_compact_graph_built_with_wss(self):
+        """
+        A CompiledGraph populated with wss_add_market and wss_update_graph can be used in place of a DiGraph.
+        """
+        graphs = [nx.DiGraph(), CompiledGraph()]
+        prices = {'BTC/USD': 5000, 'ETH/USD': 500, 'ETH/BTC': 0.1, 'LTC/BTC': 0.02, 'LTC/USD': 100, 'ETH/LTC': 5}
+        for graph in graphs:
+            for symbol, price in prices.items():
+                wss_add_market(graph, symbol, {'taker_fee': 0.001})
+                wss_update_graph(graph, symbol, 'buy', price * 0.999, 2)
+                wss_update_graph(graph, symbol, 'sell', price * 1.001, 3)
+            # make BTC -> ETH -> USD -> BTC profitable
+            wss_update_graph(graph, 'ETH/USD', 'buy', 600, 2)
+        digraph, compact = graphs
+
+        self.assertEqual(compact.number_of_edges(), digraph.number_of_edges())
+        self.assertEqual(len(compact.market_names), len(prices))
+        for u, v, data in digraph.edges(data=True):
+            for attribute, value in data.items():
+                self.assertEqual(compact[u][v][attribute], value)
+
+        expected = list(bellman_ford(digraph, 'BTC', depth=True))
+        actual = list(bellman_ford(compact, 'BTC', depth=True))
+        self.assertGreater(len(expected), 0)
+        # edges are relaxed in the order in which digraph iterates over them, so the same cycles are retraced
+        self.assertEqual(actual, expected)
+        for path, volume in expected:
+            self.assertAlmostEqual(get_starting_volume(compact, path), get_starting_volume(digraph, path))
+            self.assertAlmostEqual(calculate_profit_ratio_for_path(compact, path, depth=True, starting_amount=volume),
+                                   calculate_profit_ratio_for_path(digraph, path, depth=True, starting_amount=volume))
+
+    def test_compact_graph_edge_views(self):
+        compact = CompiledGraph(capacity=1)
+        compact.add_edge('A', 'B', weight=1.0, market_name='A/B', trade_type='SELL')
+        compact.add_edge('B', 'A', weight=2.0, market_name='A/B', trade_type='BUY')
+        compact.add_edge('B', 'C', market_name='C/B', trade_type='BUY')
+
+        self.assertEqual(compact.market_names, ['A/B', 'C/B'])
+        self.assertEqual(list(compact.trade_type), [0, 1, 1])
+        self.assertEqual(compact['B']['A']['trade_type'], 'BUY')
+        self.assertEqual(sorted(compact['B']), ['A', 'C'])
+        self.assertIn('C', compact['B'])
+        self.assertNotIn('C', compact['A'])
+        self.assertIsNone(compact['B']['C'].get('depth'))
+        self.assertTrue(math.isnan(compact['B']['C']['depth']))
+
+        compact['A']['B']['weight'] = -1.0
+        self.assertEqual(compact.weight[compact.edge_id('A', 'B')], -1.0)
+        # adding an existing edge updates it
+        self.assertEqual(compact.add_edge('A', 'B', weight=-2.0), compact.edge_id('A', 'B'))
+        self.assertEqual(compact.number_of_edges(), 3)
+        self.assertEqual(compact['A']['B']['weight'], -2.0)
+
+
 class TestCalculateProfitRatioForPath(TestCase):
 
     def test_calculate_profit_ratio_for_path(self):
@@ -0,0 +1,102 @@
+from unittest import TestCase
+from peregrinearb import size_opportunity, rank_opportunities, size_cycle, convert, load_exchange_graph, bellman_ford, \
+    RateLimiter, SimulatedExchange, synthetic_universe
+from peregrinearb.async_find_opportunities import SuperOpportunityFinder
+from peregrinearb.tests.exchanges import OrderBookExchange
+import ccxt.async_support as ccxt
+import asyncio
+
+
+class TestSizeOpportunity(TestCase):
+
+    def test_walks_levels(self):
+        bids = [[105, 1], [103, 2], [100, 5]]
+        asks = [[101, 1.5], [102, 1], [104, 10]]
+        sizing = size_opportunity(bids, asks)
+
+        # 1 @ 105 - 101, 0.5 @ 103 - 101, 1 @ 103 - 102, then 103 < 104
+        self.assertAlmostEqual(sizing['volume'], 2.5)
+        self.assertAlmostEqual(sizing['profit'], 4 + 0.5 * 2 + 1)
+        self.assertAlmostEqual(sizing['buy_price'], (1.5 * 101 + 102) / 2.5)
+        self.assertAlmostEqual(sizing['sell_price'], (105 + 1.5 * 103) / 2.5)
+
+    def test_fees(self):
+        bids = [[105, 1], [103, 2]]
+        asks = [[101, 1], [102, 2]]
+        # 103 * 0.99 < 102 * 1.01 but 105 * 0.99 > 101 * 1.01
+        sizing = size_opportunity(bids, asks, buy_fee=0.01, sell_fee=0.01)
+        self.assertAlmostEqual(sizing['volume'], 1)
+        self.assertAlmostEqual(sizing['profit'], 105 * 0.99 - 101 * 1.01)
+
+        self.assertEqual(size_opportunity([[100, 1]], [[101, 1]])['volume'], 0)
+        self.assertEqual(size_opportunity([], [[101, 1]])['buy_price'], None)
+
+
+class TestDepthFinder(TestCase):
+
+    def test_ranked_by_profit(self):
+        exchanges = [
+            OrderBookExchange('a', {'BTC/USD': {'bids': [[100, 1]], 'asks': [[101, 1]]},
+                                    'ETH/USD': {'bids': [[10, 1]], 'asks': [[10.1, 1]]}}),
+            OrderBookExchange('b', {'BTC/USD': {'bids': [[110, 0.01]], 'asks': [[103, 1]]},
+                                    'ETH/USD': {'bids': [[10.8, 5], [10.5, 5]], 'asks': [[12, 1]]}}),
+        ]
+        for exchange in exchanges:
+            exchange.has = dict(exchange.has, fetchOrderBooks=False, fetchTickers=False)
+        collections = {'BTC/USD': ['a', 'b'], 'ETH/USD': ['a', 'b']}
+        finder = SuperOpportunityFinder(exchanges, collections, name=False, batched=True, depth=True)
+        snapshot = {exchange.id: exchange.order_books for exchange in exchanges}
+        opportunities = finder.opportunities_from_snapshot(snapshot)
+
+        # BTC/USD has the wider top-of-book spread but ETH/USD the greater realizable profit
+        self.assertEqual([opportunity['ticker'] for opportunity in opportunities], ['ETH/USD', 'BTC/USD'])
+        self.assertAlmostEqual(opportunities[0]['depth']['volume'], 1)
+        self.assertAlmostEqual(opportunities[0]['depth']['profit'], 0.7)
+        self.assertAlmostEqual(opportunities[1]['depth']['profit'], 0.09)
+        self.assertEqual(rank_opportunities(list(reversed(opportunities))), opportunities)
+
+
+class TestCurveGraph(TestCase):
+
+    def setUp(self):
+        order_books = {
+            'ETH/USD': {'bids': [[90, 10]], 'asks': [[100, 1], [110, 10]]},
+            'ETH/BTC': {'bids': [[0.011, 0.5], [0.0105, 10], [0.001, 10]], 'asks': [[0.012, 10]]},
+            'BTC/USD': {'bids': [[10000, 1]], 'asks': [[10100, 10]]},
+        }
+        exchange = ccxt.Exchange()
+        exchange.id = 'test'
+        exchange.markets = {market_name: {'symbol': market_name} for market_name in order_books}
+        self.graph = asyncio.get_event_loop().run_until_complete(
+            load_exchange_graph(exchange, name=False, fees=False, levels=2, order_books=order_books))
+
+    def test_rate_limited_order_books(self):
+        exchange = SimulatedExchange('a', synthetic_universe(4, seed=0), fetch_order_books=False)
+        rate_limiter = RateLimiter()
+        graph = asyncio.get_event_loop().run_until_complete(
+            load_exchange_graph(exchange, name=False, fees=False, levels=2, rate_limiter=rate_limiter))
+        self.assertEqual(graph.number_of_edges(), 2 * len(exchange.prices))
+        self.assertEqual(exchange.request_counts['fetch_order_book'], len(exchange.prices))
+        # every request went through the rate limiter
+        self.assertIn('a', rate_limiter.buckets)
+
+    def test_curves(self):
+        inputs, outputs = self.graph['ETH']['BTC']['curve']
+        # only the top two levels are kept
+        self.assertEqual(list(inputs), [0, 0.5, 10.5])
+        self.assertAlmostEqual(outputs[-1], 0.0055 + 10 * 0.0105)
+        self.assertAlmostEqual(convert(self.graph['USD']['ETH']['curve'], 150), 1 + 50 / 110)
+
+    def test_size_cycle(self):
+        # the first 50 USD return 55 USD and the next 50 return 52.5, after which each USD returns less than 1
+        sizing = size_cycle(self.graph, ['USD', 'ETH', 'BTC', 'USD'])
+        self.assertAlmostEqual(sizing['volume'], 100, places=4)
+        self.assertAlmostEqual(sizing['profit'], 7.5, places=4)
+
+    def test_bellman_ford(self):
+        paths = list(bellman_ford(self.graph, 'USD', depth='curve'))
+        self.assertEqual(len(paths), 1)
+        path, volume = paths[0]
+        self.assertEqual(set(path), {'USD', 'ETH', 'BTC'})
+        self.assertAlmostEqual(volume, size_cycle(self.graph, path)['volume'])
+        self.assertGreater(volume, 0)
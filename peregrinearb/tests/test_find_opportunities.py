@@ -0,0 +1,134 @@
+from unittest import TestCase
+from peregrinearb import RateLimiter
+from peregrinearb.async_find_opportunities import SuperOpportunityFinder
+from peregrinearb.tests.exchanges import OrderBookExchange
+import asyncio
+
+
+def order_book(bid, ask, volume=1):
+    return {'bids': [[bid, volume]], 'asks': [[ask, volume]]}
+
+
+class TestSuperOpportunityFinder(TestCase):
+
+    def setUp(self):
+        self.exchanges = [
+            OrderBookExchange('a', {'BTC/USD': order_book(100, 101), 'ETH/USD': order_book(10, 11)},
+                              rate_limited_count=2),
+            OrderBookExchange('b', {'BTC/USD': order_book(103, 104), 'ETH/USD': order_book(9, 9.5)}),
+        ]
+        self.collections = {'BTC/USD': ['a', 'b'], 'ETH/USD': ['a', 'b']}
+
+    def get_opportunities(self, finder, **kwargs):
+        async def collect():
+            return [opportunity async for opportunity in finder.get_opportunities(**kwargs)]
+
+        return {opportunity['ticker']: opportunity
+                for opportunity in asyncio.get_event_loop().run_until_complete(collect())}
+
+    def test_rate_limited_requests_retried(self):
+        finder = SuperOpportunityFinder(self.exchanges, self.collections, name=False)
+        opportunities = self.get_opportunities(finder)
+
+        self.assertEqual(opportunities['BTC/USD']['highest_bid']['exchange'], 'b')
+        self.assertEqual(opportunities['BTC/USD']['lowest_ask']['exchange'], 'a')
+        self.assertEqual(opportunities['ETH/USD']['highest_bid']['exchange'], 'a')
+        self.assertEqual(opportunities['ETH/USD']['lowest_ask']['exchange'], 'b')
+        # two rate limited requests and one successful request per market
+        self.assertEqual(self.exchanges[0].request_count, 4)
+        self.assertLess(finder.rate_limiter.bucket(self.exchanges[0]).rate, 1000)
+
+    def test_retries_exhausted(self):
+        finder = SuperOpportunityFinder(self.exchanges, self.collections, name=False, retries=0,
+                                        rate_limiter=RateLimiter())
+        opportunities = self.get_opportunities(finder)
+        # a was skipped for the markets whose requests were rate limited
+        skipped = [market for market, opportunity in opportunities.items()
+                   if opportunity['lowest_ask']['exchange'] == 'b' and opportunity['highest_bid']['exchange'] == 'b']
+        self.assertEqual(len(skipped), 2)
+
+    def test_bounded_concurrency(self):
+        """
+        At most max_concurrency markets are in progress at once and markets with greater priorities start first.
+        """
+        markets = ['{}/USD'.format(i) for i in range(10)]
+        exchange = OrderBookExchange('c', {market: order_book(1, 2) for market in markets})
+        started = []
+        in_progress = []
+        max_in_progress = []
+
+        async def fetch_order_book(symbol, limit=None, params={}):
+            started.append(symbol)
+            in_progress.append(symbol)
+            max_in_progress.append(len(in_progress))
+            await asyncio.sleep(0.01)
+            in_progress.remove(symbol)
+            return exchange.order_books[symbol]
+
+        exchange.fetch_order_book = fetch_order_book
+        finder = SuperOpportunityFinder([exchange], {market: ['c'] for market in markets}, name=False,
+                                        max_concurrency=3)
+        priorities = {market: i for i, market in enumerate(markets)}
+        opportunities = self.get_opportunities(finder, priorities=priorities)
+
+        self.assertEqual(len(opportunities), 10)
+        self.assertEqual(max(max_in_progress), 3)
+        self.assertEqual(started, list(reversed(markets)))
+
+    def test_batched(self):
+        for exchange in self.exchanges:
+            exchange.has = dict(exchange.has, fetchTickers=True)
+            exchange.rate_limited_count = 0
+
+            async def fetch_tickers(symbols=None, params={}, exchange=exchange):
+                exchange.request_count += 1
+                return {symbol: {'bid': book['bids'][0][0], 'ask': book['asks'][0][0], 'bidVolume': 1, 'askVolume': 1}
+                        for symbol, book in exchange.order_books.items()}
+
+            exchange.fetch_tickers = fetch_tickers
+
+        expected = self.get_opportunities(SuperOpportunityFinder(self.exchanges, self.collections, name=False))
+        for exchange in self.exchanges:
+            exchange.request_count = 0
+        finder = SuperOpportunityFinder(self.exchanges, self.collections, name=False, batched=True)
+        actual = self.get_opportunities(finder)
+
+        # one request per exchange
+        self.assertEqual([exchange.request_count for exchange in self.exchanges], [1, 1])
+        for market_name, opportunity in expected.items():
+            self.assertEqual(actual[market_name]['highest_bid'], opportunity['highest_bid'])
+            self.assertEqual(actual[market_name]['lowest_ask'], opportunity['lowest_ask'])
+
+    def test_opportunities_from_tickers(self):
+        ticker_dicts = {
+            'a': {'BTC/USD': {'bid': 100, 'ask': 101}, 'ETH/USD': {'bid': None, 'ask': None}},
+            'b': {'BTC/USD': {'bid': 103, 'ask': 104}, 'ETH/USD': {'bid': 9, 'ask': 9.5}},
+        }
+        finder = SuperOpportunityFinder(self.exchanges, self.collections, name=False)
+        opportunities = finder.opportunities_from_tickers(ticker_dicts, price_markets=['ETH/USD'])
+
+        opportunity, prices = opportunities[0]
+        self.assertEqual(opportunity['ticker'], 'ETH/USD')
+        self.assertEqual(prices, {'b': 9.5})
+        self.assertEqual(opportunities[1]['highest_bid']['exchange'], 'b')
+        self.assertEqual(opportunities[1]['lowest_ask']['price'], 101)
+        # no requests were made
+        self.assertEqual([exchange.request_count for exchange in self.exchanges], [0, 0])
+
+    def test_stream_opportunities(self):
+        self.exchanges[0].rate_limited_count = 0
+        finder = SuperOpportunityFinder(self.exchanges, self.collections, name=False)
+
+        async def stream():
+            rounds = []
+            async for opportunity in finder.stream_opportunities(interval=0, threshold=0.001, rounds=3):
+                rounds.append(opportunity['ticker'])
+                if len(rounds) == 2:
+                    # widen BTC/USD's spread by more than threshold and ETH/USD's by less
+                    self.exchanges[1].order_books['BTC/USD'] = order_book(104, 105)
+                    self.exchanges[1].order_books['ETH/USD'] = order_book(9, 9.499)
+            return rounds
+
+        tickers = asyncio.get_event_loop().run_until_complete(stream())
+        self.assertEqual(sorted(tickers[:2]), ['BTC/USD', 'ETH/USD'])
+        self.assertEqual(tickers[2:], ['BTC/USD'])
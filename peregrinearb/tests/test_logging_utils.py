@@ -0,0 +1,68 @@
+from unittest import TestCase
+from peregrinearb.utils.logging_utils import FormatForLogAdapter, BackgroundLogWriter, log_in_background
+import logging
+
+
+class CountingValue:
+
+    def __init__(self):
+        self.str_count = 0
+
+    def __str__(self):
+        self.str_count += 1
+        return 'value'
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(self.format(record))
+
+
+class TestFormatForLogAdapter(TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('peregrinearb.tests.test_logging_utils')
+        self.logger.propagate = False
+        self.handler = ListHandler()
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def test_lazy(self):
+        self.logger.setLevel(logging.INFO)
+        adapter = FormatForLogAdapter(self.logger, context={'invocation': 1})
+        value = CountingValue()
+        adapter.debug('Disabled', key=value)
+        self.assertEqual(value.str_count, 0)
+        self.assertEqual(self.handler.messages, [])
+
+        adapter.info('Enabled', key=value)
+        self.assertEqual(value.str_count, 1)
+        self.assertEqual(self.handler.messages, ['INVOCATION#1 - KEY#value - Enabled'])
+
+    def test_background_writer(self):
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.removeHandler(self.handler)
+        handler = ListHandler()
+        with BackgroundLogWriter(handler, batch_size=2) as writer:
+            self.logger.addHandler(writer.handler)
+            adapter = FormatForLogAdapter(self.logger)
+            path = ['BTC']
+            for i in range(5):
+                adapter.info('Message', path=path, index=i)
+            # the message is rendered when it is logged
+            path.append('ETH')
+        self.logger.removeHandler(writer.handler)
+        self.assertEqual(handler.messages, ["PATH#['BTC'] - INDEX#{} - Message".format(i) for i in range(5)])
+
+        self.logger.addHandler(handler)
+        writer = log_in_background(self.logger)
+        self.assertEqual(self.logger.handlers, [writer.handler])
+        self.logger.warning('Written in the background')
+        writer.stop()
+        self.logger.removeHandler(writer.handler)
+        self.assertEqual(handler.messages[-1], 'Written in the background')
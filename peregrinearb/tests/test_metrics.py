@@ -0,0 +1,81 @@
+from unittest import TestCase
+from peregrinearb import LatencyHistogram, Metrics, default_metrics, load_exchange_graph, bellman_ford, \
+    SimulatedExchange, synthetic_universe
+import asyncio
+import os
+import tempfile
+
+
+class TestLatencyHistogram(TestCase):
+
+    def test_quantiles(self):
+        histogram = LatencyHistogram(precision=0.01)
+        for i in range(1, 1001):
+            histogram.record(i / 1000)
+        self.assertEqual(histogram.count, 1000)
+        self.assertAlmostEqual(histogram.mean, 0.5005)
+        for q in (0.5, 0.9, 0.99):
+            # each quantile is accurate to within the precision
+            self.assertLessEqual(abs(histogram.quantile(q) - q) / q, 0.01)
+        self.assertEqual(histogram.quantile(1), 1)
+
+        other = LatencyHistogram(precision=0.01)
+        other.record(5)
+        histogram.merge(other)
+        self.assertEqual(histogram.max, 5)
+        with self.assertRaises(ValueError):
+            histogram.merge(LatencyHistogram(precision=0.1))
+
+
+class TestMetrics(TestCase):
+
+    def test_prometheus(self):
+        metrics = Metrics()
+        metrics.record('fetch_order_book', 0.25, exchange='a', market='BTC/USD')
+        metrics.record('fetch_order_book', 0.5, exchange='a', market='BTC/USD')
+        metrics.record('relaxation', 0.1, exchange=None)
+        self.assertEqual(metrics.histogram('fetch_order_book', market='BTC/USD', exchange='a').count, 2)
+        self.assertEqual(metrics.summary()[0]['stage'], 'fetch_order_book')
+
+        text = metrics.to_prometheus()
+        self.assertIn('# TYPE peregrinearb_stage_seconds summary', text)
+        self.assertIn('peregrinearb_stage_seconds_count{stage="fetch_order_book",exchange="a",market="BTC/USD"} 2',
+                      text)
+        self.assertIn('peregrinearb_stage_seconds_sum{stage="relaxation"} 0.1', text)
+
+        path = os.path.join(tempfile.mkdtemp(), 'peregrinearb.prom')
+        metrics.write_prometheus(path)
+        with open(path) as f:
+            self.assertEqual(f.read(), text)
+
+        disabled = Metrics(enabled=False)
+        with disabled.time('relaxation'):
+            pass
+        self.assertEqual(disabled.histograms(), {})
+
+    def test_serve_prometheus(self):
+        metrics = Metrics()
+        metrics.record('retrace', 0.001)
+
+        async def scrape():
+            server = await metrics.serve_prometheus(port=0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /metrics HTTP/1.0\r\n\r\n')
+            response = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return response
+
+        response = asyncio.get_event_loop().run_until_complete(scrape())
+        self.assertTrue(response.startswith(b'HTTP/1.0 200 OK'))
+        self.assertIn(b'peregrinearb_stage_seconds_count{stage="retrace"} 1', response)
+
+    def test_instrumented_stages(self):
+        default_metrics.reset()
+        exchange = SimulatedExchange('instrumented', synthetic_universe(5, seed=0))
+        graph = asyncio.get_event_loop().run_until_complete(load_exchange_graph(exchange, name=False))
+        list(bellman_ford(graph, 'CUR0'))
+        for stage in ('fetch_tickers', 'load_markets', 'build_edges', 'relaxation'):
+            self.assertEqual(default_metrics.histogram(stage, exchange='instrumented').count, 1)
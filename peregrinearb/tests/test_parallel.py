@@ -0,0 +1,72 @@
+from unittest import TestCase
+from peregrinearb import ParallelScanner, ExchangePool, bellman_ford, load_exchange_graph, simulated_exchanges, \
+    synthetic_graph
+from peregrinearb.utils import CompiledGraph
+import asyncio
+import pickle
+
+
+class TestParallelScanner(TestCase):
+
+    def setUp(self):
+        self.scanner = ParallelScanner(max_workers=2)
+        self.addCleanup(self.scanner.close)
+
+    def test_compiled_graph_snapshot(self):
+        graph = synthetic_graph(50, negative_cycles=2, depth=True, seed=0)
+        compiled = CompiledGraph(graph)
+        snapshot = pickle.loads(pickle.dumps(compiled))
+        self.assertEqual(snapshot.number_of_edges(), graph.number_of_edges())
+        self.assertEqual(snapshot['CUR1']['CUR0']['market_name'], 'CUR1/CUR0')
+        self.assertEqual(snapshot.graph['planted_cycles'], graph.graph['planted_cycles'])
+        self.assertEqual(list(bellman_ford(snapshot, 'CUR0', depth=True)),
+                         list(bellman_ford(compiled, 'CUR0', depth=True)))
+
+    def test_scan(self):
+        graphs = {seed: synthetic_graph(50, negative_cycles=seed, seed=seed) for seed in range(3)}
+        results = asyncio.get_event_loop().run_until_complete(self.scanner.scan(graphs, 'CUR0'))
+        for seed, graph in graphs.items():
+            # the same paths as a serial search with the default, uncompiled engine
+            self.assertEqual(results[seed], list(bellman_ford(graph, 'CUR0')))
+        self.assertEqual(results[0], [])
+        self.assertTrue(results[1])
+
+        depth_graphs = {seed: synthetic_graph(50, negative_cycles=seed, depth=True, seed=seed) for seed in range(3)}
+        results = asyncio.get_event_loop().run_until_complete(self.scanner.scan(depth_graphs, 'CUR0', depth=True))
+        for seed, graph in depth_graphs.items():
+            self.assertEqual(results[seed], list(bellman_ford(graph, 'CUR0', depth=True)))
+
+        with self.assertRaises(ValueError):
+            self.scanner.submit(graphs[0], depth='curve')
+
+    def test_scan_exchanges(self):
+        exchanges = simulated_exchanges(3, currency_count=10, seed=0)
+        pool = ExchangePool(exchanges)
+
+        async def scan():
+            return [result async for result in self.scanner.scan_exchanges([exchange.id for exchange in exchanges],
+                                                                           'CUR0', pool=pool)]
+
+        results = asyncio.get_event_loop().run_until_complete(scan())
+        self.assertEqual({exchange_id for exchange_id, graph, paths in results},
+                         {exchange.id for exchange in exchanges})
+        for exchange_id, graph, paths in results:
+            self.assertIsInstance(graph, CompiledGraph)
+            digraph = asyncio.get_event_loop().run_until_complete(load_exchange_graph(exchange_id, pool=pool))
+            self.assertEqual(paths, list(bellman_ford(digraph, 'CUR0')))
+
+    def test_scan_exchanges_closed_early(self):
+        exchanges = simulated_exchanges(3, currency_count=10, seed=0)
+        pool = ExchangePool(exchanges)
+
+        async def scan_first():
+            results = self.scanner.scan_exchanges([exchange.id for exchange in exchanges], 'CUR0', pool=pool)
+            async for result in results:
+                break
+            await results.aclose()
+            # the exchanges which were still being loaded or searched are cancelled rather than left running
+            return result, asyncio.all_tasks() - {asyncio.current_task()}
+
+        result, pending = asyncio.get_event_loop().run_until_complete(scan_first())
+        self.assertIn(result[0], {exchange.id for exchange in exchanges})
+        self.assertEqual(pending, set())
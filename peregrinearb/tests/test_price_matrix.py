@@ -0,0 +1,45 @@
+from unittest import TestCase
+from peregrinearb import PriceMatrix, compute_spreads
+import math
+
+
+class TestPriceMatrix(TestCase):
+
+    def test_from_tickers(self):
+        ticker_dicts = {
+            'a': {'BTC/USD': {'bid': 100, 'ask': 101, 'bidVolume': 2, 'askVolume': 3}},
+            'b': {'BTC/USD': {'bid': 103, 'ask': 104}, 'ETH/USD': {'bid': 9, 'ask': 9.5}},
+        }
+        matrix = PriceMatrix.from_tickers(ticker_dicts)
+
+        self.assertEqual(matrix.markets, ['BTC/USD', 'ETH/USD'])
+        self.assertEqual(matrix.exchanges, ['a', 'b'])
+        self.assertEqual(matrix.bid.shape, (2, 2))
+        self.assertEqual(matrix.bid[0, 1], 103)
+        self.assertEqual(matrix.bid_volume[0, 0], 2)
+        # ETH/USD is not traded on a and no volumes are given by b
+        self.assertTrue(math.isnan(matrix.ask[1, 0]))
+        self.assertTrue(math.isnan(matrix.ask_volume[0, 1]))
+
+    def test_compute_spreads(self):
+        order_books = {
+            'a': {'BTC/USD': {'bids': [[100, 2]], 'asks': [[101, 3]]},
+                  'ETH/USD': {'bids': [[9, 1]], 'asks': [[9.5, 1]]}},
+            'b': {'BTC/USD': {'bids': [[103, 1]], 'asks': [[104, 1]]},
+                  'LTC/USD': {'bids': [], 'asks': [[50, 1]]}},
+            'c': {'BTC/USD': {'bids': [[102, 5]], 'asks': [[100.5, 0.5]]}},
+        }
+        spreads = compute_spreads(PriceMatrix.from_order_books(order_books))
+
+        self.assertEqual(spreads.markets, ['BTC/USD', 'ETH/USD', 'LTC/USD'])
+        self.assertEqual(list(spreads.best_bid_exchange), [1, 0, -1])
+        self.assertEqual(list(spreads.best_ask_exchange), [2, 0, 1])
+        self.assertEqual(spreads.best_bid[0], 103)
+        self.assertEqual(spreads.best_ask[0], 100.5)
+        self.assertAlmostEqual(spreads.spread[0], 103 / 100.5 - 1)
+        self.assertAlmostEqual(spreads.notional[0], 0.5 * 100.5)
+        self.assertAlmostEqual(spreads.spread[1], 9 / 9.5 - 1)
+        # LTC/USD has no bid
+        self.assertTrue(math.isnan(spreads.best_bid[2]))
+        self.assertTrue(math.isnan(spreads.spread[2]))
+        self.assertEqual(spreads.best_ask[2], 50)
@@ -0,0 +1,91 @@
+from unittest import TestCase
+from peregrinearb import SimulatedExchange, simulated_exchanges, synthetic_universe, constant_latency, ExchangePool, \
+    load_exchange_graph, synthetic_graph, synthetic_multi_graph, bellman_ford, calculate_profit_ratio_for_path
+from peregrinearb.async_find_opportunities import SuperOpportunityFinder
+import ccxt.async_support as ccxt
+import asyncio
+import math
+
+
+class TestSimulatedExchange(TestCase):
+
+    def test_synthetic_universe(self):
+        universe = synthetic_universe(10, quote_count=2, seed=0)
+        # 8 bases and 1 quote for each of 2 quotes, and CUR1/CUR0
+        self.assertEqual(len(universe), 17)
+        self.assertEqual(universe, synthetic_universe(10, quote_count=2, seed=0))
+        self.assertEqual(len(synthetic_universe(10, market_count=5, seed=0)), 5)
+        # prices are consistent, so there is no triangular arbitrage
+        self.assertAlmostEqual(universe['CUR5/CUR0'], universe['CUR5/CUR1'] * universe['CUR1/CUR0'])
+
+    def test_requests(self):
+        exchange = SimulatedExchange('a', {'BTC/USD': 6000}, latency=constant_latency(0.01), levels=3)
+        ticker = asyncio.get_event_loop().run_until_complete(exchange.fetch_ticker('BTC/USD'))
+        self.assertLess(ticker['bid'], 6000)
+        self.assertGreater(ticker['ask'], 6000)
+        order_book = asyncio.get_event_loop().run_until_complete(exchange.fetch_order_book('BTC/USD', 2))
+        self.assertEqual(len(order_book['bids']), 2)
+        self.assertGreater(order_book['bids'][0][0], order_book['bids'][1][0])
+        self.assertEqual(exchange.latencies, [0.01, 0.01])
+
+        markets = asyncio.get_event_loop().run_until_complete(exchange.load_markets())
+        self.assertEqual(markets['BTC/USD']['taker'], 0.001)
+        with self.assertRaises(ccxt.NotSupported):
+            asyncio.get_event_loop().run_until_complete(exchange.fetch_order_books())
+
+    def test_errors(self):
+        exchange = SimulatedExchange('a', {'BTC/USD': 6000}, error_rates={'ExchangeNotAvailable': 1})
+        with self.assertRaises(ccxt.ExchangeNotAvailable):
+            asyncio.get_event_loop().run_until_complete(exchange.fetch_tickers())
+
+        exchange = SimulatedExchange('b', {'BTC/USD': 6000}, rate_limit=1000, enforce_rate_limit=True)
+        asyncio.get_event_loop().run_until_complete(exchange.fetch_ticker('BTC/USD'))
+        with self.assertRaises(ccxt.DDoSProtection):
+            asyncio.get_event_loop().run_until_complete(exchange.fetch_ticker('BTC/USD'))
+        self.assertEqual(exchange.error_counts['DDoSProtection'], 1)
+
+    def test_pipeline(self):
+        exchanges = simulated_exchanges(3, currency_count=6, seed=0, rate_limit=1)
+        exchange_ids = [exchange.id for exchange in exchanges]
+        pool = ExchangePool(exchanges)
+
+        graph = asyncio.get_event_loop().run_until_complete(load_exchange_graph('simulated0', pool=pool))
+        self.assertEqual(graph.number_of_edges(), 2 * len(exchanges[0].prices))
+
+        collections = {market_name: exchange_ids for market_name in exchanges[0].prices}
+        finder = SuperOpportunityFinder(exchange_ids, collections, pool=pool)
+
+        async def get_opportunities():
+            return [opportunity async for opportunity in finder.get_opportunities()]
+
+        opportunities = asyncio.get_event_loop().run_until_complete(get_opportunities())
+        self.assertEqual(len(opportunities), len(exchanges[0].prices))
+        self.assertEqual(exchanges[0].request_counts['fetch_order_book'], len(exchanges[0].prices))
+
+
+class TestSyntheticGraph(TestCase):
+
+    def test_planted_cycles(self):
+        graph = synthetic_graph(100, density=0.5, negative_cycles=3, depth=True, seed=0)
+        self.assertLessEqual(len(graph), 100)
+        self.assertIn('depth', graph['CUR1']['CUR0'])
+        self.assertEqual(len(graph.graph['planted_cycles']), 3)
+        for path in graph.graph['planted_cycles']:
+            self.assertGreater(calculate_profit_ratio_for_path(graph, path), 1)
+        self.assertTrue(list(bellman_ford(graph, 'CUR0')))
+
+        graph = synthetic_graph(100, density=0.5, seed=0)
+        self.assertEqual(list(bellman_ford(graph, 'CUR0')), [])
+
+        with self.assertRaises(ValueError):
+            synthetic_graph(10, negative_cycles=10)
+
+    def test_multi_graph(self):
+        graph = synthetic_multi_graph(20, 3, negative_cycles=1, seed=0)
+        # every market is listed on each of the 3 exchanges
+        self.assertEqual(graph.number_of_edges(), 3 * 2 * len(synthetic_universe(20)))
+        path = graph.graph['planted_cycles'][0]
+        best_rate = 1
+        for u, v in zip(path, path[1:]):
+            best_rate *= max(math.exp(-data['weight']) for data in graph[u][v].values())
+        self.assertGreater(best_rate, 1)
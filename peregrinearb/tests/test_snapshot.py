@@ -0,0 +1,73 @@
+from unittest import TestCase
+from peregrinearb import SnapshotPipeline, ExchangePool
+from peregrinearb.tests.exchanges import TestExchange
+import ccxt.async_support as ccxt
+import asyncio
+import math
+
+
+class TickerCountingExchange(TestExchange):
+
+    def __init__(self, **kwargs):
+        super(TickerCountingExchange, self).__init__(**kwargs)
+        self.rateLimit = 1
+        self.request_count = 0
+
+    async def fetch_tickers(self, symbols=None, params={}):
+        self.request_count += 1
+        return self.tickers
+
+    async def fetch_ticker(self, symbol, params={}):
+        self.request_count += 1
+        return self.tickers[symbol]
+
+    async def close(self):
+        return
+
+
+class TestSnapshotPipeline(TestCase):
+
+    def setUp(self):
+        self.exchanges = []
+        for name, bid, ask in (('a', 100, 101), ('b', 103, 104)):
+            tickers = {'BTC/USD': {'bid': bid, 'ask': ask, 'bidVolume': 1, 'askVolume': 1},
+                       'ETH/BTC': {'bid': 0.01, 'ask': 0.011, 'bidVolume': 1, 'askVolume': 1}}
+            exchange = TickerCountingExchange(name=name, tickers=tickers, currencies=['BTC', 'ETH', 'USD'],
+                                              markets={market_name: {'taker': 0.001} for market_name in tickers})
+            exchange.tickers = tickers
+            exchange.fees = {'trading': {'taker': 0.003, 'maker': 0.002}}
+            self.exchanges.append(exchange)
+        self.pipeline = SnapshotPipeline(['a', 'b'], pool=ExchangePool(self.exchanges))
+
+    def test_tick(self):
+        result = asyncio.get_event_loop().run_until_complete(self.pipeline.tick())
+
+        # one request per exchange for all three views
+        self.assertEqual([exchange.request_count for exchange in self.exchanges], [1, 1])
+        self.assertIs(result['snapshot'], self.pipeline.snapshot)
+        self.assertEqual(set(result['graphs']), {'a', 'b'})
+        self.assertEqual(result['graphs']['a'].number_of_edges(), 4)
+        self.assertEqual(result['multi_graph'].number_of_edges(), 8)
+        btc_usd = result['spreads'].markets.index('BTC/USD')
+        self.assertEqual(result['spreads'].best_bid_exchange[btc_usd], 1)
+        self.assertEqual(result['spreads'].best_ask_exchange[btc_usd], 0)
+        self.assertAlmostEqual(result['spreads'].spread[btc_usd], 103 / 101 - 1)
+
+    def test_tick_fees(self):
+        # both the exchanges' graphs and the multi graph take each market's taker fee (not the exchange's default maker
+        # or taker fee) into account, or neither does
+        for fees, fee_scalar in ((True, 0.999), (False, 1)):
+            result = asyncio.get_event_loop().run_until_complete(self.pipeline.tick(fees=fees, spreads=False))
+            self.assertAlmostEqual(result['graphs']['a']['BTC']['USD']['weight'], -math.log(fee_scalar * 100))
+            multi_weights = {data['exchange_name']: data['weight']
+                             for data in result['multi_graph']['BTC']['USD'].values()}
+            self.assertAlmostEqual(multi_weights['a'], -math.log(fee_scalar * 100))
+
+    def test_failed_exchange_skipped(self):
+        async def fetch_tickers(symbols=None, params={}):
+            raise ccxt.ExchangeNotAvailable('down')
+
+        self.exchanges[1].fetch_tickers = fetch_tickers
+        snapshot = asyncio.get_event_loop().run_until_complete(self.pipeline.fetch())
+        self.assertEqual(snapshot.exchanges, ['a'])
+        self.assertNotIn('b', snapshot)
@@ -1,90 +1,15 @@
 from unittest import TestCase
-from peregrinearb import format_graph_for_json, load_exchange_graph
+from peregrinearb import format_graph_for_json, load_exchange_graph, ExchangeGraph, ExchangePool, BulkTickerFetcher, \
+    MetadataCache, RateLimiter, TokenBucket, load_weighted_multi_exchange_digraph, \
+    stream_weighted_multi_exchange_digraph
+from peregrinearb.tests.exchanges import TestExchange
 import networkx as nx
 import ccxt.async_support as ccxt
 import asyncio
 import math
-
-
-class TestExchange(ccxt.Exchange):
-
-    def __init__(self, config={}, balances=None, name=None, tickers=None, symbols=None, markets=None, currencies=None,
-                 wait_time=0, wait_time_limit=0):
-        super(TestExchange, self).__init__()
-        if balances is None:
-            balances = {'free': {}}
-        if tickers is None:
-            tickers = {}
-        if symbols is None:
-            symbols = [key for key in tickers.keys()]
-        if markets is None:
-            markets = {}
-        if currencies is None:
-            currencies = []
-
-        self.currencies = currencies
-        self.markets = markets
-        self.symbols = symbols
-        self.currencies = currencies
-        self.balances = balances
-        self.id = name
-        self.orders = {}
-        self.wait_time = wait_time
-
-        # How many times fetch_order should be called before returning {'status': 'closed'}
-        self.wait_time_limit = wait_time_limit
-        self._wait_time_increment = 0
-
-    async def fetch_tickers(self, symbols=None, params={}):
-        return self.tickers
-
-    async def fetch_ticker(self, symbol, params={}):
-        return self.tickers[symbol]
-
-    async def load_markets(self, reload=False):
-        return self.markets
-
-    async def fetch_balance(self):
-        return self.balances
-
-    async def create_limit_buy_order(self, symbol, *args):
-        base, quote = symbol.split('/')
-        volume = min(self.balances['free'][quote], args[0] * args[1])
-
-        self.balances['free'][quote] -= volume * args[1]
-        if base in self.balances['free']:
-            self.balances['free'][base] += volume
-        else:
-            self.balances['free'][base] = volume
-
-        return {'id': 0}
-
-    async def create_limit_sell_order(self, symbol, *args):
-        base, quote = symbol.split('/')
-        volume = min(args[0], self.balances['free'][base])
-
-        self.balances['free'][base] -= volume
-        if quote in self.balances['free']:
-            self.balances['free'][quote] += volume * args[1]
-        else:
-            self.balances['free'][quote] = volume * args[1]
-
-        return {'id': 0}
-
-    async def fetch_order(self, id, symbol=None, params={}):
-        await asyncio.sleep(self.wait_time)
-        if self._wait_time_increment >= self.wait_time_limit:
-            self._wait_time_increment = 0
-            return {'status': 'closed'}
-
-        self._wait_time_increment += 1
-        return {'status': 'open'}
-
-    async def cancel_order(self, id, symbol=None, params={}):
-        raise ValueError('cancel_order not implemented')
-
-    async def close(self, *args):
-        return
+import os
+import tempfile
+import time
 
 
 class TestWriteGraph(TestCase):
@@ -135,3 +60,269 @@ class TestSingleExchange(TestCase):
             self.assertEqual(graph[quote][base]['depth'], -math.log(quote_data['askVolume'] * quote_data['ask']))
 
             self.assertEqual(symbol, graph[base][quote]['market_name'])
+
+
+class TestExchangeGraph(TestCase):
+
+    def setUp(self):
+        self.tickers = {
+            'BTC/USD': {'bid': 5995, 'ask': 6000, 'bidVolume': 0.5, 'askVolume': 0.9},
+            'ETH/BTC': {'bid': 0.069, 'ask': 0.07, 'bidVolume': 0.5, 'askVolume': 21},
+            'ETH/USD': {'bid': 495, 'ask': 500, 'bidVolume': 30, 'askVolume': 0.9},
+        }
+        self.markets = {symbol: {'taker': 0.001} for symbol in self.tickers}
+        self.exchange = TestExchange(name='a', tickers=self.tickers, markets=self.markets)
+
+    def test_update_in_place(self):
+        exchange_graph = ExchangeGraph(self.exchange, name=False, depth=True)
+        changed = exchange_graph.update(self.tickers)
+        self.assertEqual(len(changed), 6)
+        self.assertEqual(exchange_graph.version, 1)
+        self.assertEqual(exchange_graph.consume_dirty_edges(), changed)
+        self.assertEqual(exchange_graph.dirty_edges, set())
+
+        graph = exchange_graph.graph
+        edge_data = graph['BTC']['USD']
+        # an update with no changed tickers changes nothing
+        self.assertEqual(exchange_graph.update(dict(self.tickers)), set())
+        self.assertEqual(exchange_graph.version, 1)
+
+        tickers = dict(self.tickers)
+        tickers['BTC/USD'] = {'bid': 5990, 'ask': 6000, 'bidVolume': 0.5, 'askVolume': 0.9}
+        self.assertEqual(exchange_graph.update(tickers), {('BTC', 'USD'), ('USD', 'BTC')})
+        self.assertEqual(exchange_graph.version, 2)
+        # the edge's data was updated rather than replaced
+        self.assertIs(graph['BTC']['USD'], edge_data)
+        self.assertEqual(graph['BTC']['USD']['weight'], -math.log(5990 * (1 - 0.001)))
+        self.assertEqual(graph['ETH']['BTC']['weight'], -math.log(0.069 * (1 - 0.001)))
+
+    def test_invalid_ticker_removes_market(self):
+        exchange_graph = ExchangeGraph(self.exchange, name=False)
+        exchange_graph.update(self.tickers)
+        exchange_graph.consume_dirty_edges()
+
+        exchange_graph.update({'ETH/USD': {'bid': None, 'ask': 500}})
+        self.assertFalse(exchange_graph.graph.has_edge('ETH', 'USD'))
+        self.assertFalse(exchange_graph.graph.has_edge('USD', 'ETH'))
+        self.assertEqual(exchange_graph.consume_dirty_edges(), {('ETH', 'USD'), ('USD', 'ETH')})
+
+    def test_refresh(self):
+        self.exchange.tickers = self.tickers
+        exchange_graph = ExchangeGraph(self.exchange, name=False)
+        changed = asyncio.get_event_loop().run_until_complete(exchange_graph.refresh())
+        self.assertEqual(len(changed), 6)
+        self.assertEqual(len(exchange_graph.graph), 3)
+
+        # a market which is missing from a complete set of tickers is removed
+        self.exchange.tickers = {market_name: ticker for market_name, ticker in self.tickers.items()
+                                 if market_name != 'ETH/BTC'}
+        changed = asyncio.get_event_loop().run_until_complete(exchange_graph.refresh())
+        self.assertEqual(changed, {('ETH', 'BTC'), ('BTC', 'ETH')})
+        self.assertEqual(exchange_graph.graph.number_of_edges(), 4)
+        self.assertEqual(exchange_graph.version, 2)
+        # but not from a partial update
+        self.assertEqual(exchange_graph.update({'BTC/USD': self.tickers['BTC/USD']}), set())
+        self.assertTrue(exchange_graph.graph.has_edge('ETH', 'USD'))
+
+
+class CountingExchange(TestExchange):
+    """
+    A TestExchange whose markets are only set by load_markets and which counts calls to load_markets and close.
+    """
+
+    def __init__(self, **kwargs):
+        markets = kwargs.pop('markets', {})
+        super(CountingExchange, self).__init__(**kwargs)
+        self._loadable_markets = markets
+        self.markets = None
+        self.load_count = 0
+        self.close_count = 0
+
+    async def load_markets(self, reload=False):
+        self.load_count += 1
+        await asyncio.sleep(0.01)
+        self.markets = self._loadable_markets
+        return self.markets
+
+    async def close(self, *args):
+        self.close_count += 1
+
+
+class TestExchangePool(TestCase):
+
+    def setUp(self):
+        self.tickers = {'BTC/USD': {'bid': 5995, 'ask': 6000}}
+        self.exchange = CountingExchange(name='a', tickers=self.tickers, markets={'BTC/USD': {'taker': 0.001}})
+        self.exchange.tickers = self.tickers
+        self.pool = ExchangePool([self.exchange])
+
+    def test_markets_loaded_once(self):
+        async def load_concurrently():
+            return await asyncio.gather(*[self.pool.load('a') for i in range(3)])
+
+        exchanges = asyncio.get_event_loop().run_until_complete(load_concurrently())
+        self.assertEqual(self.exchange.load_count, 1)
+        for exchange in exchanges:
+            self.assertIs(exchange, self.exchange)
+
+        asyncio.get_event_loop().run_until_complete(self.pool.load('a'))
+        self.assertEqual(self.exchange.load_count, 1)
+        asyncio.get_event_loop().run_until_complete(self.pool.load('a', reload=True))
+        self.assertEqual(self.exchange.load_count, 2)
+
+    def test_pooled_exchanges_not_closed(self):
+        fetcher = BulkTickerFetcher(['a'], pool=self.pool)
+        self.assertIs(fetcher.exchanges[0], self.exchange)
+        ticker_dicts = asyncio.get_event_loop().run_until_complete(fetcher.fetch_exchange_tickers())
+        self.assertEqual(ticker_dicts, {'a': self.tickers})
+        self.assertEqual(self.exchange.close_count, 0)
+
+        asyncio.get_event_loop().run_until_complete(self.pool.close())
+        self.assertEqual(self.exchange.close_count, 1)
+
+    def test_get_creates_exchange(self):
+        pool = ExchangePool(config={'timeout': 1000})
+        exchange = pool.get('binance')
+        self.assertIs(pool['binance'], exchange)
+        self.assertEqual(exchange.timeout, 1000)
+        self.assertIn('binance', pool)
+        asyncio.get_event_loop().run_until_complete(pool.close())
+
+
+class TestMetadataCache(TestCase):
+
+    def setUp(self):
+        self.markets = {'BTC/USD': {'id': 'BTCUSD', 'symbol': 'BTC/USD', 'base': 'BTC', 'quote': 'USD', 'spot': True,
+                                    'taker': 0.001, 'maker': 0.0005}}
+        self.cache_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.cache_dir.cleanup()
+
+    def run_until_complete(self, coroutine):
+        return asyncio.get_event_loop().run_until_complete(coroutine)
+
+    def test_cached_in_memory_and_on_disk(self):
+        exchange = CountingExchange(name='a', markets=self.markets)
+        cache = MetadataCache(cache_dir=self.cache_dir.name)
+        self.run_until_complete(cache.load_markets(exchange))
+        self.run_until_complete(cache.load_markets(exchange))
+        self.assertEqual(exchange.load_count, 1)
+        self.assertEqual(os.listdir(self.cache_dir.name), ['a_metadata.json'])
+
+        # a new cache (e.g. after a restart) reads the metadata from disk
+        other_exchange = CountingExchange(name='a', markets=self.markets)
+        self.run_until_complete(MetadataCache(cache_dir=self.cache_dir.name).load_markets(other_exchange))
+        self.assertEqual(other_exchange.load_count, 0)
+        self.assertEqual(other_exchange.symbols, ['BTC/USD'])
+        self.assertEqual(other_exchange.markets['BTC/USD']['taker'], 0.001)
+        self.assertIn('BTC', other_exchange.currencies)
+
+    def test_stale_metadata_refreshed_in_background(self):
+        exchange = CountingExchange(name='a', markets=self.markets)
+        cache = MetadataCache(ttl=0, cache_dir=None)
+        metadata = self.run_until_complete(cache.get(exchange))
+        self.assertEqual(exchange.load_count, 1)
+
+        async def get_then_wait():
+            stale = await cache.get(exchange)
+            # the refresh has been scheduled but has not completed
+            self.assertEqual(exchange.load_count, 1)
+            await asyncio.sleep(0.05)
+            return stale
+
+        self.assertIs(self.run_until_complete(get_then_wait()), metadata)
+        self.assertEqual(exchange.load_count, 2)
+
+    def test_stale_metadata_refreshed_first(self):
+        exchange = CountingExchange(name='a', markets=self.markets)
+        cache = MetadataCache(ttl=0, cache_dir=None, background_refresh=False)
+        self.run_until_complete(cache.get(exchange))
+        self.run_until_complete(cache.get(exchange))
+        self.assertEqual(exchange.load_count, 2)
+
+
+class RateLimitedExchange(TestExchange):
+    """
+    A TestExchange whose fetch_ticker raises DDoSProtection the first rate_limited_count times it is called.
+    """
+
+    def __init__(self, rate_limited_count=0, **kwargs):
+        super(RateLimitedExchange, self).__init__(**kwargs)
+        self.tickers = kwargs.get('tickers', {})
+        self.rate_limited_count = rate_limited_count
+        self.call_count = 0
+
+    async def fetch_ticker(self, symbol, params={}):
+        self.call_count += 1
+        if self.call_count <= self.rate_limited_count:
+            raise ccxt.DDoSProtection('rate limited')
+        return self.tickers[symbol]
+
+
+class TestRateLimiter(TestCase):
+
+    def test_token_bucket_rate(self):
+        bucket = TokenBucket(100)
+
+        async def acquire_many():
+            start = time.monotonic()
+            await asyncio.gather(*[bucket.acquire() for i in range(6)])
+            return time.monotonic() - start
+
+        # the first token is available immediately and the next five take 10 milliseconds each
+        self.assertGreaterEqual(asyncio.get_event_loop().run_until_complete(acquire_many()), 0.045)
+
+    def test_adaptive_backoff(self):
+        bucket = TokenBucket(100, min_rate=30)
+        bucket.penalize()
+        self.assertEqual(bucket.rate, 50)
+        self.assertGreater(bucket.paused_until, time.monotonic())
+        bucket.penalize()
+        self.assertEqual(bucket.rate, 30)
+        for i in range(100):
+            bucket.reward()
+        self.assertEqual(bucket.rate, 100)
+
+    def test_rate_from_exchange(self):
+        exchange = RateLimitedExchange(rate_limited_count=1, name='a', tickers={'BTC/USD': {'bid': 1, 'ask': 2}})
+        exchange.rateLimit = 20
+        limiter = RateLimiter()
+        self.assertEqual(limiter.bucket(exchange).rate, 50)
+
+        with self.assertRaises(ccxt.DDoSProtection):
+            asyncio.get_event_loop().run_until_complete(limiter.call(exchange, 'fetch_ticker', 'BTC/USD'))
+        self.assertEqual(limiter.bucket(exchange).rate, 25)
+        ticker = asyncio.get_event_loop().run_until_complete(limiter.call(exchange, 'fetch_ticker', 'BTC/USD'))
+        self.assertEqual(ticker['bid'], 1)
+
+
+class TestWeightedMultiExchangeDigraph(TestCase):
+
+    def setUp(self):
+        tickers = {'BTC/USD': {'bid': 6000, 'ask': 6010}, 'ETH/BTC': {'bid': 0.03, 'ask': 0.031}}
+        self.bulk_exchange = TestExchange(name='a', tickers=tickers)
+        self.bulk_exchange.tickers = tickers
+        self.bulk_exchange.has = dict(self.bulk_exchange.has, fetchTickers=True)
+        self.single_exchange = RateLimitedExchange(name='b', tickers={'BTC/USD': {'bid': 5990, 'ask': 6000}})
+        self.single_exchange.has = dict(self.single_exchange.has, fetchTickers=False)
+        for exchange in self.bulk_exchange, self.single_exchange:
+            exchange.rateLimit = 1
+
+    def test_stream(self):
+        async def stream():
+            pool = ExchangePool([self.bulk_exchange, self.single_exchange])
+            return [exchange_id async for exchange_id, graph in
+                    stream_weighted_multi_exchange_digraph(['a', 'b'], log=True, pool=pool)]
+
+        self.assertEqual(sorted(asyncio.get_event_loop().run_until_complete(stream())), ['a', 'b'])
+        # a ticker was fetched per market from the exchange without fetch_tickers
+        self.assertEqual(self.single_exchange.call_count, 1)
+
+    def test_load(self):
+        graph = asyncio.get_event_loop().run_until_complete(
+            load_weighted_multi_exchange_digraph([self.bulk_exchange, self.single_exchange], name=False, log=True))
+        self.assertEqual(graph.number_of_edges(), 6)
+        self.assertEqual(graph.number_of_edges('BTC', 'USD'), 2)
+        self.assertEqual({data['exchange_name'] for data in graph['BTC']['USD'].values()}, {'a', 'b'})
+        self.assertAlmostEqual(graph['USD']['BTC'][0]['weight'], -math.log(1 / 6010))
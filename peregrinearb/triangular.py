@@ -0,0 +1,71 @@
+import logging
+import math
+import networkx as nx
+import numpy as np
+from .bellmannx import get_starting_volume
+from .utils.logging_utils import FormatForLogAdapter
+__all__ = [
+    'find_triangular_opportunities',
+]
+
+
+adapter = FormatForLogAdapter(logging.getLogger('peregrinearb.triangular'))
+
+
+def find_triangular_opportunities(graph: nx.DiGraph, top_n=None, depth=False):
+    """
+    Finds every profitable three-currency cycle in graph (as returned by load_exchange_graph) at once.
+
+    The edge weights are copied into a dense currency x currency matrix W in which missing markets have infinite
+    weight. For each currency i, the weights W[i, j] + W[j, k] + W[k, i] of all triangles starting with i are summed in
+    one broadcast NumPy operation over the rows and columns of the currencies which share a market with i. Each
+    triangle is reported once, starting with its currency which comes first in
+    graph's node order.
+
+    :param top_n: Optional. If given, only triangles among the top_n currencies with the most markets are considered.
+    Most arbitrage opportunities involve liquid currencies, and the dense matrix grows quadratically.
+    :param depth: If True, also returns the volume of each triangle's first currency which can be traded, as calculated
+    by get_starting_volume. The edges of graph must have the 'depth' attribute.
+    :return: A list of 2-tuples of each triangle (as a path which starts and ends with the same currency) and its
+    profit ratio, ordered from most to least profitable. If depth, a list of 3-tuples with the volume as the third
+    element.
+    """
+    currencies = list(graph)
+    if top_n is not None:
+        order = {currency: i for i, currency in enumerate(currencies)}
+        currencies = sorted(currencies, key=lambda currency: graph.degree(currency), reverse=True)[:top_n]
+        # keep graph's node order so that each triangle starts with the same currency as without top_n
+        currencies.sort(key=lambda currency: order[currency])
+    index = {currency: i for i, currency in enumerate(currencies)}
+    currency_count = len(currencies)
+
+    adapter.debug('Building log-rate matrix', currencyCount=currency_count)
+    weights = np.full((currency_count, currency_count), np.inf)
+    for u, v, weight in graph.edges(data='weight'):
+        if u in index and v in index:
+            weights[index[u], index[v]] = weight
+
+    triangles = []
+    if currency_count < 3:
+        return triangles
+
+    finite = np.isfinite(weights)
+    for i in range(currency_count - 2):
+        # in the triangle (i, j, k), i is the least index. only currencies which i can be traded for (j) and which can
+        # be traded for i (k) need to be summed.
+        js = np.flatnonzero(finite[i, i + 1:]) + i + 1
+        ks = np.flatnonzero(finite[i + 1:, i]) + i + 1
+        if len(js) == 0 or len(ks) == 0:
+            continue
+        # totals[a, b] == weights[i, js[a]] + weights[js[a], ks[b]] + weights[ks[b], i]
+        totals = weights[i, js][:, None] + weights[np.ix_(js, ks)] + weights[ks, i][None, :]
+        for a, b in zip(*np.nonzero(totals < 0)):
+            path = (currencies[i], currencies[js[a]], currencies[ks[b]], currencies[i])
+            triangles.append((float(totals[a, b]), path))
+
+    adapter.info('Found triangular opportunities', currencyCount=currency_count, opportunityCount=len(triangles))
+
+    triangles.sort(key=lambda triangle: triangle[0])
+    if depth:
+        return [(list(path), math.exp(-weight), get_starting_volume(graph, path)) for weight, path in triangles]
+    return [(list(path), math.exp(-weight)) for weight, path in triangles]
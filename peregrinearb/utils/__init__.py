@@ -1,9 +1,15 @@
 from .drawing import *
 from .general import *
 from .multi_exchange import create_multi_exchange_graph, create_weighted_multi_exchange_digraph, \
-    multi_graph_to_log_graph
-from .single_exchange import load_exchange_graph, create_exchange_graph, FeesNotAvailable
+    load_weighted_multi_exchange_digraph, stream_weighted_multi_exchange_digraph, multi_graph_to_log_graph, \
+    multi_digraph_from_tickers
+from .single_exchange import load_exchange_graph, create_exchange_graph, FeesNotAvailable, ExchangeGraph
 from .misc import last_index_in_list, next_to_each_other
 from .data_structures import StackSet, PrioritySet, Collections
 from .graph_utils import get_greatest_edge_in_bunch, get_least_edge_in_bunch
+from .compiled_graph import CompiledGraph, TradeType
+from .exchange_pool import ExchangePool
+from .metadata_cache import MetadataCache
+from .rate_limiter import RateLimiter, TokenBucket
+from .metrics import LatencyHistogram, Metrics, default_metrics
 from .wss_graph_builder import *
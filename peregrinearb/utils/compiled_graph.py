@@ -0,0 +1,368 @@
+import enum
+import numpy as np
+import networkx as nx
+
+__all__ = [
+    'CompiledGraph',
+    'TradeType',
+]
+
+
+class TradeType(enum.IntEnum):
+    SELL = 0
+    BUY = 1
+    TRANSFER = 2
+
+
+# the edge attributes stored as float64 arrays. other attributes besides market_name and trade_type are ignored.
+_FLOAT_ATTRIBUTES = ('weight', 'depth', 'fee', 'volume', 'no_fee_rate')
+
+
+class CompiledGraph:
+    __slots__ = ['graph', 'nodes', 'node_index', 'market_names', 'market_index', '_successors', '_edge_count',
+                 '_src', '_dst', '_market_id', '_trade_type', '_floats', '_segments_dirty', '_order',
+                 '_segment_starts', '_segment_targets', '_segment_ids', '_adjacency_order']
+
+    def __init__(self, graph: nx.DiGraph = None, capacity=16):
+        """
+        A weighted DiGraph whose edges are stored as a struct of contiguous NumPy arrays indexed by edge id instead of
+        as a dict per edge, so that edges can be relaxed in vectorized passes and memory per edge is small.
+
+        Nodes are given integer ids in the order in which they are added. Edge i goes from nodes[src[i]] to
+        nodes[dst[i]]. The weight, depth, fee, volume and no_fee_rate attributes are float64 arrays (NaN if an edge does
+        not have the attribute), market names are interned in self.market_names and trade types are stored as
+        TradeType values.
+
+        graph[u][v][attribute] reads (and assigns) an edge's attributes as with networkx, without building a dict, so
+        functions such as calculate_profit_ratio_for_path, get_starting_volume and wss_update_graph can be used with a
+        CompiledGraph directly. add_edge has the same signature as networkx's, so _add_weighted_edge_to_graph and
+        wss_add_market can populate one.
+
+        :param graph: Optional. A DiGraph to copy. Edges keep the order of graph.edges(), so ties are broken the same
+        way as when iterating over graph. Later changes to graph are not reflected in the CompiledGraph.
+        :param capacity: The number of edges for which to allocate space initially. Arrays double in size when full.
+        """
+        self.graph = {}
+        self.nodes = []
+        self.node_index = {}
+        self.market_names = []
+        self.market_index = {}
+        # for each node id, a dict keyed by the node ids of its successors and valued by the ids of the edges to them
+        self._successors = []
+        self._edge_count = 0
+
+        if graph is not None:
+            self.graph.update(graph.graph)
+            capacity = max(capacity, graph.number_of_edges())
+        self._src = np.empty(capacity, dtype=np.intp)
+        self._dst = np.empty(capacity, dtype=np.intp)
+        self._market_id = np.empty(capacity, dtype=np.int32)
+        self._trade_type = np.empty(capacity, dtype=np.int8)
+        self._floats = {attribute: np.empty(capacity, dtype=np.float64) for attribute in _FLOAT_ATTRIBUTES}
+        self._segments_dirty = True
+
+        if graph is not None:
+            for node in graph:
+                self.add_node(node)
+            for u, v, data in graph.edges(data=True):
+                self.add_edge(u, v, **data)
+
+    def __getstate__(self):
+        # a compact snapshot: the arrays are trimmed to the edges and the indexes are rebuilt when it is unpickled
+        return {'graph': self.graph, 'nodes': self.nodes, 'market_names': self.market_names, 'src': self.src,
+                'dst': self.dst, 'market_id': self.market_id, 'trade_type': self.trade_type,
+                'floats': {key: array[:self._edge_count] for key, array in self._floats.items()}}
+
+    def __setstate__(self, state):
+        self.graph = state['graph']
+        self.nodes = state['nodes']
+        self.node_index = {node: i for i, node in enumerate(self.nodes)}
+        self.market_names = state['market_names']
+        self.market_index = {market_name: i for i, market_name in enumerate(self.market_names)}
+        self._src = state['src']
+        self._dst = state['dst']
+        self._market_id = state['market_id']
+        self._trade_type = state['trade_type']
+        self._floats = state['floats']
+        self._edge_count = len(self._src)
+        self._successors = [{} for node in self.nodes]
+        for edge_id, (u_id, v_id) in enumerate(zip(self._src.tolist(), self._dst.tolist())):
+            self._successors[u_id][v_id] = edge_id
+        self._segments_dirty = True
+
+    def add_node(self, node):
+        if node not in self.node_index:
+            self.node_index[node] = len(self.nodes)
+            self.nodes.append(node)
+            self._successors.append({})
+        return self.node_index[node]
+
+    def add_edge(self, u, v, **attr):
+        """
+        Adds an edge from u to v or, if it exists, updates its attributes, as networkx's DiGraph.add_edge does.
+        Returns the edge's id.
+        """
+        u_id = self.add_node(u)
+        v_id = self.add_node(v)
+        edge_id = self._successors[u_id].get(v_id)
+        if edge_id is None:
+            edge_id = self._new_edge(u_id, v_id)
+        for key, value in attr.items():
+            self._set_attribute(edge_id, key, value)
+        return edge_id
+
+    def _new_edge(self, u_id, v_id):
+        if self._edge_count == len(self._src):
+            self._grow()
+        edge_id = self._edge_count
+        self._edge_count += 1
+
+        self._src[edge_id] = u_id
+        self._dst[edge_id] = v_id
+        self._market_id[edge_id] = -1
+        self._trade_type[edge_id] = -1
+        for array in self._floats.values():
+            array[edge_id] = np.nan
+        self._successors[u_id][v_id] = edge_id
+        self._segments_dirty = True
+        return edge_id
+
+    def _grow(self):
+        capacity = max(2 * len(self._src), 16)
+        for attribute in ('_src', '_dst', '_market_id', '_trade_type'):
+            array = getattr(self, attribute)
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, attribute, grown)
+        for key, array in self._floats.items():
+            grown = np.empty(capacity, dtype=np.float64)
+            grown[:len(array)] = array
+            self._floats[key] = grown
+
+    def _set_attribute(self, edge_id, key, value):
+        if key in self._floats:
+            self._floats[key][edge_id] = value
+        elif key == 'market_name':
+            if value not in self.market_index:
+                self.market_index[value] = len(self.market_names)
+                self.market_names.append(value)
+            self._market_id[edge_id] = self.market_index[value]
+        elif key == 'trade_type':
+            self._trade_type[edge_id] = TradeType[value] if isinstance(value, str) else TradeType(value)
+
+    def _get_attribute(self, edge_id, key):
+        if key in self._floats:
+            return float(self._floats[key][edge_id])
+        elif key == 'market_name':
+            market_id = self._market_id[edge_id]
+            return self.market_names[market_id] if market_id >= 0 else None
+        elif key == 'trade_type':
+            trade_type = self._trade_type[edge_id]
+            return TradeType(trade_type).name if trade_type >= 0 else None
+        raise KeyError(key)
+
+    def edge_id(self, u, v):
+        return self._successors[self.node_index[u]][self.node_index[v]]
+
+    def has_edge(self, u, v):
+        return u in self.node_index and v in self.node_index and \
+            self.node_index[v] in self._successors[self.node_index[u]]
+
+    def number_of_edges(self):
+        return self._edge_count
+
+    def __getitem__(self, u):
+        return _AdjacencyView(self, self.node_index[u])
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node):
+        return node in self.node_index
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    @property
+    def edge_count(self):
+        return self._edge_count
+
+    @property
+    def src(self):
+        return self._src[:self._edge_count]
+
+    @property
+    def dst(self):
+        return self._dst[:self._edge_count]
+
+    @property
+    def weight(self):
+        return self._floats['weight'][:self._edge_count]
+
+    @property
+    def depth(self):
+        return self._floats['depth'][:self._edge_count]
+
+    @property
+    def fee(self):
+        return self._floats['fee'][:self._edge_count]
+
+    @property
+    def volume(self):
+        return self._floats['volume'][:self._edge_count]
+
+    @property
+    def no_fee_rate(self):
+        return self._floats['no_fee_rate'][:self._edge_count]
+
+    @property
+    def market_id(self):
+        return self._market_id[:self._edge_count]
+
+    @property
+    def trade_type(self):
+        return self._trade_type[:self._edge_count]
+
+    def _build_segments(self):
+        """
+        Groups the edges by head node so that the minimum over each node's incoming edges can be taken with
+        np.minimum.reduceat. The sort is stable, so edges keep their relative order within each group.
+
+        Also orders the edges by tail node, as a DiGraph to which the same edges were added iterates over them.
+        """
+        self._adjacency_order = np.fromiter((edge_id for successors in self._successors
+                                             for edge_id in successors.values()), dtype=np.intp, count=self._edge_count)
+        self._order = np.argsort(self.dst, kind='stable')
+        sorted_dst = self.dst[self._order]
+        if len(sorted_dst) == 0:
+            self._segment_starts = np.empty(0, dtype=np.intp)
+        else:
+            self._segment_starts = np.flatnonzero(np.r_[True, sorted_dst[1:] != sorted_dst[:-1]])
+        self._segment_targets = sorted_dst[self._segment_starts]
+        self._segment_ids = np.repeat(np.arange(len(self._segment_starts)),
+                                      np.diff(np.r_[self._segment_starts, len(sorted_dst)]))
+        self._segments_dirty = False
+
+    def relax(self, distance, predecessor):
+        """
+        Relaxes every edge once against a copy of distance (a Jacobi-style pass) and updates distance and predecessor
+        in place. If several edges into a node give the same improved distance, the one which comes first in the
+        graph's edge order becomes its predecessor.
+
+        Returns the number of nodes whose distance was improved.
+        """
+        if self.edge_count == 0:
+            return 0
+        if self._segments_dirty:
+            self._build_segments()
+
+        candidate = distance[self.src[self._order]] + self.weight[self._order]
+        best = np.minimum.reduceat(candidate, self._segment_starts)
+        improved = best < distance[self._segment_targets]
+        improved_count = int(np.count_nonzero(improved))
+        if improved_count == 0:
+            return 0
+
+        # the first edge in each improved group whose candidate distance is the group's minimum
+        hits = np.flatnonzero((candidate == best[self._segment_ids]) & improved[self._segment_ids])
+        groups, first = np.unique(self._segment_ids[hits], return_index=True)
+        edges = self._order[hits[first]]
+
+        distance[self._segment_targets[groups]] = best[groups]
+        predecessor[self._segment_targets[groups]] = self.src[edges]
+        return improved_count
+
+    def relaxable_edges(self, distance):
+        """
+        Returns, in adjacency_order, the indices of the edges which could still be relaxed given distance.
+        """
+        order = self.adjacency_order()
+        return order[distance[self.src[order]] + self.weight[order] < distance[self.dst[order]]]
+
+    def adjacency_order(self):
+        """
+        Returns the ids of the edges in the order in which a DiGraph to which the same nodes and edges were added
+        iterates over them (grouped by tail node), which is the order in which NegativeWeightFinder relaxes them. For a
+        CompiledGraph of a DiGraph, this is the edge order.
+        """
+        if self._segments_dirty:
+            self._build_segments()
+        return self._adjacency_order
+
+    def relax_in_order(self, distance, predecessor, passes, early_exit=False):
+        """
+        Makes up to passes passes over the edges in adjacency_order, relaxing each edge against the distances as
+        updated by the edges before it (as NegativeWeightFinder does), and updates distance and predecessor in place.
+        This builds the same predecessors as NegativeWeightFinder, but is not vectorized.
+
+        If early_exit, stops after the first pass which does not improve any distance. Returns the number of passes.
+        """
+        order = self.adjacency_order()
+        edges = list(zip(self.src[order].tolist(), self.dst[order].tolist(), self.weight[order].tolist()))
+        distance_list = distance.tolist()
+        predecessor_list = predecessor.tolist()
+        for i in range(passes):
+            updated = False
+            for u, v, weight in edges:
+                if distance_list[u] + weight < distance_list[v]:
+                    distance_list[v] = distance_list[u] + weight
+                    predecessor_list[v] = u
+                    updated = True
+            if early_exit and not updated:
+                passes = i + 1
+                break
+        distance[:] = distance_list
+        predecessor[:] = predecessor_list
+        return passes
+
+
+class _AdjacencyView:
+    __slots__ = ['_compiled', '_node_id']
+
+    def __init__(self, compiled, node_id):
+        self._compiled = compiled
+        self._node_id = node_id
+
+    def __getitem__(self, v):
+        return _EdgeView(self._compiled, self._compiled._successors[self._node_id][self._compiled.node_index[v]])
+
+    def __contains__(self, v):
+        return v in self._compiled.node_index and \
+            self._compiled.node_index[v] in self._compiled._successors[self._node_id]
+
+    def __iter__(self):
+        return (self._compiled.nodes[v_id] for v_id in self._compiled._successors[self._node_id])
+
+    def __len__(self):
+        return len(self._compiled._successors[self._node_id])
+
+    def items(self):
+        return ((self._compiled.nodes[v_id], _EdgeView(self._compiled, edge_id))
+                for v_id, edge_id in self._compiled._successors[self._node_id].items())
+
+
+class _EdgeView:
+    __slots__ = ['_compiled', 'edge_id']
+
+    def __init__(self, compiled, edge_id):
+        self._compiled = compiled
+        self.edge_id = edge_id
+
+    def __getitem__(self, key):
+        return self._compiled._get_attribute(self.edge_id, key)
+
+    def __setitem__(self, key, value):
+        self._compiled._set_attribute(self.edge_id, key, value)
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        if value is None or value != value:
+            return default
+        return value
+
+    def update(self, data):
+        for key, value in data.items():
+            self[key] = value
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import ccxt.async_support as ccxt
+from .logging_utils import FormatForLogAdapter
+from .metrics import default_metrics
+
+__all__ = [
+    'ExchangePool',
+    'load_markets_with_retries',
+]
+
+adapter = FormatForLogAdapter(logging.getLogger('peregrinearb.utils.exchange_pool'))
+
+
+async def load_markets_with_retries(exchange: ccxt.Exchange, reload=False, retries=20):
+    """
+    Calls exchange.load_markets, retrying up to retries times if the exchange rate limits the request, times out or is
+    unavailable. Raises the last error if every attempt fails.
+    """
+    for i in range(retries):
+        try:
+            adapter.info('Loading markets', exchange=exchange.id, iteration=i)
+            with default_metrics.time('load_markets', exchange=exchange.id):
+                return await exchange.load_markets(reload)
+        except (ccxt.DDoSProtection, ccxt.RequestTimeout) as e:
+            if i == retries - 1:
+                adapter.warning('Rate limited on final iteration, raising error', exchange=exchange.id, iteration=i)
+                raise e
+            adapter.warning('Rate limited when loading markets', exchange=exchange.id, iteration=i)
+            await asyncio.sleep(0.1)
+        except ccxt.ExchangeNotAvailable as e:
+            if i == retries - 1:
+                adapter.warning('Cannot load markets due to ExchangeNotAvailable error', exchange=exchange.id,
+                                iteration=i)
+                raise e
+            adapter.warning('Received ExchangeNotAvailable error when loading markets', exchange=exchange.id,
+                            iteration=i)
+
+
+class ExchangePool:
+
+    def __init__(self, exchanges=None, config=None):
+        """
+        Owns one long-lived ccxt async Exchange object per exchange id. Exchanges are created when first requested and
+        their markets are loaded at most once, so that finders and builders which are given the same pool share HTTP
+        sessions (and their keep-alive connections) and do not download every exchange's markets again.
+
+        Classes and functions which accept a pool do not close its exchanges. Call close (or use the pool as an async
+        context manager) when finished with it.
+
+        :param exchanges: Optional. Ccxt Exchange objects to add to the pool, e.g. ones with API keys.
+        :param config: Optional. A dict passed to the constructor of each Exchange object the pool creates.
+        """
+        if config is None:
+            config = {}
+        self.config = config
+        self.exchanges = {}
+        self._locks = {}
+        if exchanges is not None:
+            for exchange in exchanges:
+                self.add(exchange)
+
+    def add(self, exchange: ccxt.Exchange):
+        """
+        Adds exchange to the pool, replacing any exchange already in the pool with the same id.
+        """
+        self.exchanges[exchange.id] = exchange
+
+    def get(self, exchange_id) -> ccxt.Exchange:
+        """
+        Returns the pool's Exchange object for exchange_id, creating it if necessary. Its markets may not be loaded.
+        """
+        if exchange_id not in self.exchanges:
+            adapter.debug('Creating exchange', exchange=exchange_id)
+            self.exchanges[exchange_id] = getattr(ccxt, exchange_id)(dict(self.config))
+        return self.exchanges[exchange_id]
+
+    async def load(self, exchange_id, reload=False, retries=20) -> ccxt.Exchange:
+        """
+        Returns the pool's Exchange object for exchange_id after loading its markets. Markets are only downloaded if
+        they have not been loaded (or if reload); concurrent calls for the same exchange wait for one download. The
+        download is tried up to retries times if the exchange rate limits it, times out or is unavailable. If it still
+        fails, the error is raised and markets will be loaded again on the next call.
+        """
+        exchange = self.get(exchange_id)
+        if exchange.markets and not reload:
+            return exchange
+
+        if exchange_id not in self._locks:
+            self._locks[exchange_id] = asyncio.Lock()
+        async with self._locks[exchange_id]:
+            # another task may have loaded the markets while this one was waiting
+            if not exchange.markets or reload:
+                await load_markets_with_retries(exchange, reload, retries)
+                adapter.info('Loaded markets', exchange=exchange_id)
+        return exchange
+
+    async def load_all(self, exchange_ids, ccxt_errors=True):
+        """
+        Loads the markets of each exchange in exchange_ids concurrently and returns a dict keyed by exchange id and
+        valued by Exchange object.
+
+        :param ccxt_errors: If true, raises the first error raised by ccxt. Otherwise, exchanges whose markets could
+        not be loaded are left out of the returned dict.
+        """
+        exchange_ids = list(exchange_ids)
+        results = await asyncio.gather(*[self.load(exchange_id) for exchange_id in exchange_ids],
+                                       return_exceptions=not ccxt_errors)
+        loaded = {}
+        for exchange_id, result in zip(exchange_ids, results):
+            if isinstance(result, ccxt.BaseError):
+                adapter.warning('Could not load markets', exchange=exchange_id, error=type(result).__name__)
+                continue
+            elif isinstance(result, BaseException):
+                raise result
+            loaded[exchange_id] = result
+        return loaded
+
+    async def close(self):
+        """
+        Closes the connections of every exchange in the pool. The pool can still be used afterwards; ccxt opens a new
+        session on the next request.
+        """
+        if self.exchanges:
+            adapter.debug('Closing connections', exchangeCount=len(self.exchanges))
+            await asyncio.gather(*[exchange.close() for exchange in self.exchanges.values()])
+
+    def __contains__(self, exchange_id):
+        return exchange_id in self.exchanges
+
+    def __getitem__(self, exchange_id):
+        return self.get(exchange_id)
+
+    def __len__(self):
+        return len(self.exchanges)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
@@ -1,7 +1,15 @@
+import atexit
+import copy
 import logging
+import logging.handlers
+import queue
+import threading
 __all__ = [
+    'BackgroundLogWriter',
     'FormatForLogAdapter',
+    'LogMessage',
     'format_for_log',
+    'log_in_background',
 ]
 
 
@@ -20,12 +28,132 @@ def format_for_log(msg, **kwargs):
     return result
 
 
+class LogMessage:
+    __slots__ = ['msg', 'kwargs', '_rendered']
+
+    def __init__(self, msg, kwargs):
+        """
+        A log message which is only formatted by format_for_log when a handler formats the record which holds it.
+        """
+        self.msg = msg
+        self.kwargs = kwargs
+        self._rendered = None
+
+    def __str__(self):
+        if self._rendered is None:
+            self._rendered = format_for_log(self.msg, **self.kwargs)
+        return self._rendered
+
+
 class FormatForLogAdapter(logging.LoggerAdapter):
 
-    def __init__(self, logger, extra=None):
+    def __init__(self, logger, extra=None, context=None):
+        """
+        Logs messages with keyword arguments, e.g. adapter.info('Loaded markets', exchange='binance'), as
+        format_for_log formats them. Nothing is done if the logger is not enabled for the level, and the message is
+        only formatted when a handler formats the record, so disabled log calls cost little more than the call itself.
+
+        :param context: Optional. A dict of keyword arguments included in every message, before those of the call.
+        """
         super().__init__(logger, extra or {})
+        self.context = context
 
     def log(self, level, msg, *args, exc_info=None, extra=None, stack_info=False, **kwargs):
         if self.isEnabledFor(level):
-            self.logger._log(level, format_for_log(msg, **kwargs), (), exc_info=exc_info, extra=extra,
+            if self.context:
+                kwargs = dict(self.context, **kwargs)
+            self.logger._log(level, LogMessage(msg, kwargs), (), exc_info=exc_info, extra=extra,
                              stack_info=stack_info)
+
+
+class _RenderingQueueHandler(logging.handlers.QueueHandler):
+
+    def prepare(self, record):
+        # the message is rendered on the logging thread, so that arguments which change afterwards are logged as they
+        # were, but formatting the record and writing it are left to the writer's thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_STOP = object()
+
+
+class BackgroundLogWriter:
+
+    def __init__(self, *handlers, batch_size=256):
+        """
+        Passes log records to handlers on a background thread, so that formatting and writing them (e.g. to a file or
+        a terminal) does not stall the event loop. Add self.handler to a logger and call start.
+
+        The thread takes up to batch_size waiting records at a time and flushes the handlers after each batch.
+
+        :param handlers: The logging.Handlers which format and write the records.
+        """
+        self.handlers = list(handlers)
+        self.batch_size = batch_size
+        self.queue = queue.SimpleQueue()
+        self.handler = _RenderingQueueHandler(self.queue)
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='peregrinearb-log-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """
+        Writes every record which has been logged, then stops the thread.
+        """
+        if self._thread is not None:
+            self.queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+            atexit.unregister(self.stop)
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is not _STOP:
+                    self._handle(record)
+            for handler in self.handlers:
+                handler.flush()
+            if _STOP in batch:
+                return
+
+    def _handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def log_in_background(logger=None, batch_size=256) -> BackgroundLogWriter:
+    """
+    Moves the handlers of logger (a Logger or a logger's name; by default the root logger) to a started
+    BackgroundLogWriter and returns it. Call its stop method to write the remaining records; it is called at exit.
+    """
+    if not isinstance(logger, logging.Logger):
+        logger = logging.getLogger(logger)
+    writer = BackgroundLogWriter(*logger.handlers, batch_size=batch_size)
+    for handler in writer.handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(writer.handler)
+    return writer.start()
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import ccxt.async_support as ccxt
+from .exchange_pool import load_markets_with_retries
+from .logging_utils import FormatForLogAdapter
+
+__all__ = [
+    'MetadataCache',
+]
+
+adapter = FormatForLogAdapter(logging.getLogger('peregrinearb.utils.metadata_cache'))
+
+
+def _without_info(structures):
+    """
+    Returns a copy of structures (a dict of ccxt market or currency structures) without the exchange's raw responses,
+    which are large and not used by this library.
+    """
+    if not structures:
+        return {}
+    return {key: {k: v for k, v in structure.items() if k != 'info'} for key, structure in structures.items()}
+
+
+class MetadataCache:
+
+    def __init__(self, ttl=3600, cache_dir=None, background_refresh=True, retries=20):
+        """
+        Caches each exchange's markets (and so its symbols and taker and maker fees) and currencies in memory and, if
+        cache_dir is given, on disk, so that exchanges' markets, which rarely change, do not have to be downloaded for
+        every graph or collection which is built.
+
+        Metadata is keyed by exchange id and stored as a dict with the keys 'markets', 'currencies', 'symbols' and
+        'timestamp'. load_markets sets an Exchange object's markets from the cache with ccxt's Exchange.set_markets, so
+        functions which read exchange.markets, exchange.symbols or exchange.currencies work as if load_markets had been
+        called.
+
+        :param ttl: The number of seconds for which metadata is fresh.
+        :param cache_dir: Optional. The directory in which metadata is written as {exchange id}_metadata.json. If None
+        (the default), metadata is only cached in memory.
+        :param background_refresh: If true, metadata older than ttl is returned and refreshed in a background task.
+        Otherwise, it is refreshed before being returned. Metadata which is not cached at all is always fetched first.
+        :param retries: The number of times to try loading an exchange's markets when it is rate limited, times out or
+        is unavailable.
+        """
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.background_refresh = background_refresh
+        self.retries = retries
+        self._metadata = {}
+        self._locks = {}
+        self._refresh_tasks = {}
+
+    async def get(self, exchange: ccxt.Exchange) -> dict:
+        """
+        Returns the metadata of exchange, from memory, from disk or (if neither is fresh, or if stale metadata is not
+        returned) from the exchange.
+        """
+        metadata = self._metadata.get(exchange.id)
+        if metadata is None:
+            metadata = self._read(exchange.id)
+            if metadata is not None:
+                self._metadata[exchange.id] = metadata
+
+        if metadata is not None and self.is_fresh(metadata):
+            return metadata
+        if metadata is not None and self.background_refresh:
+            if exchange.id not in self._refresh_tasks:
+                adapter.debug('Refreshing stale metadata in the background', exchange=exchange.id)
+                self._refresh_tasks[exchange.id] = asyncio.ensure_future(self._background_refresh(exchange))
+            return metadata
+        return await self.refresh(exchange)
+
+    async def load_markets(self, exchange: ccxt.Exchange) -> ccxt.Exchange:
+        """
+        Sets the markets and currencies of exchange from the cache (look at get) and returns exchange.
+        """
+        metadata = await self.get(exchange)
+        exchange.set_markets(metadata['markets'], metadata['currencies'] or None)
+        return exchange
+
+    async def refresh(self, exchange: ccxt.Exchange) -> dict:
+        """
+        Loads the markets of exchange from the exchange and caches them. Concurrent refreshes of the same exchange wait
+        for a single request.
+        """
+        if exchange.id not in self._locks:
+            self._locks[exchange.id] = asyncio.Lock()
+        requested_at = time.time()
+        async with self._locks[exchange.id]:
+            metadata = self._metadata.get(exchange.id)
+            # another task refreshed the metadata while this one was waiting
+            if metadata is not None and metadata['timestamp'] >= requested_at:
+                return metadata
+
+            await load_markets_with_retries(exchange, reload=True, retries=self.retries)
+            metadata = {
+                'markets': _without_info(exchange.markets),
+                'currencies': _without_info(exchange.currencies),
+                'symbols': list(exchange.symbols),
+                'timestamp': time.time(),
+            }
+            self._metadata[exchange.id] = metadata
+            self._write(exchange.id, metadata)
+        adapter.info('Refreshed metadata', exchange=exchange.id, marketCount=len(metadata['markets']))
+        return metadata
+
+    def is_fresh(self, metadata):
+        return time.time() - metadata['timestamp'] < self.ttl
+
+    def invalidate(self, exchange_id):
+        """
+        Removes the metadata of the exchange with id exchange_id from memory and from disk.
+        """
+        self._metadata.pop(exchange_id, None)
+        if self.cache_dir is not None and os.path.exists(self._path(exchange_id)):
+            os.remove(self._path(exchange_id))
+
+    async def close(self):
+        """
+        Cancels refreshes running in the background.
+        """
+        tasks = list(self._refresh_tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _background_refresh(self, exchange):
+        try:
+            await self.refresh(exchange)
+        except ccxt.BaseError as e:
+            adapter.warning('Could not refresh metadata, stale metadata will be used', exchange=exchange.id,
+                            error=type(e).__name__)
+        finally:
+            del self._refresh_tasks[exchange.id]
+
+    def _path(self, exchange_id):
+        return os.path.join(self.cache_dir, '{}_metadata.json'.format(exchange_id))
+
+    def _read(self, exchange_id):
+        if self.cache_dir is None:
+            return None
+        try:
+            with open(self._path(exchange_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write(self, exchange_id, metadata):
+        if self.cache_dir is None:
+            return
+        # replace the file atomically so that another process reading the cache never sees a partial file
+        path = self._path(exchange_id)
+        temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary_path, 'w') as outfile:
+            json.dump(metadata, outfile, default=str)
+        os.replace(temporary_path, path)
@@ -0,0 +1,249 @@
+import asyncio
+import collections
+import logging
+import math
+import os
+import time
+from .logging_utils import FormatForLogAdapter
+
+__all__ = [
+    'LatencyHistogram',
+    'Metrics',
+    'default_metrics',
+]
+
+adapter = FormatForLogAdapter(logging.getLogger('peregrinearb.utils.metrics'))
+
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class LatencyHistogram:
+
+    def __init__(self, lowest=1e-6, highest=3600, precision=0.01):
+        """
+        An HDR-style histogram of durations in seconds. Values are counted in logarithmic buckets, each spanning a
+        relative width of precision, so every quantile is accurate to within precision of the recorded value however
+        long the tail. Only buckets into which a value has been recorded are stored.
+
+        record takes no lock: it is meant to be called from the thread which runs the event loop.
+
+        :param lowest: Values at most lowest are counted in the first bucket.
+        :param highest: Values at least highest are counted in the last bucket.
+        :param precision: The relative width of each bucket.
+        """
+        if not 0 < lowest < highest:
+            raise ValueError('lowest must be positive and less than highest')
+        self.lowest = lowest
+        self.highest = highest
+        self.precision = precision
+        self._log_base = math.log1p(precision)
+        self._last_index = self._index(highest)
+        self.counts = collections.Counter()
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('Inf')
+        self.max = 0.0
+
+    def _index(self, value):
+        if value <= self.lowest:
+            return 0
+        return int(math.log(value / self.lowest) / self._log_base) + 1
+
+    def _upper_bound(self, index):
+        return self.lowest * math.exp(index * self._log_base)
+
+    def record(self, value):
+        """
+        Records a duration of value seconds.
+        """
+        self.counts[min(self._index(value), self._last_index)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else float('NaN')
+
+    def quantile(self, q):
+        """
+        Returns the value below which the fraction q of the recorded values lie (the upper bound of its bucket, or the
+        largest recorded value if that is less). Returns NaN if no value has been recorded.
+        """
+        if not self.count:
+            return float('NaN')
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._upper_bound(index), self.max)
+        return self.max
+
+    def merge(self, other: 'LatencyHistogram'):
+        """
+        Adds the values recorded in other, which must have the same lowest, highest and precision, to this histogram.
+        """
+        if (other.lowest, other.highest, other.precision) != (self.lowest, self.highest, self.precision):
+            raise ValueError('Histograms with different buckets cannot be merged.')
+        self.counts.update(other.counts)
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def reset(self):
+        self.counts = collections.Counter()
+        self.count = 0
+        self.sum = 0.0
+        self.min = float('Inf')
+        self.max = 0.0
+
+
+class _Timer:
+    __slots__ = ['histogram', 'start']
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.histogram is not None:
+            self.histogram.record(time.perf_counter() - self.start)
+
+
+class Metrics:
+
+    def __init__(self, enabled=True, prefix='peregrinearb', **histogram_kwargs):
+        """
+        Keeps a LatencyHistogram of the duration of each stage of a scan for each set of labels (such as exchange and
+        market), so that it can be seen which exchange or stage takes up a tick.
+
+        The stages recorded by this library (into default_metrics) are 'fetch_tickers', 'fetch_order_books' and
+        'load_markets' (labelled by exchange), 'fetch_order_book' (labelled by exchange and market), 'build_edges',
+        'relaxation' and 'retrace' (labelled by exchange, if the graph has an 'exchange_name').
+
+        :param enabled: If False, nothing is recorded.
+        :param prefix: The prefix of the name of the Prometheus metric.
+        :param histogram_kwargs: Keyword arguments passed to each LatencyHistogram.
+        """
+        self.enabled = enabled
+        self.prefix = prefix
+        self.histogram_kwargs = histogram_kwargs
+        self._histograms = {}
+
+    def histogram(self, stage, **labels) -> LatencyHistogram:
+        """
+        Returns the histogram of stage with labels, creating it if necessary. Labels valued by None are left out.
+        """
+        key = (stage, tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None)))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = LatencyHistogram(**self.histogram_kwargs)
+        return histogram
+
+    def record(self, stage, seconds, **labels):
+        if self.enabled:
+            self.histogram(stage, **labels).record(seconds)
+
+    def time(self, stage, **labels):
+        """
+        Returns a context manager which records the time spent in its body (including awaits) as a duration of stage.
+        """
+        return _Timer(self.histogram(stage, **labels) if self.enabled else None)
+
+    def histograms(self, stage=None):
+        """
+        Returns a dict keyed by 2-tuples of (stage, labels), where labels is a sorted tuple of (name, value) pairs, and
+        valued by histogram. If stage is given, only its histograms are returned.
+        """
+        return {key: histogram for key, histogram in self._histograms.items() if stage is None or key[0] == stage}
+
+    def summary(self, stage=None, quantiles=QUANTILES):
+        """
+        Returns a list of dicts, one per histogram (of stage, if given), with the keys 'stage', 'labels', 'count',
+        'sum', 'mean', 'max' and each quantile in quantiles, sorted by descending sum so that the stages which take the
+        most time are first.
+        """
+        rows = []
+        for (key_stage, labels), histogram in self._histograms.items():
+            if stage is not None and key_stage != stage:
+                continue
+            row = {'stage': key_stage, 'labels': dict(labels), 'count': histogram.count, 'sum': histogram.sum,
+                   'mean': histogram.mean, 'max': histogram.max}
+            for q in quantiles:
+                row[q] = histogram.quantile(q)
+            rows.append(row)
+        return sorted(rows, key=lambda row: row['sum'], reverse=True)
+
+    def reset(self):
+        self._histograms = {}
+
+    def to_prometheus(self, quantiles=QUANTILES) -> str:
+        """
+        Returns every histogram in the Prometheus text exposition format, as a summary named
+        {prefix}_stage_seconds with a 'stage' label and each histogram's labels.
+        """
+        name = '{}_stage_seconds'.format(self.prefix)
+        lines = ['# HELP {} The duration of each stage of a scan.'.format(name), '# TYPE {} summary'.format(name)]
+        for (stage, labels), histogram in sorted(self._histograms.items()):
+            if not histogram.count:
+                continue
+            label_pairs = (('stage', stage),) + labels
+            for q in quantiles:
+                lines.append('{}{} {}'.format(name, _format_labels(label_pairs + (('quantile', str(q)),)),
+                                              _format_value(histogram.quantile(q))))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(label_pairs), _format_value(histogram.sum)))
+            lines.append('{}_count{} {}'.format(name, _format_labels(label_pairs), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """
+        Writes to_prometheus() to the file at path, replacing it atomically so that a reader (such as node_exporter's
+        textfile collector) never sees a partial file.
+        """
+        temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temporary_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(temporary_path, path)
+
+    async def serve_prometheus(self, host='127.0.0.1', port=9464) -> asyncio.AbstractServer:
+        """
+        Starts and returns an asyncio server which answers every HTTP request on host:port with to_prometheus(), so
+        that Prometheus can scrape it. Close the server when finished with it.
+        """
+        async def respond(reader, writer):
+            try:
+                # read the request line and headers, which are not used
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                body = self.to_prometheus().encode()
+                writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                             b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body)
+                await writer.drain()
+            finally:
+                writer.close()
+
+        server = await asyncio.start_server(respond, host, port)
+        adapter.info('Serving metrics', host=host, port=port)
+        return server
+
+
+def _format_labels(label_pairs):
+    return '{' + ','.join('{}="{}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                          for name, value in label_pairs) + '}'
+
+
+def _format_value(value):
+    if math.isnan(value):
+        return 'NaN'
+    return repr(float(value))
+
+
+default_metrics = Metrics()
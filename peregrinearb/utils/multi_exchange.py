@@ -2,13 +2,23 @@ import asyncio
 import math
 import networkx as nx
 from ccxt import async_support as ccxt
+import logging
 import warnings
+from .logging_utils import FormatForLogAdapter
+from .rate_limiter import RateLimiter
+from .single_exchange import load_exchange_markets
 __all__ = [
     'create_multi_exchange_graph',
     'create_weighted_multi_exchange_digraph',
+    'get_maker_fee',
+    'load_weighted_multi_exchange_digraph',
+    'stream_weighted_multi_exchange_digraph',
+    'multi_digraph_from_tickers',
     'multi_graph_to_log_graph',
 ]
 
+adapter = FormatForLogAdapter(logging.getLogger('peregrinearb.utils.multi_exchange'))
+
 
 def create_multi_exchange_graph(exchanges: list, digraph=False):
     """
@@ -44,72 +54,160 @@ def create_multi_exchange_graph(exchanges: list, digraph=False):
     return graph
 
 
-def create_weighted_multi_exchange_digraph(exchanges: list, name=True, log=False, fees=False, suppress=None):
-    """
-    Not optimized (in favor of readability). There is multiple iterations over exchanges.
+def create_weighted_multi_exchange_digraph(exchanges: list, name=True, log=False, fees=False, suppress=None,
+                                           metadata_cache=None):
     """
-    if suppress is None:
-        suppress = ['markets']
-
-    if name:
-        exchanges = [{'object': getattr(ccxt, exchange)()} for exchange in exchanges]
-    else:
-        exchanges = [{'object': exchange} for exchange in exchanges]
+    Runs load_weighted_multi_exchange_digraph in the event loop and returns the graph. Cannot be called from a running
+    event loop; await load_weighted_multi_exchange_digraph instead.
 
+    :param metadata_cache: Optional. A MetadataCache from which to read the exchanges' markets instead of loading them.
+    """
     try:
         loop = asyncio.get_event_loop()
     except RuntimeError:
         loop = asyncio.get_running_loop()
-    futures = [asyncio.ensure_future(exchange_dict['object'].load_markets()) for exchange_dict in exchanges]
-    loop.run_until_complete(asyncio.gather(*futures))
-
-    if fees:
-        for exchange_dict in exchanges:
-            if 'maker' in exchange_dict['object'].fees['trading']:
-                # we always take the maker side because arbitrage depends on filling orders
-                exchange_dict['fee'] = exchange_dict['object'].fees['trading']['maker']
-            else:
-                if 'fees' not in suppress:
-                    warnings.warn("The fees for {} have not yet been implemented into the library. "
-                                  "Values will be calculated using a 0.2% maker fee.".format(exchange_dict['object'].id))
-                exchange_dict['fee'] = 0.002
-    else:
-        # todo: is there a way to do this with list/ dict comprehension?
-        for exchange_dict in exchanges:
-            exchange_dict['fee'] = 0
+    return loop.run_until_complete(load_weighted_multi_exchange_digraph(exchanges, name=name, log=log, fees=fees,
+                                                                        suppress=suppress,
+                                                                        metadata_cache=metadata_cache))
+
 
+async def load_weighted_multi_exchange_digraph(exchanges: list, name=True, log=False, fees=False, suppress=None,
+                                               metadata_cache=None, pool=None, rate_limiter=None, ccxt_errors=True):
+    """
+    Returns a MultiDiGraph of the markets of each exchange in exchanges, each edge weighted by its market's bid or ask
+    (look at stream_weighted_multi_exchange_digraph).
+    """
     graph = nx.MultiDiGraph()
-    futures = [_add_exchange_to_multi_digraph(graph, exchange, log=log, suppress=suppress) for exchange in exchanges]
-    loop.run_until_complete(asyncio.gather(*futures))
+    async for _ in stream_weighted_multi_exchange_digraph(exchanges, name=name, log=log, fees=fees, suppress=suppress,
+                                                          metadata_cache=metadata_cache, pool=pool,
+                                                          rate_limiter=rate_limiter, ccxt_errors=ccxt_errors,
+                                                          graph=graph):
+        pass
     return graph
 
 
-async def _add_exchange_to_multi_digraph(graph: nx.MultiDiGraph, exchange, log=True, suppress=None):
-    tasks = [_add_market_to_multi_digraph(exchange, symbol, graph, log=log, suppress=suppress)
-             for symbol in exchange['object'].symbols]
-    await asyncio.wait(tasks)
-    await exchange['object'].close()
+async def stream_weighted_multi_exchange_digraph(exchanges: list, name=True, log=False, fees=False, suppress=None,
+                                                 metadata_cache=None, pool=None, rate_limiter=None, ccxt_errors=True,
+                                                 graph=None):
+    """
+    Fetches the tickers of every exchange in exchanges concurrently and adds each exchange's edges to graph as soon as
+    its tickers arrive, yielding a 2-tuple of (exchange id, graph) after each exchange is added.
 
+    Each exchange's tickers are fetched with a single fetch_tickers request if it supports one. Otherwise a ticker is
+    fetched per market, paced by rate_limiter so that the exchange's rate limit is not exceeded.
 
-# todo: refactor. there is a lot of code repetition here with single_exchange.py's _add_weighted_edge_to_graph
-# todo: write tests which prove market_name is always a ticker on exchange and exchange's load_markets has been called.
-# this will validate that all exceptions thrown by await exchange.fetch_ticker(market_name) are solely because of
-# ccxt's fetch_ticker
-async def _add_market_to_multi_digraph(exchange, market_name: str, graph: nx.DiGraph, log=True, suppress=None):
+    :param exchanges: A list of exchange ids, or of ccxt Exchange objects if not name
+    :param fees: If true, each edge's weight accounts for its exchange's maker fee.
+    :param metadata_cache: Optional. A MetadataCache from which to read the exchanges' markets instead of loading them.
+    :param pool: Optional. An ExchangePool from which to take the exchanges (given as ids). Their connections are not
+    closed. Otherwise the exchanges' connections are closed when the generator finishes.
+    :param rate_limiter: Optional. A RateLimiter through which the requests are made. If None, a new one is created.
+    :param ccxt_errors: If true, a ccxt error raised while loading an exchange is raised. Otherwise, the exchange is
+    left out of the graph.
+    :param graph: Optional. A MultiDiGraph to which to add the edges.
+    """
     if suppress is None:
-        raise ValueError("suppress cannot be None. Must be a list with possible values listed in docstring of"
-                         "create_weighted_multi_exchange_digraph. If this error shows, something likely went awry "
-                         "during execution.")
+        suppress = ['markets']
+    if rate_limiter is None:
+        rate_limiter = RateLimiter()
+    if graph is None:
+        graph = nx.MultiDiGraph()
+
+    if pool is not None:
+        exchanges = [pool.get(exchange) for exchange in exchanges]
+    elif name:
+        exchanges = [getattr(ccxt, exchange)() for exchange in exchanges]
 
+    async def load(exchange):
+        try:
+            await load_exchange_markets(exchange, pool, metadata_cache)
+            tickers = await _fetch_exchange_tickers(exchange, rate_limiter, suppress)
+        except ccxt.BaseError as e:
+            if ccxt_errors:
+                raise e
+            adapter.warning('Could not fetch tickers, exchange will not be included in the graph',
+                            exchange=exchange.id, error=type(e).__name__)
+            return exchange, None
+        return exchange, tickers
+
+    futures = [asyncio.ensure_future(load(exchange)) for exchange in exchanges]
     try:
-        ticker = await exchange['object'].fetch_ticker(market_name)
-    # any error is solely because of fetch_ticker
-    except:
-        if 'markets' not in suppress:
-            warning = 'Market {} is unavailable at this time.'.format(market_name)
-            warnings.warn(warning)
-        return
+        for future in asyncio.as_completed(futures):
+            exchange, tickers = await future
+            if tickers is None:
+                continue
+            fee = get_maker_fee(exchange, suppress) if fees else 0
+            multi_digraph_from_tickers({exchange.id: tickers}, fees={exchange.id: fee}, log=log, graph=graph)
+            adapter.info('Added exchange to graph', exchange=exchange.id, marketCount=len(tickers))
+            yield exchange.id, graph
+    finally:
+        for future in futures:
+            future.cancel()
+        await asyncio.gather(*futures, return_exceptions=True)
+        if pool is None:
+            await asyncio.gather(*[exchange.close() for exchange in exchanges])
+
+
+def multi_digraph_from_tickers(ticker_dicts, fees=None, log=True, graph=None):
+    """
+    Returns a MultiDiGraph with the same edges as create_weighted_multi_exchange_digraph, built from tickers which have
+    already been fetched.
+
+    :param ticker_dicts: A dict keyed by exchange id and valued by a dict of tickers as returned by fetch_tickers
+    :param fees: Optional. A dict keyed by exchange id and valued by the exchange's fee or by a dict keyed by market
+    name and valued by each market's fee. Exchanges (and markets) not in fees have no fee.
+    :param graph: Optional. A MultiDiGraph to which to add the edges.
+    """
+    if fees is None:
+        fees = {}
+    if graph is None:
+        graph = nx.MultiDiGraph()
+    for exchange_id, tickers in ticker_dicts.items():
+        fee = fees.get(exchange_id, 0)
+        for market_name, ticker in tickers.items():
+            market_fee = fee.get(market_name, 0) if isinstance(fee, dict) else fee
+            _add_ticker_to_multi_digraph(graph, exchange_id, market_fee, market_name, ticker, log=log)
+    return graph
+
+
+def get_maker_fee(exchange: ccxt.Exchange, suppress):
+    """
+    Returns the maker fee of exchange, or 0.2% (warning unless 'fees' is in suppress) if it is not known.
+    """
+    # ccxt sets the maker fee to None for exchanges whose fees it does not know
+    if exchange.fees['trading'].get('maker') is not None:
+        # we always take the maker side because arbitrage depends on filling orders
+        return exchange.fees['trading']['maker']
+    if 'fees' not in suppress:
+        warnings.warn("The fees for {} have not yet been implemented into the library. "
+                      "Values will be calculated using a 0.2% maker fee.".format(exchange.id))
+    return 0.002
+
+
+async def _fetch_exchange_tickers(exchange: ccxt.Exchange, rate_limiter: RateLimiter, suppress):
+    """
+    Returns the tickers of exchange's markets, fetched with fetch_tickers if exchange supports it and otherwise with a
+    rate-limited fetch_ticker per market. Markets whose tickers could not be fetched are left out.
+    """
+    if exchange.has.get('fetchTickers') is True:
+        return await rate_limiter.call(exchange, 'fetch_tickers')
+
+    symbols = list(exchange.symbols)
+    results = await asyncio.gather(*[rate_limiter.call(exchange, 'fetch_ticker', symbol) for symbol in symbols],
+                                   return_exceptions=True)
+    tickers = {}
+    for symbol, result in zip(symbols, results):
+        if isinstance(result, ccxt.BaseError):
+            if 'markets' not in suppress:
+                warnings.warn('Market {} is unavailable at this time.'.format(symbol))
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            tickers[symbol] = result
+    return tickers
+
 
+def _add_ticker_to_multi_digraph(graph: nx.MultiDiGraph, exchange_id, fee, market_name: str, ticker, log=True):
     try:
         ticker_ask = ticker['ask']
         ticker_bid = ticker['bid']
@@ -117,8 +215,8 @@ async def _add_market_to_multi_digraph(exchange, market_name: str, graph: nx.DiG
     except TypeError:
         return
 
-    # prevent math error when Bittrex (GEO/BTC) or other API gives 0 as ticker price
-    if ticker_ask == 0:
+    # prevent math error when Bittrex (GEO/BTC) or other API gives 0 (or None, in bulk tickers) as ticker price
+    if not ticker_ask or not ticker_bid:
         return
     try:
         base_currency, quote_currency = market_name.split('/')
@@ -126,27 +224,27 @@ async def _add_market_to_multi_digraph(exchange, market_name: str, graph: nx.DiG
     except ValueError:
         return
 
-    fee_scalar = 1 - exchange['fee']
+    fee_scalar = 1 - fee
 
     if log:
         graph.add_edge(base_currency, quote_currency,
                        market_name=market_name,
-                       exchange_name=exchange['object'].id,
+                       exchange_name=exchange_id,
                        weight=-math.log(fee_scalar * ticker_bid))
 
         graph.add_edge(quote_currency, base_currency,
                        market_name=market_name,
-                       exchange_name=exchange['object'].id,
+                       exchange_name=exchange_id,
                        weight=-math.log(fee_scalar * 1 / ticker_ask))
     else:
         graph.add_edge(base_currency, quote_currency,
                        market_name=market_name,
-                       exchange_name=exchange['object'].id,
+                       exchange_name=exchange_id,
                        weight=fee_scalar * ticker_bid)
 
         graph.add_edge(quote_currency, base_currency,
                        market_name=market_name,
-                       exchange_name=exchange['object'].id,
+                       exchange_name=exchange_id,
                        weight=fee_scalar * 1 / ticker_ask)
 
 
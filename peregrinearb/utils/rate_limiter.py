@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+import ccxt.async_support as ccxt
+from .logging_utils import FormatForLogAdapter
+from .metrics import default_metrics
+
+__all__ = [
+    'RateLimiter',
+    'TokenBucket',
+]
+
+adapter = FormatForLogAdapter(logging.getLogger('peregrinearb.utils.rate_limiter'))
+
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity=1, min_rate=None, backoff_factor=0.5, recovery=0.05):
+        """
+        An async token bucket which holds up to capacity tokens and gains rate tokens per second. Each request takes a
+        token; acquire waits (without blocking the event loop) until one is available. Waiting requests are served in
+        the order in which they called acquire.
+
+        The rate adapts to the server with additive-increase/ multiplicative-decrease: penalize multiplies the rate by
+        backoff_factor (to no less than min_rate) and pauses requests, and reward adds recovery * the initial rate back
+        until the initial rate is reached again.
+
+        :param rate: Tokens (requests) per second.
+        :param capacity: The largest burst of requests which can be made at once.
+        :param min_rate: The rate below which penalize does not reduce the rate. Defaults to rate / 16.
+        """
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = rate / 16 if min_rate is None else min_rate
+        self.backoff_factor = backoff_factor
+        self.recovery = recovery
+        self.tokens = capacity
+        self.paused_until = 0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+                await asyncio.sleep(wait)
+
+    def penalize(self, pause=None):
+        """
+        Call when the server signals that requests are too frequent. Reduces the rate and pauses requests for pause
+        seconds (or, if None, for the time in which one token is gained at the reduced rate).
+        """
+        self.rate = max(self.rate * self.backoff_factor, self.min_rate)
+        self.tokens = 0
+        if pause is None:
+            pause = 1 / self.rate
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+
+    def reward(self):
+        """
+        Call after a successful request.
+        """
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * self.recovery)
+
+
+class RateLimiter:
+
+    def __init__(self, capacity=1, default_rate_limit=1000, **bucket_kwargs):
+        """
+        Keeps a TokenBucket for each exchange, keyed by exchange id. Each bucket's rate is set from its exchange's
+        rateLimit (the minimum number of milliseconds between requests, as given by ccxt), so requests to an exchange
+        are dispatched as soon as the exchange allows them and requests to different exchanges do not wait for each
+        other.
+
+        :param capacity: The capacity of each bucket.
+        :param default_rate_limit: The rateLimit used for exchanges which do not specify one.
+        :param bucket_kwargs: Other keyword arguments passed to each TokenBucket.
+        """
+        self.capacity = capacity
+        self.default_rate_limit = default_rate_limit
+        self.bucket_kwargs = bucket_kwargs
+        self.buckets = {}
+
+    def bucket(self, exchange: ccxt.Exchange) -> TokenBucket:
+        if exchange.id not in self.buckets:
+            rate_limit = getattr(exchange, 'rateLimit', None) or self.default_rate_limit
+            self.buckets[exchange.id] = TokenBucket(1000 / rate_limit, self.capacity, **self.bucket_kwargs)
+        return self.buckets[exchange.id]
+
+    async def call(self, exchange: ccxt.Exchange, method: str, *args, **kwargs):
+        """
+        Waits for a token from exchange's bucket, then returns the result of exchange.method(*args, **kwargs). If it
+        raises DDoSProtection, exchange's bucket is penalized and the error is raised.
+
+        The duration of the request (not of the wait) is recorded in default_metrics as the stage method, labelled by
+        exchange and, for fetch_order_book and fetch_ticker, by market.
+        """
+        bucket = self.bucket(exchange)
+        await bucket.acquire()
+        market = args[0] if args and method in ('fetch_order_book', 'fetch_ticker') else None
+        try:
+            with default_metrics.time(method, exchange=exchange.id, market=market):
+                result = await getattr(exchange, method)(*args, **kwargs)
+        except ccxt.DDoSProtection:
+            bucket.penalize()
+            adapter.warning('Rate limited, reducing request rate', exchange=exchange.id, rate=bucket.rate)
+            raise
+        bucket.reward()
+        return result
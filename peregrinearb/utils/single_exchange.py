@@ -4,12 +4,21 @@ import networkx as nx
 import ccxt.async_support as ccxt
 import datetime
 import logging
+from ..depth import conversion_curve
+from .compiled_graph import CompiledGraph
+from .exchange_pool import load_markets_with_retries
 from .logging_utils import FormatForLogAdapter
+from .rate_limiter import RateLimiter
+from .metrics import default_metrics
 
 __all__ = [
+    'ExchangeGraph',
     'FeesNotAvailable',
     'create_exchange_graph',
+    'edges_from_ticker',
+    'get_taker_fee',
     'load_exchange_graph',
+    'load_exchange_markets',
 ]
 
 adapter = FormatForLogAdapter(logging.getLogger('peregrinearb.utils.single_exchange'))
@@ -38,28 +47,56 @@ def create_exchange_graph(exchange: ccxt.Exchange):
     return graph
 
 
-async def load_exchange_graph(exchange, name=True, fees=True, suppress=None, depth=False, tickers=None) -> nx.DiGraph:
+async def load_exchange_graph(exchange, name=True, fees=True, suppress=None, depth=False, tickers=None,
+                              compact=False, pool=None, metadata_cache=None, levels=None,
+                              order_books=None, rate_limiter=None) -> nx.DiGraph:
     """
     Returns a networkx DiGraph populated with the current ask and bid prices for each market in graph (represented by
     edges). If depth, also adds an attribute 'depth' to each edge which represents the current volume of orders
     available at the price represented by the 'weight' attribute of each edge.
+
+    If compact, returns a CompiledGraph instead, which stores the edges' attributes in arrays rather than in a dict per
+    edge. It can be passed directly to bellman_ford, calculate_profit_ratio_for_path and get_starting_volume.
+
+    If pool (an ExchangePool) is given, exchange must be an exchange id. The pool's Exchange object is used, its markets
+    are only loaded if they have not been already and its connection is not closed.
+
+    If metadata_cache (a MetadataCache) is given, fees are read from it rather than by loading exchange's markets.
+
+    If levels, the graph is built from order books (order_books, a dict keyed by market name and valued by order book,
+    or if None fetched from exchange) instead of tickers. Each edge is given a 'curve' attribute, the conversion curve
+    (look at conversion_curve) of the top levels levels of its side of the market's order book, from which
+    bellman_ford(graph, depth='curve') sizes opportunities. depth is then the total volume of those levels, and weight
+    and volume are those of the best level. Such graphs cannot be compact. If the exchange does not support
+    fetch_order_books, an order book is fetched per market through rate_limiter (a RateLimiter, by default a new one).
     """
     if suppress is None:
         suppress = ['markets']
+    if levels and compact:
+        raise ValueError('A graph built from order book levels cannot be compact.')
 
-    if name:
+    if pool is not None:
+        exchange = pool.get(exchange)
+    elif name:
         exchange = getattr(ccxt, exchange)()
 
-    if tickers is None:
+    if levels:
+        # the symbols are needed to fetch the order books
+        await load_exchange_markets(exchange, pool, metadata_cache)
+        if order_books is None:
+            order_books = await _fetch_order_books(exchange, levels, rate_limiter)
+        tickers = order_books
+    elif tickers is None:
         adapter.info('Fetching tickers')
-        tickers = await exchange.fetch_tickers()
+        with default_metrics.time('fetch_tickers', exchange=exchange.id):
+            tickers = await exchange.fetch_tickers()
         adapter.info('Fetched tickers')
 
     market_count = len(tickers)
     adapter.info('Loading exchange graph', marketCount=market_count)
 
     adapter.debug('Initializing empty graph with exchange_name and timestamp attributes')
-    graph = nx.DiGraph()
+    graph = CompiledGraph(capacity=2 * market_count) if compact else nx.DiGraph()
 
     # todo: get exchange's server time?
     graph.graph['exchange_name'] = exchange.id
@@ -67,33 +104,23 @@ async def load_exchange_graph(exchange, name=True, fees=True, suppress=None, dep
     adapter.debug('Initialized empty graph with exchange_name and timestamp attributes')
 
     async def add_edges():
-        tasks = [_add_weighted_edge_to_graph(exchange, market_name, graph, log=True, fees=fees,
-                                             suppress=suppress, ticker=ticker, depth=depth, )
-                 for market_name, ticker in tickers.items()]
-        await asyncio.wait(tasks)
+        with default_metrics.time('build_edges', exchange=exchange.id):
+            if levels:
+                for market_name, order_book in order_books.items():
+                    fee = get_taker_fee(exchange, market_name, fees, suppress)
+                    for u, v, data in _edges_from_order_book(market_name, order_book, fee, levels, suppress) or []:
+                        graph.add_edge(u, v, **data)
+                return
+            tasks = [_add_weighted_edge_to_graph(exchange, market_name, graph, log=True, fees=fees,
+                                                 suppress=suppress, ticker=ticker, depth=depth, )
+                     for market_name, ticker in tickers.items()]
+            await asyncio.gather(*tasks)
 
     if fees:
-        for i in range(20):
-            try:
-                adapter.info('Loading fees', iteration=i)
-                # must load markets to get fees
-                await exchange.load_markets()
-            except (ccxt.DDoSProtection, ccxt.RequestTimeout) as e:
-                if i == 19:
-                    adapter.warning('Rate limited on final iteration, raising error', iteration=i)
-                    raise e
-                adapter.warning('Rate limited when loading markets', iteration=i)
-                await asyncio.sleep(0.1)
-            except ccxt.ExchangeNotAvailable as e:
-                if i == 19:
-                    adapter.warning('Cannot load markets due to ExchangeNotAvailable error, '
-                                    'graph will not be loaded.', iteration=i)
-                    raise e
-                adapter.warning('Received ExchangeNotAvailable error when loading markets', iteration=i)
-            else:
-                break
-
-        adapter.info('Loaded fees', iteration=i, marketCount=market_count)
+        adapter.info('Loading fees')
+        # must load markets to get fees
+        await load_exchange_markets(exchange, pool, metadata_cache)
+        adapter.info('Loaded fees', marketCount=market_count)
 
         currency_count = len(exchange.currencies)
         adapter.info('Adding data to graph', marketCount=market_count, currencyCount=currency_count)
@@ -104,14 +131,181 @@ async def load_exchange_graph(exchange, name=True, fees=True, suppress=None, dep
         await add_edges()
         adapter.info('Added data to graph', marketCount=market_count)
 
-    adapter.debug('Closing connection')
-    await exchange.close()
-    adapter.debug('Closed connection')
+    if pool is None:
+        adapter.debug('Closing connection')
+        await exchange.close()
+        adapter.debug('Closed connection')
 
     adapter.info('Loaded exchange graph')
     return graph
 
 
+async def load_exchange_markets(exchange, pool=None, metadata_cache=None):
+    """
+    Loads the markets of exchange through metadata_cache if given, else through pool if given, else directly (with
+    retries) if they have not yet been loaded.
+    """
+    if metadata_cache is not None:
+        await metadata_cache.load_markets(exchange)
+    elif pool is not None:
+        await pool.load(exchange.id)
+    elif not exchange.markets:
+        await load_markets_with_retries(exchange)
+
+
+async def _fetch_order_books(exchange: ccxt.Exchange, levels, rate_limiter: RateLimiter = None):
+    """
+    Returns a dict keyed by market name and valued by the order book of each of exchange's markets, with one request if
+    the exchange supports fetch_order_books and otherwise with a fetch_order_book per market through rate_limiter (by
+    default a new RateLimiter). Markets whose order books could not be fetched are left out.
+    """
+    if rate_limiter is None:
+        rate_limiter = RateLimiter()
+    adapter.info('Fetching order books', exchange=exchange.id)
+    if exchange.has.get('fetchOrderBooks') is True:
+        order_books = await rate_limiter.call(exchange, 'fetch_order_books')
+    else:
+        symbols = list(exchange.symbols)
+        results = await asyncio.gather(*[rate_limiter.call(exchange, 'fetch_order_book', symbol) for symbol in symbols],
+                                       return_exceptions=True)
+        order_books = {}
+        for symbol, result in zip(symbols, results):
+            if isinstance(result, ccxt.BaseError):
+                adapter.warning('Could not fetch order book. It will not be included in the graph.', market=symbol,
+                                error=type(result).__name__)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                order_books[symbol] = result
+    adapter.info('Fetched order books', exchange=exchange.id, marketCount=len(order_books))
+    return {market_name: {'bids': order_book['bids'][:levels], 'asks': order_book['asks'][:levels]}
+            for market_name, order_book in order_books.items()}
+
+
+class ExchangeGraph:
+
+    def __init__(self, exchange, name=True, fees=True, suppress=None, depth=False, log=True):
+        """
+        A long-lived graph of one exchange's markets. Instead of building a new DiGraph for every set of tickers as
+        load_exchange_graph does, update changes the attributes of only the edges whose market's ticker changed, in
+        place.
+
+        Each call to update which changes the graph increments self.version. The edges it changed are added to
+        self.dirty_edges until they are taken with consume_dirty_edges, so that downstream finders (e.g.
+        IncrementalNegativeWeightFinder.update_edge) only need to consider those edges.
+
+        If fees, exchange.load_markets() must have been called before update is called (refresh does so).
+
+        :param exchange: A ccxt Exchange object or, if name, the id of one
+        """
+        if suppress is None:
+            suppress = ['markets']
+        if name:
+            exchange = getattr(ccxt, exchange)()
+
+        self.exchange = exchange
+        self.fees = fees
+        self.suppress = suppress
+        self.depth = depth
+        self.log = log
+
+        self.graph = nx.DiGraph()
+        self.graph.graph['exchange_name'] = exchange.id
+        self.graph.graph['datetime'] = None
+        self.version = 0
+        self.dirty_edges = set()
+        # the prices (and volumes, if depth) from which each market's edges were last computed
+        self._quotes = {}
+
+    async def refresh(self):
+        """
+        Fetches the exchange's tickers and updates the graph with them. Markets which are no longer in the tickers are
+        removed. Returns the edges which changed.
+        """
+        if self.fees and not self.exchange.markets:
+            adapter.info('Loading fees', exchange=self.exchange.id)
+            await load_markets_with_retries(self.exchange)
+        adapter.info('Fetching tickers', exchange=self.exchange.id)
+        with default_metrics.time('fetch_tickers', exchange=self.exchange.id):
+            tickers = await self.exchange.fetch_tickers()
+        adapter.info('Fetched tickers', exchange=self.exchange.id)
+        return self.update(tickers, complete=True)
+
+    def update(self, tickers: dict, complete=False):
+        """
+        Updates the graph with tickers, a dict as returned by ccxt's Exchange's fetch_tickers. Markets whose prices (and
+        volumes, if self.depth) have not changed since the last update are skipped. A market whose ticker is no longer
+        valid is removed from the graph.
+
+        :param complete: If True, tickers has the ticker of every market on the exchange (e.g. all of fetch_tickers),
+        so markets in the graph which are not in tickers (e.g. because they were delisted) are removed.
+        :return: A set of the (tail node, head node) tuples of the edges which were added, changed, or removed.
+        """
+        changed = set()
+        if complete:
+            for market_name in [market_name for market_name in self._quotes if market_name not in tickers]:
+                del self._quotes[market_name]
+                changed.update(self._remove_market(market_name))
+
+        for market_name, ticker in tickers.items():
+            quote = self._quote(ticker)
+            if market_name in self._quotes and self._quotes[market_name] == quote:
+                continue
+
+            fee = get_taker_fee(self.exchange, market_name, self.fees, self.suppress)
+            edges = edges_from_ticker(market_name, ticker, fee, log=self.log, suppress=self.suppress,
+                                       depth=self.depth)
+            if edges is None:
+                if market_name in self._quotes:
+                    del self._quotes[market_name]
+                    changed.update(self._remove_market(market_name))
+                continue
+
+            self._quotes[market_name] = quote
+            for base_currency, quote_currency, data in edges:
+                if self.graph.has_edge(base_currency, quote_currency):
+                    self.graph[base_currency][quote_currency].update(data)
+                else:
+                    self.graph.add_edge(base_currency, quote_currency, **data)
+                changed.add((base_currency, quote_currency))
+
+        if changed:
+            self.version += 1
+            self.graph.graph['datetime'] = datetime.datetime.now(tz=datetime.timezone.utc)
+            self.dirty_edges.update(changed)
+        adapter.debug('Updated exchange graph', exchange=self.exchange.id, version=self.version,
+                      edgeCount=len(changed))
+        return changed
+
+    def consume_dirty_edges(self):
+        """
+        Returns the edges changed since the last call to this method and clears self.dirty_edges.
+        """
+        dirty_edges = self.dirty_edges
+        self.dirty_edges = set()
+        return dirty_edges
+
+    async def close(self):
+        await self.exchange.close()
+
+    def _quote(self, ticker):
+        try:
+            if self.depth:
+                return ticker['bid'], ticker['ask'], ticker['bidVolume'], ticker['askVolume']
+            return ticker['bid'], ticker['ask']
+        except TypeError:
+            return None
+
+    def _remove_market(self, market_name):
+        base_currency, quote_currency = market_name.split('/')
+        removed = set()
+        for u, v in ((base_currency, quote_currency), (quote_currency, base_currency)):
+            if self.graph.has_edge(u, v):
+                self.graph.remove_edge(u, v)
+                removed.add((u, v))
+        return removed
+
+
 async def _add_weighted_edge_to_graph(exchange: ccxt.Exchange, market_name: str, graph: nx.DiGraph, log=True,
                                       fees=False, suppress=None, ticker=None, depth=False, ):
     """
@@ -143,23 +337,79 @@ async def _add_weighted_edge_to_graph(exchange: ccxt.Exchange, market_name: str,
                                 market=market_name)
             return
 
-    if fees:
-        if 'taker' in exchange.markets[market_name]:
-            # we always take the taker side because arbitrage depends on filling orders
-            # sell_fee_dict = exchange.calculate_fee(market_name, 'limit', 'sell', 0, 0, 'taker')
-            # buy_fee_dict = exchange.calculate_fee(market_name, 'limit', 'buy', 0, 0, 'taker')
-            fee = exchange.markets[market_name]['taker']
-        else:
-            if 'fees' not in suppress:
-                adapter.warning("The fees for {} have not yet been implemented into ccxt's uniform API."
-                                .format(exchange))
-                raise FeesNotAvailable('Fees are not available for {} on {}'.format(market_name, exchange.id))
-            else:
-                fee = 0.002
-    else:
-        fee = 0
+    fee = get_taker_fee(exchange, market_name, fees, suppress)
+    edges = edges_from_ticker(market_name, ticker, fee, log=log, suppress=suppress, depth=depth)
+    if edges is None:
+        return
+
+    for base_currency, quote_currency, data in edges:
+        graph.add_edge(base_currency, quote_currency, **data)
+
+    adapter.debug('Added edge to graph', market=market_name)
+
+
+def get_taker_fee(exchange: ccxt.Exchange, market_name: str, fees=True, suppress=None):
+    """
+    Returns the taker fee of the market named market_name on exchange, whose markets must have been loaded, or 0 if
+    not fees. If the fee is not known, raises FeesNotAvailable unless 'fees' is in suppress, in which case 0.2% is
+    returned.
+    """
+    if not fees:
+        return 0
+
+    if 'taker' in exchange.markets[market_name]:
+        # we always take the taker side because arbitrage depends on filling orders
+        # sell_fee_dict = exchange.calculate_fee(market_name, 'limit', 'sell', 0, 0, 'taker')
+        # buy_fee_dict = exchange.calculate_fee(market_name, 'limit', 'buy', 0, 0, 'taker')
+        return exchange.markets[market_name]['taker']
+
+    if 'fees' not in suppress:
+        adapter.warning("The fees for {} have not yet been implemented into ccxt's uniform API."
+                        .format(exchange))
+        raise FeesNotAvailable('Fees are not available for {} on {}'.format(market_name, exchange.id))
+    return 0.002
+
+
+def _edges_from_order_book(market_name: str, order_book: dict, fee, levels=None, suppress=None):
+    """
+    Returns a list of the two log-weighted edges which represent the market named market_name, each as a 3-tuple of
+    (tail node, head node, edge data dict) whose data includes the 'curve' of the top levels levels of its side of
+    order_book. Returns None if either side of order_book is empty or market_name is not formatted as base/quote.
+    """
+    bids = order_book['bids'][:levels]
+    asks = order_book['asks'][:levels]
+    if not bids or not asks or not bids[0][1] or not asks[0][1]:
+        adapter.warning('Market is unavailable at this time. It will not be included in the graph.',
+                        market=market_name)
+        return None
+    try:
+        base_currency, quote_currency = market_name.split('/')
+    # if ccxt returns a market in incorrect format (e.g FX_BTC_JPY on BitFlyer)
+    except ValueError:
+        if 'markets' not in suppress:
+            adapter.warning('Market is unavailable at this time due to incorrect formatting. '
+                            'It will not be included in the graph.', market=market_name)
+        return None
 
     fee_scalar = 1 - fee
+    bid_rate, bid_volume = bids[0][0], bids[0][1]
+    ask_rate, ask_volume = asks[0][0], asks[0][1]
+    sell_curve = conversion_curve(bids, 'SELL', fee)
+    buy_curve = conversion_curve(asks, 'BUY', fee)
+    sell_data = dict(weight=-math.log(fee_scalar * bid_rate), depth=-math.log(sell_curve[0][-1]), curve=sell_curve,
+                     market_name=market_name, trade_type='SELL', fee=fee, volume=bid_volume, no_fee_rate=bid_rate)
+    buy_data = dict(weight=-math.log(fee_scalar * 1 / ask_rate), depth=-math.log(buy_curve[0][-1]), curve=buy_curve,
+                    market_name=market_name, trade_type='BUY', fee=fee, volume=ask_volume, no_fee_rate=ask_rate)
+    return [(base_currency, quote_currency, sell_data), (quote_currency, base_currency, buy_data)]
+
+
+def edges_from_ticker(market_name: str, ticker: dict, fee, log=True, suppress=None, depth=False, ):
+    """
+    Returns a list of the two edges which represent the market named market_name, each as a 3-tuple of
+    (tail node, head node, edge data dict). Returns None if ticker does not have valid prices (and volumes, if depth).
+    Look at the docstring of _add_weighted_edge_to_graph for an explanation of the parameters.
+    """
+    fee_scalar = 1 - fee
 
     try:
         bid_rate = ticker['bid']
@@ -170,16 +420,16 @@ async def _add_weighted_edge_to_graph(exchange: ccxt.Exchange, market_name: str,
             if bid_volume is None:
                 adapter.warning('Market is unavailable because its bid volume was given as None. '
                                 'It will not be included in the graph.', market=market_name)
-                return
+                return None
             if ask_volume is None:
                 adapter.warning('Market is unavailable because its ask volume was given as None. '
                                 'It will not be included in the graph.', market=market_name)
-                return
+                return None
     # ask and bid == None if this market is non existent.
     except TypeError:
         adapter.warning('Market is unavailable at this time. It will not be included in the graph.',
                         market=market_name)
-        return
+        return None
 
     # Exchanges give asks and bids as either 0 or None when they do not exist.
     # todo: should we account for exchanges upon which an ask exists but a bid does not (and vice versa)? Would this
@@ -187,7 +437,7 @@ async def _add_weighted_edge_to_graph(exchange: ccxt.Exchange, market_name: str,
     if ask_rate == 0 or bid_rate == 0 or ask_rate is None or bid_rate is None:
         adapter.warning('Market is unavailable at this time. It will not be included in the graph.',
                         market=market_name)
-        return
+        return None
     try:
         base_currency, quote_currency = market_name.split('/')
     # if ccxt returns a market in incorrect format (e.g FX_BTC_JPY on BitFlyer)
@@ -195,31 +445,31 @@ async def _add_weighted_edge_to_graph(exchange: ccxt.Exchange, market_name: str,
         if 'markets' not in suppress:
             adapter.warning('Market is unavailable at this time due to incorrect formatting. '
                             'It will not be included in the graph.', market=market_name)
-        return
+        return None
 
     if log:
         if depth:
-            graph.add_edge(base_currency, quote_currency, weight=-math.log(fee_scalar * bid_rate),
-                           depth=-math.log(bid_volume), market_name=market_name, trade_type='SELL',
-                           fee=fee, volume=bid_volume, no_fee_rate=bid_rate)
-            graph.add_edge(quote_currency, base_currency, weight=-math.log(fee_scalar * 1 / ask_rate),
-                           depth=-math.log(ask_volume * ask_rate), market_name=market_name, trade_type='BUY',
-                           fee=fee, volume=ask_volume, no_fee_rate=ask_rate)
+            sell_data = dict(weight=-math.log(fee_scalar * bid_rate), depth=-math.log(bid_volume),
+                             market_name=market_name, trade_type='SELL', fee=fee, volume=bid_volume,
+                             no_fee_rate=bid_rate)
+            buy_data = dict(weight=-math.log(fee_scalar * 1 / ask_rate), depth=-math.log(ask_volume * ask_rate),
+                            market_name=market_name, trade_type='BUY', fee=fee, volume=ask_volume,
+                            no_fee_rate=ask_rate)
         else:
-            graph.add_edge(base_currency, quote_currency, weight=-math.log(fee_scalar * bid_rate),
-                           market_name=market_name, trade_type='SELL', fee=fee, no_fee_rate=bid_rate)
-            graph.add_edge(quote_currency, base_currency, weight=-math.log(fee_scalar * 1 / ask_rate),
-                           market_name=market_name, trade_type='BUY', fee=fee, no_fee_rate=ask_rate)
+            sell_data = dict(weight=-math.log(fee_scalar * bid_rate), market_name=market_name, trade_type='SELL',
+                             fee=fee, no_fee_rate=bid_rate)
+            buy_data = dict(weight=-math.log(fee_scalar * 1 / ask_rate), market_name=market_name, trade_type='BUY',
+                            fee=fee, no_fee_rate=ask_rate)
     else:
         if depth:
-            graph.add_edge(base_currency, quote_currency, weight=fee_scalar * bid_rate, depth=bid_volume,
-                           market_name=market_name, trade_type='SELL', fee=fee, volume=bid_volume, no_fee_rate=bid_rate)
-            graph.add_edge(quote_currency, base_currency, weight=fee_scalar * 1 / ask_rate, depth=ask_volume,
-                           market_name=market_name, trade_type='BUY', fee=fee, volume=ask_volume, no_fee_rate=ask_rate)
+            sell_data = dict(weight=fee_scalar * bid_rate, depth=bid_volume, market_name=market_name,
+                             trade_type='SELL', fee=fee, volume=bid_volume, no_fee_rate=bid_rate)
+            buy_data = dict(weight=fee_scalar * 1 / ask_rate, depth=ask_volume, market_name=market_name,
+                            trade_type='BUY', fee=fee, volume=ask_volume, no_fee_rate=ask_rate)
         else:
-            graph.add_edge(base_currency, quote_currency, weight=fee_scalar * bid_rate,
-                           market_name=market_name, trade_type='SELL', fee=fee, no_fee_rate=bid_rate)
-            graph.add_edge(quote_currency, base_currency, weight=fee_scalar * 1 / ask_rate,
-                           market_name=market_name, trade_type='BUY', fee=fee, no_fee_rate=ask_rate)
+            sell_data = dict(weight=fee_scalar * bid_rate, market_name=market_name, trade_type='SELL', fee=fee,
+                             no_fee_rate=bid_rate)
+            buy_data = dict(weight=fee_scalar * 1 / ask_rate, market_name=market_name, trade_type='BUY', fee=fee,
+                            no_fee_rate=ask_rate)
 
-    adapter.debug('Added edge to graph', market=market_name)
+    return [(base_currency, quote_currency, sell_data), (quote_currency, base_currency, buy_data)]